@@ -0,0 +1,251 @@
+"""
+Benchmark every document operation the apps offer across corpus size tiers.
+
+Each operation runs on the synthetic documents from corpus.py with every
+cache cleared first, so it does its full work each time; the best of
+--repeat runs is kept. One more run per operation, in a fresh process,
+measures peak memory: the growth of the process's peak resident set,
+which includes what MuPDF allocates, and the Python heap peak from
+tracemalloc. Worker processes the operation starts (e.g. the render pool)
+are not counted.
+
+Results are written to --output as JSON. Given a --baseline written by an
+earlier run, an operation whose time or memory grew by more than
+--threshold is reported as a regression and the exit status is 1.
+
+    python benchmarks/bench_ops.py --tiers small medium --output baseline.json
+    python benchmarks/bench_ops.py --tiers small medium --baseline baseline.json
+    python benchmarks/bench_ops.py --tiers small --only merge_pdfs split_pdf
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import fitz  # PyMuPDF
+import PyPDF2
+
+try:
+    import resource
+except ImportError:
+    # Windows: only the Python heap is measured
+    resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus import TIERS, corpus_path, load_pdf  # noqa: E402
+from pdfeditor import ops  # noqa: E402
+from pdfeditor.cache import document_cache  # noqa: E402
+from pdfeditor.edits import (add_text_edit, apply_edits, compact_pdf, highlight_edit,  # noqa: E402
+                             highlight_terms_edit, redact_edit, replace_edit, replace_map_edit)
+from pdfeditor.render import render_pages, render_preview_pages, thumbnail_cache  # noqa: E402
+from pdfeditor.saving import compare_profiles  # noqa: E402
+from pdfeditor.terms import term  # noqa: E402
+from pdfeditor.textindex import get_text_index, text_index_cache  # noqa: E402
+
+# Growth below these is noise, whatever the percentage
+MIN_SECONDS = 0.02
+MIN_BYTES = 1024 * 1024
+
+METRICS = [("seconds", MIN_SECONDS), ("rss_peak_bytes", MIN_BYTES), ("python_peak_bytes", MIN_BYTES)]
+
+# name -> operation(pdf_bytes, spec, path, work_dir), called the way the apps call it
+OPERATIONS = {
+    # pdf.py
+    "extract_pages": lambda pdf, spec, path, work_dir: ops.extract_pages(pdf, range(0, spec.pages, 2)),
+    "reorder_pages": lambda pdf, spec, path, work_dir: ops.reorder_pages(pdf, range(spec.pages - 1, -1, -1)),
+    "rotate_pages": lambda pdf, spec, path, work_dir: ops.rotate_pages(pdf, {page: 90 for page in range(0, spec.pages, 2)}),
+    "split_pdf": lambda pdf, spec, path, work_dir: ops.split_pdf(pdf, [spec.pages // 4, spec.pages // 2]),
+    "merge_pdfs": lambda pdf, spec, path, work_dir: ops.merge_pdfs([pdf] * 4),
+    "merge_pdf_files": lambda pdf, spec, path, work_dir: ops.merge_pdf_files(
+        [path] * 4, os.path.join(work_dir, "merged.pdf")),
+    "merge_pdf_files_dedupe": lambda pdf, spec, path, work_dir: ops.merge_pdf_files(
+        [path] * 4, os.path.join(work_dir, "merged.pdf"), dedupe=True),
+    "add_watermark": lambda pdf, spec, path, work_dir: ops.add_watermark(pdf, "CONFIDENTIAL"),
+    "thumbnails": lambda pdf, spec, path, work_dir: render_pages(pdf, range(spec.pages), "thumbnail"),
+    # main.py and pdf2.py
+    "extract_pages_by_numbers": lambda pdf, spec, path, work_dir: ops.extract_pages_by_numbers(
+        pdf, range(1, spec.pages + 1, 2)),
+    "preview": lambda pdf, spec, path, work_dir: render_preview_pages(pdf, range(min(spec.pages, 4))),
+    "text_index": lambda pdf, spec, path, work_dir: get_text_index(pdf),
+    "highlight_text": lambda pdf, spec, path, work_dir: apply_edits(pdf, [highlight_edit("invoice", (1, 1, 0))]),
+    "highlight_terms": lambda pdf, spec, path, work_dir: apply_edits(pdf, [highlight_terms_edit(
+        [term("invoice", (1, 1, 0)), term("total", (0.6, 1, 0.6), whole_word=True)])]),
+    "replace_text": lambda pdf, spec, path, work_dir: apply_edits(pdf, [replace_edit("invoice", "receipt")]),
+    "replace_text_redact": lambda pdf, spec, path, work_dir: apply_edits(
+        pdf, [replace_edit("invoice", "receipt", redact=True)]),
+    "replace_map": lambda pdf, spec, path, work_dir: apply_edits(
+        pdf, [replace_map_edit([("invoice", "receipt"), ("total", "sum")])]),
+    "add_text": lambda pdf, spec, path, work_dir: apply_edits(pdf, [add_text_edit(1, "Approved", 72, 72, 12, (0, 0, 0))]),
+    "redact_area": lambda pdf, spec, path, work_dir: apply_edits(pdf, [redact_edit(1, 40, 40, 300, 120)]),
+    "compact_pdf": lambda pdf, spec, path, work_dir: compact_pdf(pdf),
+    "compare_profiles": lambda pdf, spec, path, work_dir: compare_profiles(pdf),
+}
+
+
+def clear_caches():
+    ops.result_cache.clear()
+    document_cache.clear()
+    thumbnail_cache.clear()
+    text_index_cache.clear()
+
+
+def reset_peak_rss():
+    """Restart the peak from the current resident set where the OS allows it (Linux)"""
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss():
+    """Peak resident set of this process in bytes, None where unknown"""
+    # Linux keeps ru_maxrss across exec, so a spawned process would start
+    # at its parent's peak; VmHWM is this process's own
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def time_operation(name, pdf_bytes, spec, path, work_dir, repeat):
+    operation = OPERATIONS[name]
+    times = []
+    for _ in range(repeat):
+        clear_caches()
+        start = time.perf_counter()
+        operation(pdf_bytes, spec, path, work_dir)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def measure_memory(name, spec, path):
+    """Run in a fresh process: (peak resident set growth, Python heap peak) of one run"""
+    with open(path, "rb") as pdf_file:
+        pdf_bytes = pdf_file.read()
+    operation = OPERATIONS[name]
+    with tempfile.TemporaryDirectory() as work_dir:
+        reset_peak_rss()
+        before = peak_rss()
+        operation(pdf_bytes, spec, path, work_dir)
+        after = peak_rss()
+        # tracemalloc's own bookkeeping would inflate the resident set, so it gets a run of its own
+        clear_caches()
+        tracemalloc.start()
+        operation(pdf_bytes, spec, path, work_dir)
+        python_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return (None if before is None else after - before), python_peak
+
+
+def memory_in_subprocess(name, spec, path):
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+        return executor.submit(measure_memory, name, spec, path).result()
+
+
+def environment():
+    return {"python": platform.python_version(), "pymupdf": fitz.VersionBind, "pypdf2": PyPDF2.__version__,
+            "platform": platform.platform(), "cpus": os.cpu_count()}
+
+
+def compare(results, baseline, threshold):
+    """[(tier, operation, metric, baseline value, new value)] for every regression"""
+    previous = {(result["tier"], result["operation"]): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        before = previous.get((result["tier"], result["operation"]))
+        if before is None:
+            continue
+        for metric, floor in METRICS:
+            old, new = before.get(metric), result.get(metric)
+            if old is None or new is None:
+                continue
+            if new > old * (1 + threshold) and new - old > floor:
+                regressions.append((result["tier"], result["operation"], metric, old, new))
+    return regressions
+
+
+def _change(result, previous, metric):
+    before = previous.get((result["tier"], result["operation"]))
+    if not before or not before.get(metric) or result.get(metric) is None:
+        return ""
+    return f"{(result[metric] / before[metric] - 1) * 100:+.0f}%"
+
+
+def _megabytes(value):
+    return "-" if value is None else f"{value / 1024 / 1024:.1f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tiers", nargs="+", choices=list(TIERS), default=["small", "medium"])
+    parser.add_argument("--only", nargs="+", choices=list(OPERATIONS), help="operations to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true", help="skip the memory runs")
+    parser.add_argument("--corpus-dir", help="keep generated documents here between runs")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="JSON from an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed growth, 0.2 = 20%%")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline["environment"] != environment():
+            print(f"note: baseline environment differs: {baseline['environment']}")
+    previous = {(result["tier"], result["operation"]): result for result in (baseline or {"results": []})["results"]}
+
+    names = args.only or list(OPERATIONS)
+    results = []
+    print(f"{'tier':<7} {'operation':<25} {'best s':>8} {'median s':>9} {'rss MB':>7} {'heap MB':>8} {'time':>6} {'rss':>6}")
+    with tempfile.TemporaryDirectory() as work_dir:
+        corpus_dir = args.corpus_dir or work_dir
+        for tier in args.tiers:
+            spec = TIERS[tier]
+            pdf_bytes = load_pdf(spec, corpus_dir)
+            path = corpus_path(corpus_dir, spec)
+            for name in names:
+                times = time_operation(name, pdf_bytes, spec, path, work_dir, args.repeat)
+                rss_peak, python_peak = (None, None) if args.no_memory else memory_in_subprocess(name, spec, path)
+                result = {"tier": tier, "operation": name, "seconds": round(min(times), 5),
+                          "median_seconds": round(statistics.median(times), 5), "runs": len(times),
+                          "rss_peak_bytes": rss_peak, "python_peak_bytes": python_peak}
+                results.append(result)
+                print(f"{tier:<7} {name:<25} {result['seconds']:>8.3f} {result['median_seconds']:>9.3f} "
+                      f"{_megabytes(rss_peak):>7} {_megabytes(python_peak):>8} "
+                      f"{_change(result, previous, 'seconds'):>6} {_change(result, previous, 'rss_peak_bytes'):>6}")
+    clear_caches()
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump({"environment": environment(), "tiers": {tier: TIERS[tier]._asdict() for tier in args.tiers},
+                       "results": results}, output_file, indent=2)
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        for tier, name, metric, old, new in regressions:
+            print(f"REGRESSION {tier} {name} {metric}: {old} -> {new} ({(new / old - 1) * 100:+.0f}%)")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Benchmark parallel page rendering against page count.
+
+Renders synthetic documents of increasing size once on a single process
+and once split across a process pool, with the thumbnail cache cleared
+before every run, and prints the speedup.
+
+    python benchmarks/bench_render.py --pages 50 200 1000 --workers 8
+"""
+import argparse
+import os
+import sys
+import time
+
+import fitz  # PyMuPDF
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdfeditor.render import RENDER_TIERS, render_pages, thumbnail_cache  # noqa: E402
+
+
+def make_pdf(page_count):
+    """A text-and-vector document that takes a realistic time to rasterize"""
+    pdf_document = fitz.open()
+    for page_num in range(page_count):
+        page = pdf_document.new_page()
+        for line in range(40):
+            page.insert_text((50, 60 + line * 17), f"Page {page_num + 1} line {line + 1}: " + "lorem ipsum " * 6, fontsize=9)
+        for i in range(20):
+            page.draw_circle((300, 400), 20 + i * 8, color=(i / 20, 0.2, 0.6))
+    output = pdf_document.tobytes()
+    pdf_document.close()
+    return output
+
+
+def time_render(pdf_bytes, page_count, tier, workers):
+    thumbnail_cache.clear()
+    start = time.perf_counter()
+    render_pages(pdf_bytes, range(page_count), tier, workers=workers)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--tier", choices=list(RENDER_TIERS), default="preview")
+    args = parser.parse_args()
+
+    # Start the pool outside the timed runs
+    warmup = make_pdf(args.workers * 16)
+    time_render(warmup, args.workers * 16, args.tier, args.workers)
+
+    print(f"tier={args.tier} workers={args.workers}")
+    print(f"{'pages':>7} {'serial s':>10} {'parallel s':>11} {'speedup':>8}")
+    for page_count in args.pages:
+        pdf_bytes = make_pdf(page_count)
+        serial = time_render(pdf_bytes, page_count, args.tier, 1)
+        parallel = time_render(pdf_bytes, page_count, args.tier, args.workers)
+        print(f"{page_count:>7} {serial:>10.2f} {parallel:>11.2f} {serial / parallel:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
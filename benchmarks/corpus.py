@@ -0,0 +1,151 @@
+"""
+Deterministic synthetic PDFs for benchmarking.
+
+A CorpusSpec fixes everything about a document: page count, lines of text
+per page, images per page, how many embedded fonts the text cycles
+through, annotations per page and the random seed. The same spec always
+gives byte-identical output, so timings from different runs and machines
+are comparing the same work. The text mixes filler words with terms the
+edit benchmarks search for (SEARCH_TERMS).
+
+    python benchmarks/corpus.py --tiers small medium --out corpus/
+    python benchmarks/corpus.py --pages 20 --images 3 --fonts 4 --out corpus/
+"""
+import argparse
+import os
+import random
+from collections import namedtuple
+
+import fitz  # PyMuPDF
+
+CorpusSpec = namedtuple("CorpusSpec", "pages lines images fonts annotations seed")
+
+# Size tiers, smallest first
+TIERS = {
+    "small": CorpusSpec(pages=5, lines=30, images=1, fonts=1, annotations=2, seed=1),
+    "medium": CorpusSpec(pages=50, lines=40, images=1, fonts=2, annotations=4, seed=2),
+    "large": CorpusSpec(pages=300, lines=45, images=2, fonts=3, annotations=4, seed=3),
+}
+
+# Words the highlight and replace benchmarks look for, about one in twenty
+SEARCH_TERMS = ["invoice", "total"]
+
+WORDS = ("lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore "
+         "et dolore magna aliqua enim ad minim veniam quis nostrud exercitation ullamco laboris nisi aliquip "
+         "ex ea commodo consequat duis aute irure in reprehenderit voluptate velit esse cillum").split()
+
+# Built-in faces whose font files get embedded, in the order specs use them
+FONTS = ["helv", "tiro", "cour", "hebo", "tibo", "cobo"]
+
+IMAGE_SIZE = (160, 120)
+
+
+def _sentence(rng, word_count):
+    words = []
+    for _ in range(word_count):
+        if rng.random() < 0.05:
+            words.append(rng.choice(SEARCH_TERMS))
+        else:
+            words.append(rng.choice(WORDS))
+    return " ".join(words)
+
+
+def _gradient():
+    width, height = IMAGE_SIZE
+    return bytes(((pixel % width) + (pixel // width)) & 0xFF for pixel in range(width * height) for _ in range(3))
+
+
+GRADIENT = int.from_bytes(_gradient(), "big")
+NOISE_MASK = int.from_bytes(b"\x3f" * (IMAGE_SIZE[0] * IMAGE_SIZE[1] * 3), "big")
+
+
+def _image(rng):
+    """A noisy gradient, so it compresses about as badly as a photo"""
+    width, height = IMAGE_SIZE
+    size = width * height * 3
+    noise = int.from_bytes(rng.randbytes(size), "big") & NOISE_MASK
+    return fitz.Pixmap(fitz.csRGB, width, height, (GRADIENT ^ noise).to_bytes(size, "big"), 0)
+
+
+def make_pdf(spec):
+    """Bytes of the document a CorpusSpec describes"""
+    if spec.fonts > len(FONTS):
+        raise ValueError(f"At most {len(FONTS)} fonts")
+    rng = random.Random(spec.seed)
+    fonts = [fitz.Font(name) for name in FONTS[:max(spec.fonts, 1)]]
+    pdf_document = fitz.open()
+    for page_num in range(spec.pages):
+        page = pdf_document.new_page()
+        writer = fitz.TextWriter(page.rect)
+        line_height = min(17, (page.rect.height - 100) / max(spec.lines, 1))
+        for line in range(spec.lines):
+            text = f"{page_num + 1}.{line + 1} " + _sentence(rng, 9)
+            writer.append((50, 60 + line * line_height), text, font=fonts[line % len(fonts)], fontsize=9)
+        writer.write_text(page)
+
+        for image_num in range(spec.images):
+            x = 320 + (image_num % 2) * 120
+            y = 60 + (image_num // 2) * 100
+            page.insert_image(fitz.Rect(x, y, x + 110, y + 82), pixmap=_image(rng))
+
+        for annotation_num in range(spec.annotations):
+            line = rng.randrange(max(spec.lines, 1))
+            y = 60 + line * line_height
+            if annotation_num % 2:
+                page.add_text_annot((30, y - 8), f"Note {annotation_num + 1}")
+            else:
+                annot = page.add_rect_annot(fitz.Rect(48, y - 10, 300, y + 3))
+                annot.set_colors(stroke=(0.9, 0.2, 0.2))
+                annot.update()
+    # Fixed metadata and file ID keep the output identical between runs
+    pdf_document.set_metadata({"title": f"Synthetic {spec.pages}-page document", "producer": "pdfeditor corpus",
+                               "creationDate": "D:20240101000000", "modDate": "D:20240101000000"})
+    output = pdf_document.tobytes(garbage=1, deflate=True, no_new_id=True)
+    pdf_document.close()
+    return output
+
+
+def corpus_path(directory, spec):
+    name = "corpus-p{}-l{}-i{}-f{}-a{}-s{}.pdf".format(*spec)
+    return os.path.join(directory, name)
+
+
+def load_pdf(spec, directory=None):
+    """make_pdf(spec), read from or written to directory when given so repeat runs skip generation"""
+    if directory is None:
+        return make_pdf(spec)
+    path = corpus_path(directory, spec)
+    if os.path.exists(path):
+        with open(path, "rb") as corpus_file:
+            return corpus_file.read()
+    pdf_bytes = make_pdf(spec)
+    os.makedirs(directory, exist_ok=True)
+    with open(path, "wb") as corpus_file:
+        corpus_file.write(pdf_bytes)
+    return pdf_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--out", default="corpus")
+    parser.add_argument("--tiers", nargs="+", choices=list(TIERS), default=[])
+    parser.add_argument("--pages", type=int)
+    parser.add_argument("--lines", type=int, default=40)
+    parser.add_argument("--images", type=int, default=1)
+    parser.add_argument("--fonts", type=int, default=1)
+    parser.add_argument("--annotations", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    specs = [TIERS[tier] for tier in args.tiers]
+    if args.pages:
+        specs.append(CorpusSpec(args.pages, args.lines, args.images, args.fonts, args.annotations, args.seed))
+    if not specs:
+        parser.error("give --tiers or --pages")
+    for spec in specs:
+        pdf_bytes = load_pdf(spec, args.out)
+        print(f"{corpus_path(args.out, spec)}  {len(pdf_bytes) / 1024:,.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""Diagnostics panel shared by the PDF Editor apps"""
+import streamlit as st
+
+from pdfeditor.metrics import operation_metrics
+
+
+def show_diagnostics():
+    """Where this server process spends its time, by phase and operation, with metrics exports"""
+    phases = operation_metrics.phase_seconds()
+    total = sum(phases.values())
+    if not total:
+        st.caption("No operations measured yet")
+        return
+    st.caption(" · ".join(f"{phase} {seconds:.2f}s ({seconds / total:.0%})" for phase, seconds in phases.items() if seconds))
+    st.dataframe(
+        [{"Phase": row["phase"], "Operation": row["operation"], "Calls": row["calls"],
+          "Self s": round(row["self_seconds"], 3), "Wall s": round(row["seconds"], 3),
+          "CPU s": round(row["cpu_seconds"], 3), "Peak MB": megabytes(row["peak_memory_bytes"]), "Pages": row["pages"]}
+         for row in operation_metrics.rows()],
+        use_container_width=True,
+        hide_index=True
+    )
+    st.markdown("**Latest operations**")
+    st.dataframe(
+        [{"Operation": event["operation"], "Wall s": round(event["seconds"], 3), "CPU s": round(event["cpu_seconds"], 3),
+          "Peak MB": megabytes(event["peak_memory_bytes"]), "Pages": event["pages"],
+          "Slowest phase": max(event["phases"], key=event["phases"].get)}
+         for event in operation_metrics.recent_operations()[:10]],
+        use_container_width=True,
+        hide_index=True
+    )
+    st.download_button("📈 Prometheus metrics", data=operation_metrics.prometheus_text,
+                       file_name="pdfeditor_metrics.prom", mime="text/plain", key="metrics_prometheus")
+    st.download_button("🧾 JSON log", data=operation_metrics.json_log,
+                       file_name="pdfeditor_metrics.jsonl", mime="application/x-ndjson", key="metrics_json")
+
+
+def megabytes(size):
+    return None if size is None else round(size / 1048576, 1)
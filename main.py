@@ -1,20 +1,21 @@
 import streamlit as st
-from PyPDF2 import PdfReader, PdfWriter
-import io
-import fitz  # PyMuPDF
-from PIL import Image
-import base64
+import re
 
-# Page config
-st.set_page_config(
-    page_title="PDF Editor Pro",
-    page_icon="📄",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
+from diagnostics import show_diagnostics
+from pdfeditor.cache import document_cache
+from pdfeditor.editor_session import (download_data, init_session_state, parse_page_selection, queue_edit, set_working_pdf,
+                                      show_history_controls, show_pdf_preview, show_pending_edits,
+                                      show_profile_comparison, store_pdf)
+from pdfeditor.edits import (compact_pdf, highlight_edit, highlight_terms_edit, parse_replacements, replace_edit,
+                             replace_map_edit)
+from pdfeditor.history import History
+from pdfeditor.ops import extract_pages_by_numbers
+from pdfeditor.saving import DEFAULT_SAVE_PROFILE, SAVE_PROFILES
+from pdfeditor.store import document_store
+from pdfeditor.terms import get_matcher, term
 
 # Enhanced Glassmorphic CSS
-st.markdown("""
+CUSTOM_CSS = """
 <style>
     @import url('https://fonts.googleapis.com/css2?family=Poppins:wght@300;400;600;700&display=swap');
     
@@ -243,209 +244,38 @@ st.markdown("""
         background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
     }
 </style>
-""", unsafe_allow_html=True)
+"""
 
-def parse_page_selection(selection_str, total_pages):
-    """Parse page selection: 2,10,45 or 21-45 or 1-5,10,15-20"""
-    pages = set()
-    
-    if not selection_str.strip():
-        return []
-    
-    parts = selection_str.split(',')
-    
-    for part in parts:
-        part = part.strip()
-        if '-' in part:
-            try:
-                start, end = part.split('-')
-                start = int(start.strip())
-                end = int(end.strip())
-                
-                if start < 1 or end > total_pages or start > end:
-                    st.error(f"❌ Invalid range: {part}")
-                    continue
-                    
-                pages.update(range(start, end + 1))
-            except:
-                st.error(f"❌ Invalid range format: {part}")
-        else:
-            try:
-                page = int(part)
-                if 1 <= page <= total_pages:
-                    pages.add(page)
-                else:
-                    st.error(f"❌ Page {page} out of range (1-{total_pages})")
-            except:
-                st.error(f"❌ Invalid page number: {part}")
-    
-    return sorted(list(pages))
+HIGHLIGHT_COLORS = {
+    "Yellow": (1, 1, 0),
+    "Green": (0, 1, 0),
+    "Blue": (0.3, 0.7, 1),
+    "Pink": (1, 0.4, 0.8),
+    "Orange": (1, 0.6, 0)
+}
 
-def pdf_to_images(pdf_bytes, page_numbers=None):
-    """Convert PDF pages to images"""
-    try:
-        images = []
-        pdf_document = fitz.open(stream=pdf_bytes, filetype="pdf")
-        
-        if page_numbers is None:
-            page_numbers = range(pdf_document.page_count)
-        
-        for page_num in page_numbers:
-            if page_num < pdf_document.page_count:
-                page = pdf_document[page_num]
-                pix = page.get_pixmap(matrix=fitz.Matrix(1.5, 1.5))
-                img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-                images.append((page_num + 1, img))
-        
-        pdf_document.close()
-        return images
-    except Exception as e:
-        st.error(f"Error: {str(e)}")
-        return []
-
-def extract_pages_by_numbers(pdf_bytes, page_numbers):
-    """Extract specific pages from PDF"""
-    reader = PdfReader(io.BytesIO(pdf_bytes))
-    writer = PdfWriter()
-    
-    for page_num in page_numbers:
-        if 1 <= page_num <= len(reader.pages):
-            writer.add_page(reader.pages[page_num - 1])
-    
-    output = io.BytesIO()
-    writer.write(output)
-    output.seek(0)
-    return output.getvalue()
-
-def smart_text_replacement(pdf_bytes, old_text, new_text, pages="all", case_sensitive=False):
-    """
-    AI-powered smart text replacement
-    Replaces old_text with new_text across specified pages
-    """
-    try:
-        pdf_document = fitz.open(stream=pdf_bytes, filetype="pdf")
-        replacement_count = 0
-        pages_modified = []
-        
-        # Determine which pages to process
-        if pages == "all":
-            page_range = range(pdf_document.page_count)
-        else:
-            page_range = [p - 1 for p in pages]  # Convert to 0-indexed
-        
-        for page_num in page_range:
-            if page_num >= pdf_document.page_count:
-                continue
-                
-            page = pdf_document[page_num]
-            
-            # Search for text
-            if case_sensitive:
-                text_instances = page.search_for(old_text)
-            else:
-                # Case-insensitive search
-                text_instances = page.search_for(old_text)
-            
-            if text_instances:
-                pages_modified.append(page_num + 1)
-                
-                for inst in text_instances:
-                    # Add white rectangle to cover old text
-                    page.draw_rect(inst, color=(1, 1, 1), fill=(1, 1, 1))
-                    
-                    # Add new text at the same position
-                    page.insert_text(
-                        inst.top_left,
-                        new_text,
-                        fontsize=11,
-                        color=(0, 0, 0)
-                    )
-                    replacement_count += 1
-        
-        if replacement_count > 0:
-            st.success(f"✅ Replaced {replacement_count} instances across {len(pages_modified)} pages!")
-            st.info(f"📄 Modified pages: {', '.join(map(str, pages_modified))}")
-        else:
-            st.warning(f"⚠️ Text '{old_text}' not found in the document")
-        
-        output = pdf_document.write()
-        pdf_document.close()
-        return output
-    except Exception as e:
-        st.error(f"Error replacing text: {str(e)}")
-        return pdf_bytes
-
-def highlight_text_smart(pdf_bytes, search_text, color, pages="all"):
-    """Smart text highlighting across multiple pages"""
-    try:
-        pdf_document = fitz.open(stream=pdf_bytes, filetype="pdf")
-        
-        color_map = {
-            "Yellow": (1, 1, 0),
-            "Green": (0, 1, 0),
-            "Blue": (0.3, 0.7, 1),
-            "Pink": (1, 0.4, 0.8),
-            "Orange": (1, 0.6, 0)
-        }
-        
-        highlight_color = color_map.get(color, (1, 1, 0))
-        total_highlights = 0
-        pages_highlighted = []
-        
-        # Determine pages
-        if pages == "all":
-            page_range = range(pdf_document.page_count)
-        else:
-            page_range = [p - 1 for p in pages]
-        
-        for page_num in page_range:
-            if page_num >= pdf_document.page_count:
-                continue
-                
-            page = pdf_document[page_num]
-            text_instances = page.search_for(search_text)
-            
-            if text_instances:
-                pages_highlighted.append(page_num + 1)
-                for inst in text_instances:
-                    highlight = page.add_highlight_annot(inst)
-                    highlight.set_colors(stroke=highlight_color)
-                    highlight.update()
-                    total_highlights += 1
-        
-        if total_highlights > 0:
-            st.success(f"✅ Highlighted {total_highlights} instances across {len(pages_highlighted)} pages!")
-            st.info(f"📄 Highlighted on pages: {', '.join(map(str, pages_highlighted))}")
-        else:
-            st.warning(f"⚠️ Text '{search_text}' not found")
-        
-        output = pdf_document.write()
-        pdf_document.close()
-        return output
-    except Exception as e:
-        st.error(f"Error: {str(e)}")
-        return pdf_bytes
-
-def show_pdf_preview(pdf_bytes):
-    """Enhanced PDF preview"""
-    base64_pdf = base64.b64encode(pdf_bytes).decode('utf-8')
-    pdf_display = f'''
-    <div class="pdf-preview">
-        <iframe src="data:application/pdf;base64,{base64_pdf}" 
-                width="100%" height="700" type="application/pdf" 
-                style="border: none; border-radius: 15px;">
-        </iframe>
-    </div>
-    '''
-    st.markdown(pdf_display, unsafe_allow_html=True)
-
-# Initialize session state
-if 'pdf_bytes' not in st.session_state:
-    st.session_state.pdf_bytes = None
-if 'modified_pdf' not in st.session_state:
-    st.session_state.modified_pdf = None
+def parse_term_list(terms_str, default_color, case_sensitive=False, whole_word=False, regex=False):
+    """One term per line, optionally followed by "| Color" """
+    terms = []
+    for line in terms_str.splitlines():
+        text, separator, color = line.rpartition("|")
+        if not separator or color.strip() not in HIGHLIGHT_COLORS:
+            text, color = line, default_color
+        if text.strip():
+            terms.append(term(text.strip(), HIGHLIGHT_COLORS[color.strip()], case_sensitive, whole_word, regex))
+    return terms
 
 def main():
+    # Page config
+    st.set_page_config(
+        page_title="PDF Editor Pro",
+        page_icon="📄",
+        layout="wide",
+        initial_sidebar_state="expanded"
+    )
+    st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
+    init_session_state()
+    
     # Enhanced Header with emoji animation
     st.markdown("""
         <h1>✨ PDF Editor Pro ✨</h1>
@@ -475,11 +305,27 @@ def main():
         st.markdown("---")
         st.markdown("### 💡 Pro Tips")
         st.markdown("""
-        - Changes apply instantly
+        - Edits queue up and apply in one pass
         - Preview updates live
         - Can undo anytime
         - Works on all pages together
         """)
+        
+        st.markdown("---")
+        st.markdown("### 💾 Saving")
+        st.checkbox(
+            "⚡ Incremental saves",
+            value=True,
+            key="incremental_save",
+            help="Append only the changed objects to the file instead of rewriting all of it. Redactions are always fully rewritten. Use Compact to fold the updates in."
+        )
+        st.selectbox(
+            "🗜️ Save profile",
+            list(SAVE_PROFILES),
+            index=list(SAVE_PROFILES).index(DEFAULT_SAVE_PROFILE),
+            key="save_profile",
+            help="Fast writes the file as-is; Balanced drops unused objects and compresses streams; Smallest also merges duplicates and packs objects into object streams. Applies to full rewrites and downloads."
+        )
     
     # Main upload
     uploaded_file = st.file_uploader(
@@ -489,14 +335,19 @@ def main():
     )
     
     if uploaded_file:
-        pdf_bytes = uploaded_file.read()
-        st.session_state.pdf_bytes = pdf_bytes
+        if st.session_state.get("upload_id") != uploaded_file.file_id:
+            # Store each upload once, straight from the uploader's buffer,
+            # instead of taking a fresh copy of it on every rerun
+            st.session_state.original_pdf = store_pdf(uploaded_file.getbuffer())
+            st.session_state.upload_id = uploaded_file.file_id
+        original = st.session_state.original_pdf
+        document_store.touch(st.session_state.store_session)
         
         if st.session_state.modified_pdf is None:
-            st.session_state.modified_pdf = pdf_bytes
+            st.session_state.modified_pdf = original
+            st.session_state.history = History(original)
         
-        reader = PdfReader(io.BytesIO(pdf_bytes))
-        total_pages = len(reader.pages)
+        total_pages = document_cache.page_count(original.data, original.key)
         
         # Stats row
         col1, col2, col3 = st.columns(3)
@@ -510,57 +361,60 @@ def main():
         
         st.markdown("<br>", unsafe_allow_html=True)
         
-        # Tabs
-        tab1, tab2, tab3, tab4 = st.tabs([
-            "📑 Select Pages", 
-            "✏️ Replace Text (AI)", 
-            "🎨 Highlight Text", 
-            "👁️ Preview & Download"
-        ])
+        # Tabs on the left, one live preview shared by all of them on the right
+        edit_col, preview_col = st.columns([1, 1])
+        
+        with edit_col:
+            tab1, tab2, tab3, tab4 = st.tabs([
+                "📑 Select Pages", 
+                "✏️ Replace Text (AI)", 
+                "🎨 Highlight Text", 
+                "👁️ Preview & Download"
+            ])
         
         with tab1:
-            col_left, col_right = st.columns([1, 1])
+            st.markdown("### 🎯 Page Selection")
             
-            with col_left:
-                st.markdown("### 🎯 Page Selection")
-                
-                selection_input = st.text_area(
-                    "Enter pages (examples below)",
-                    placeholder="2,10,45  OR  21-45  OR  1-5,10,15-20",
-                    height=100,
-                    help="Separate with commas, use dash for ranges"
-                )
-                
-                st.markdown("""
-                **Examples:**
-                - `2,10,45` → Pages 2, 10, 45 only
-                - `21-45` → Pages 21 to 45
-                - `1-5,10,15-20` → Pages 1-5, 10, and 15-20
-                """)
+            selection_input = st.text_area(
+                "Enter pages (examples below)",
+                placeholder="2,10,45  OR  21-45  OR  1-5,10,15-20",
+                height=100,
+                help="Separate with commas, use dash for ranges"
+            )
+            
+            st.markdown("""
+            **Examples:**
+            - `2,10,45` → Pages 2, 10, 45 only
+            - `21-45` → Pages 21 to 45
+            - `1-5,10,15-20` → Pages 1-5, 10, and 15-20
+            """)
+            
+            if selection_input:
+                selected_pages = parse_page_selection(selection_input, total_pages)
                 
-                if selection_input:
-                    selected_pages = parse_page_selection(selection_input, total_pages)
+                if selected_pages:
+                    st.success(f"✅ {len(selected_pages)} pages selected")
                     
-                    if selected_pages:
-                        st.success(f"✅ {len(selected_pages)} pages selected")
-                        
-                        if st.button("✂️ Extract These Pages", type="primary", use_container_width=True):
-                            extracted_pdf = extract_pages_by_numbers(pdf_bytes, selected_pages)
-                            st.session_state.modified_pdf = extracted_pdf
-                            st.balloons()
-                            st.rerun()
-            
-            with col_right:
-                st.markdown("### 👁️ PDF Preview")
-                show_pdf_preview(st.session_state.modified_pdf)
+                    if st.button("✂️ Extract These Pages", type="primary", use_container_width=True):
+                        extracted_pdf = extract_pages_by_numbers(original.data, selected_pages,
+                                                                 st.session_state.get("save_profile"), key=original.key)
+                        set_working_pdf(store_pdf(extracted_pdf), f"Extract {len(selected_pages)} pages")
+                        st.session_state.pending_edits = []
+                        st.balloons()
+                        st.rerun()
         
         with tab2:
-            col_left, col_right = st.columns([1, 1])
+            st.markdown("### ✏️ AI Text Replacement")
+            st.info("🤖 Just tell me what to replace - I'll handle the rest!")
             
-            with col_left:
-                st.markdown("### ✏️ AI Text Replacement")
-                st.info("🤖 Just tell me what to replace - I'll handle the rest!")
-                
+            replace_mode = st.radio(
+                "Replace:",
+                ["One Text", "Mapping File"],
+                horizontal=True,
+                key="replace_mode"
+            )
+            
+            if replace_mode == "One Text":
                 old_text = st.text_input(
                     "🔍 Find this text:",
                     placeholder="e.g., John Doe",
@@ -572,143 +426,173 @@ def main():
                     placeholder="e.g., Jane Smith",
                     help="New text to insert"
                 )
-                
-                col_a, col_b = st.columns(2)
-                
-                with col_a:
-                    apply_to = st.radio(
-                        "Apply to:",
-                        ["All Pages", "Specific Pages"],
-                        horizontal=True
+            else:
+                mapping_file = st.file_uploader(
+                    "📄 Mapping file (CSV or JSON)",
+                    type=['csv', 'json'],
+                    help="CSV rows of old,new text, or a JSON object of old → new",
+                    key="mapping_file"
+                )
+                replacements = []
+                if mapping_file:
+                    try:
+                        replacements = parse_replacements(mapping_file.getvalue(), mapping_file.name)
+                        st.success(f"✅ {len(replacements)} replacements loaded")
+                        with st.expander("📋 Mapping"):
+                            st.dataframe([{"Find": old, "Replace with": new} for old, new in replacements],
+                                         use_container_width=True)
+                    except ValueError as e:
+                        st.error(f"❌ {str(e)}")
+                whole_word = st.checkbox("Whole Words", value=False, key="replace_whole")
+            
+            col_a, col_b = st.columns(2)
+            
+            with col_a:
+                apply_to = st.radio(
+                    "Apply to:",
+                    ["All Pages", "Specific Pages"],
+                    horizontal=True
+                )
+            
+            with col_b:
+                case_sensitive = st.checkbox("Case Sensitive", value=False)
+                if replace_mode == "One Text":
+                    remove_old = st.checkbox(
+                        "Remove Old Text",
+                        value=True,
+                        help="Redact the old text so it is gone from the file, not just covered"
                     )
+            
+            if apply_to == "Specific Pages":
+                pages_input = st.text_input(
+                    "Which pages?",
+                    placeholder="1,3,5 or 1-10",
+                    help="Leave empty for all pages"
+                )
                 
-                with col_b:
-                    case_sensitive = st.checkbox("Case Sensitive", value=False)
-                
-                if apply_to == "Specific Pages":
-                    pages_input = st.text_input(
-                        "Which pages?",
-                        placeholder="1,3,5 or 1-10",
-                        help="Leave empty for all pages"
-                    )
-                    
-                    if pages_input:
-                        target_pages = parse_page_selection(pages_input, total_pages)
-                    else:
-                        target_pages = "all"
+                if pages_input:
+                    target_pages = parse_page_selection(pages_input, total_pages)
                 else:
                     target_pages = "all"
-                
-                st.markdown("<br>", unsafe_allow_html=True)
-                
+            else:
+                target_pages = "all"
+            
+            st.markdown("<br>", unsafe_allow_html=True)
+            
+            if replace_mode == "One Text":
                 if st.button("🔄 Replace Text", type="primary", use_container_width=True):
                     if old_text and new_text:
-                        with st.spinner("🔮 AI is working its magic..."):
-                            modified_pdf = smart_text_replacement(
-                                st.session_state.modified_pdf,
-                                old_text,
-                                new_text,
-                                target_pages,
-                                case_sensitive
-                            )
-                            st.session_state.modified_pdf = modified_pdf
-                            st.balloons()
-                            st.rerun()
+                        queue_edit(replace_edit(old_text, new_text, target_pages, case_sensitive, remove_old))
                     else:
                         st.error("❌ Please fill both fields!")
-            
-            with col_right:
-                st.markdown("### 👁️ Live Preview")
-                st.info("💡 Changes will appear here instantly")
-                show_pdf_preview(st.session_state.modified_pdf)
+            elif st.button("🔄 Replace All", type="primary", use_container_width=True):
+                if replacements:
+                    queue_edit(replace_map_edit(replacements, target_pages, case_sensitive, whole_word))
+                else:
+                    st.error("❌ Please upload a mapping file!")
         
         with tab3:
-            col_left, col_right = st.columns([1, 1])
+            st.markdown("### 🎨 Smart Text Highlighting")
+            st.info("🤖 AI will find and highlight all instances!")
+            st.info("PDF HighLighter")
+            highlight_mode = st.radio(
+                "Highlight:",
+                ["One Text", "Term List"],
+                horizontal=True,
+                key="hl_mode"
+            )
             
-            with col_left:
-                st.markdown("### 🎨 Smart Text Highlighting")
-                st.info("🤖 AI will find and highlight all instances!")
-                st.info("PDF HighLighter")
+            if highlight_mode == "One Text":
                 highlight_text = st.text_input(
                     "🔍 Text to highlight:",
                     placeholder="e.g., Important, Confidential",
                     help="AI will find all instances"
                 )
-                
-                col_a, col_b = st.columns(2)
-                
-                with col_a:
-                    highlight_color = st.selectbox(
-                        "🎨 Color:",
-                        ["Yellow", "Green", "Blue", "Pink", "Orange"]
-                    )
-                
-                with col_b:
-                    color_preview = {
-                        "Yellow": "🟨",
-                        "Green": "🟩",
-                        "Blue": "🟦",
-                        "Pink": "🌸",
-                        "Orange": "🟧"
-                    }
-                    st.markdown(f"<h2 style='text-align: center;'>{color_preview[highlight_color]}</h2>", unsafe_allow_html=True)
-                
-                apply_to_hl = st.radio(
-                    "Apply to:",
-                    ["All Pages", "Specific Pages"],
-                    horizontal=True,
-                    key="hl_radio"
+            else:
+                terms_input = st.text_area(
+                    "🔍 Terms to highlight, one per line:",
+                    placeholder="Confidential\nJohn Doe | Pink\nACME Corp | Blue",
+                    height=150,
+                    help="Add '| Color' after a term to give it its own color; other terms use the color below"
+                )
+                col_c, col_d, col_e = st.columns(3)
+                with col_c:
+                    terms_case = st.checkbox("Case Sensitive", value=False, key="terms_case")
+                with col_d:
+                    terms_whole = st.checkbox("Whole Words", value=False, key="terms_whole")
+                with col_e:
+                    terms_regex = st.checkbox("Regex", value=False, key="terms_regex")
+            
+            col_a, col_b = st.columns(2)
+            
+            with col_a:
+                highlight_color = st.selectbox(
+                    "🎨 Color:",
+                    ["Yellow", "Green", "Blue", "Pink", "Orange"]
+                )
+            
+            with col_b:
+                color_preview = {
+                    "Yellow": "🟨",
+                    "Green": "🟩",
+                    "Blue": "🟦",
+                    "Pink": "🌸",
+                    "Orange": "🟧"
+                }
+                st.markdown(f"<h2 style='text-align: center;'>{color_preview[highlight_color]}</h2>", unsafe_allow_html=True)
+            
+            apply_to_hl = st.radio(
+                "Apply to:",
+                ["All Pages", "Specific Pages"],
+                horizontal=True,
+                key="hl_radio"
+            )
+            
+            if apply_to_hl == "Specific Pages":
+                pages_input_hl = st.text_input(
+                    "Which pages?",
+                    placeholder="1,3,5 or 1-10",
+                    key="hl_pages"
                 )
                 
-                if apply_to_hl == "Specific Pages":
-                    pages_input_hl = st.text_input(
-                        "Which pages?",
-                        placeholder="1,3,5 or 1-10",
-                        key="hl_pages"
-                    )
-                    
-                    if pages_input_hl:
-                        target_pages_hl = parse_page_selection(pages_input_hl, total_pages)
-                    else:
-                        target_pages_hl = "all"
+                if pages_input_hl:
+                    target_pages_hl = parse_page_selection(pages_input_hl, total_pages)
                 else:
                     target_pages_hl = "all"
-                
-                st.markdown("<br>", unsafe_allow_html=True)
+            else:
+                target_pages_hl = "all"
+            
+            st.markdown("<br>", unsafe_allow_html=True)
 
+            if highlight_mode == "One Text":
                 if st.button("✨ Highlight Text", type="primary", use_container_width=True):
                     if highlight_text:
-                        with st.spinner("🎨 Highlighting..."):
-                            highlighted_pdf = highlight_text_smart(
-                                st.session_state.modified_pdf,
-                                highlight_text,
-                                highlight_color,
-                                target_pages_hl
-                            )
-                            st.session_state.modified_pdf = highlighted_pdf
-                            st.balloons()
-                            st.rerun()
+                        queue_edit(highlight_edit(highlight_text, HIGHLIGHT_COLORS[highlight_color], target_pages_hl))
                     else:
                         st.error("❌ Please enter text to highlight!")
-            
-            with col_right:
-                st.markdown("### 👁️ Live Preview")
-                st.info("💡 Highlights will appear here instantly")
-                show_pdf_preview(st.session_state.modified_pdf)
+            elif st.button("✨ Highlight Terms", type="primary", use_container_width=True):
+                terms = parse_term_list(terms_input, highlight_color, terms_case, terms_whole, terms_regex)
+                if not terms:
+                    st.error("❌ Please enter at least one term!")
+                else:
+                    try:
+                        get_matcher(terms)
+                        queue_edit(highlight_terms_edit(terms, target_pages_hl))
+                    except re.error as e:
+                        st.error(f"❌ Invalid pattern: {str(e)}")
         
         with tab4:
             st.markdown("### 📥 Final Preview & Download")                                                         
             
-            show_pdf_preview(st.session_state.modified_pdf)
-            
             st.markdown("<br>", unsafe_allow_html=True)
             
             col1, col2, col3 = st.columns(3)
             
             with col1:
+                pending_count = len(st.session_state.pending_edits)
                 st.download_button(
-                    label="💾 Download Edited PDF",
-                    data=st.session_state.modified_pdf,
+                    label="💾 Download Edited PDF" + (f" (+{pending_count} pending)" if pending_count else ""),
+                    data=download_data(),
                     file_name="edited_" + uploaded_file.name,
                     mime="application/pdf",
                     use_container_width=True
@@ -716,13 +600,35 @@ def main():
             
             with col2:
                 if st.button("🔄 Reset to Original", use_container_width=True):
-                    st.session_state.modified_pdf = st.session_state.pdf_bytes
+                    set_working_pdf(st.session_state.original_pdf, "Reset to original")
+                    st.session_state.pending_edits = []
                     st.success("✅ Reset complete!")
                     st.rerun()
             
             with col3:
                 final_size = len(st.session_state.modified_pdf) / 1024
                 st.metric("Final Size", f"{final_size:.1f} KB")
+        
+            if st.button("🗜️ Compact PDF", key="compact_btn", help="Rewrite the whole file, dropping objects superseded by incremental saves"):
+                document = st.session_state.modified_pdf
+                set_working_pdf(store_pdf(compact_pdf(document.data, key=document.key)), "Compact")
+                st.rerun()
+            
+            show_profile_comparison()
+        
+        with preview_col:
+            st.markdown("### 👁️ Live Preview")
+            st.info("💡 Queued edits appear here once applied")
+            show_history_controls()
+            show_pending_edits()
+            show_pdf_preview(st.session_state.modified_pdf, st.session_state.original_pdf)
+    
+    # Last, so this run's operations are included
+    with st.sidebar:
+        st.markdown("---")
+        if st.checkbox("🩺 Diagnostics", key="show_diagnostics",
+                       help="Wall time, CPU time, peak memory and pages of every operation this server process has run, by phase"):
+            show_diagnostics()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -1,18 +1,18 @@
+import os
+import tempfile
+
 import streamlit as st
-from PyPDF2 import PdfReader, PdfWriter
-import io
-import fitz  # PyMuPDF
-from PIL import Image
 
-# Page config
-st.set_page_config(
-    page_title="PDF Editor Pro",
-    page_icon="📄",
-    layout="wide"
-)
+from diagnostics import show_diagnostics
+from pdfeditor.cache import doc_hash, document_cache
+from pdfeditor.ops import (add_watermark, extract_pages, inspect_pdfs, merge_pdf_files, remove_pages, reorder_pages,
+                           result_cache, rotate_pages, split_pdf)
+from pdfeditor.pages import PageRanges, parse_page_order
+from pdfeditor.render import RENDER_TIERS, PageImages, get_tier
+from pdfeditor.saving import DEFAULT_SAVE_PROFILE, SAVE_PROFILES
 
 # Custom CSS for glassmorphic design
-st.markdown("""
+CUSTOM_CSS = """
 <style>
     /* Main background gradient */
     .stApp {
@@ -114,145 +114,129 @@ st.markdown("""
         color: white !important;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
 
-def pdf_to_images(pdf_bytes):
-    """Convert PDF pages to images using PyMuPDF"""
+def pdf_to_images(pdf_bytes, tier="thumbnail", grayscale=False, key=None):
+    """Page images for the PDF, each rendered only when it is displayed"""
     try:
-        images = []
-        pdf_document = fitz.open(stream=pdf_bytes, filetype="pdf")
-        
-        for page_num in range(pdf_document.page_count):
-            page = pdf_document[page_num]
-            # Render page to image with reasonable resolution
-            pix = page.get_pixmap(matrix=fitz.Matrix(1.5, 1.5))
-            img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-            images.append(img)
-        
-        pdf_document.close()
-        return images
+        return PageImages(pdf_bytes, get_tier(tier, grayscale=grayscale), key)
     except Exception as e:
         st.error(f"Error converting PDF to images: {str(e)}")
         return []
 
-def remove_pages(pdf_bytes, pages_to_keep):
-    """Remove pages from PDF"""
-    reader = PdfReader(io.BytesIO(pdf_bytes))
-    writer = PdfWriter()
-    
-    for page_num in pages_to_keep:
-        writer.add_page(reader.pages[page_num])
-    
-    output = io.BytesIO()
-    writer.write(output)
-    output.seek(0)
-    return output.getvalue()
+def page_state(key, doc_key, default):
+    """Per-screen state for the uploaded document, reset when the file changes"""
+    state_key = f"{key}_state"
+    state = st.session_state.get(state_key)
+    if state is None or state["doc"] != doc_key:
+        state = {"doc": doc_key, "value": default}
+        st.session_state[state_key] = state
+    return state["value"]
 
-def rotate_pages(pdf_bytes, page_rotations):
-    """Rotate specific pages"""
-    reader = PdfReader(io.BytesIO(pdf_bytes))
-    writer = PdfWriter()
-    
-    for i, page in enumerate(reader.pages):
-        if i in page_rotations:
-            page.rotate(page_rotations[i])
-        writer.add_page(page)
-    
-    output = io.BytesIO()
-    writer.write(output)
-    output.seek(0)
-    return output.getvalue()
-
-def merge_pdfs(pdf_files):
-    """Merge multiple PDFs"""
-    writer = PdfWriter()
-    
-    for pdf_file in pdf_files:
-        reader = PdfReader(io.BytesIO(pdf_file))
-        for page in reader.pages:
-            writer.add_page(page)
-    
-    output = io.BytesIO()
-    writer.write(output)
-    output.seek(0)
-    return output.getvalue()
+def page_window(key, total_pages, page_size):
+    """Pager for a thumbnail grid; returns the pages on the current screen"""
+    screens = max(1, -(-total_pages // page_size))
+    screen = 1
+    if screens > 1:
+        screen = st.number_input(
+            f"🖼️ Screen (1-{screens}, {page_size} pages each)",
+            min_value=1,
+            max_value=screens,
+            value=1,
+            key=f"{key}_screen"
+        )
+    start = (screen - 1) * page_size
+    return range(start, min(start + page_size, total_pages))
 
-def split_pdf(pdf_bytes, split_points):
-    """Split PDF into multiple files"""
-    reader = PdfReader(io.BytesIO(pdf_bytes))
-    pdfs = []
-    
-    split_points = [0] + sorted(split_points) + [len(reader.pages)]
-    
-    for i in range(len(split_points) - 1):
-        writer = PdfWriter()
-        for page_num in range(split_points[i], split_points[i + 1]):
-            writer.add_page(reader.pages[page_num])
-        
-        output = io.BytesIO()
-        writer.write(output)
-        output.seek(0)
-        pdfs.append(output.getvalue())
-    
-    return pdfs
+def show_thumbnail_grid(images, pages, cols_per_row, key, selection=None, rotations=None):
+    """Show thumbnails for the given pages only; with a selection, each page gets a toggle"""
+    pages = list(pages)
+    rotations = rotations or {}
+    images.prefetch(pages, rotations)
+    
+    for i in range(0, len(pages), cols_per_row):
+        cols = st.columns(cols_per_row)
+        for page_num, col in zip(pages[i:i + cols_per_row], cols):
+            with col:
+                rotation = rotations.get(page_num, 0)
+                st.image(images.render(page_num, rotation), use_container_width=True)
+                if selection is None:
+                    st.caption(f"Page {page_num + 1}" + (f" · {rotation}°" if rotation else ""))
+                else:
+                    mark = "✅" if page_num in selection else "⬜"
+                    st.button(
+                        f"{mark} Page {page_num + 1}",
+                        key=f"{key}_toggle_{page_num}",
+                        on_click=selection.toggle,
+                        args=(page_num,),
+                        use_container_width=True
+                    )
 
-def extract_pages(pdf_bytes, pages_to_extract):
-    """Extract specific pages into a new PDF"""
-    reader = PdfReader(io.BytesIO(pdf_bytes))
-    writer = PdfWriter()
-    
-    for page_num in pages_to_extract:
-        writer.add_page(reader.pages[page_num])
-    
-    output = io.BytesIO()
-    writer.write(output)
-    output.seek(0)
-    return output.getvalue()
+def read_range_input(key, total_pages):
+    """Parse the range text box of a screen, reporting bad input"""
+    try:
+        return PageRanges.parse(st.session_state.get(f"{key}_range", ""), total_pages)
+    except ValueError as e:
+        st.error(f"❌ {e}")
+        return PageRanges()
 
-def reorder_pages(pdf_bytes, new_order):
-    """Reorder pages based on new order list"""
-    reader = PdfReader(io.BytesIO(pdf_bytes))
-    writer = PdfWriter()
-    
-    for page_num in new_order:
-        writer.add_page(reader.pages[page_num])
-    
-    output = io.BytesIO()
-    writer.write(output)
-    output.seek(0)
-    return output.getvalue()
+def update_selection(selection, key, total_pages, action):
+    """Button callback applying a bulk action to a page selection"""
+    if action == "all":
+        selection.add(0, total_pages)
+    elif action == "none":
+        selection.clear()
+    else:
+        for start, stop in read_range_input(key, total_pages).ranges:
+            if action == "add":
+                selection.add(start, stop)
+            else:
+                selection.remove(start, stop)
 
-def add_watermark(pdf_bytes, watermark_text):
-    """Add watermark to PDF pages"""
-    try:
-        pdf_document = fitz.open(stream=pdf_bytes, filetype="pdf")
-        
-        for page_num in range(pdf_document.page_count):
-            page = pdf_document[page_num]
-            
-            # Get page dimensions
-            rect = page.rect
-            
-            # Add watermark text
-            text_rect = fitz.Rect(50, rect.height - 50, rect.width - 50, rect.height - 20)
-            page.insert_textbox(
-                text_rect,
-                watermark_text,
-                fontsize=12,
-                color=(0.7, 0.7, 0.7),
-                align=fitz.TEXT_ALIGN_CENTER
+def selection_controls(key, selection, total_pages):
+    """Range and bulk selection controls replacing per-page checkboxes"""
+    st.text_input("Pages (e.g. 1-5,10,15-20):", key=f"{key}_range")
+    col_a, col_b, col_c, col_d = st.columns(4)
+    for col, label, action in [
+        (col_a, "➕ Select Range", "add"),
+        (col_b, "➖ Deselect Range", "remove"),
+        (col_c, "☑️ Select All", "all"),
+        (col_d, "🧹 Clear All", "none"),
+    ]:
+        with col:
+            st.button(
+                label,
+                key=f"{key}_{action}",
+                on_click=update_selection,
+                args=(selection, key, total_pages, action),
+                use_container_width=True
             )
-        
-        # Save to bytes
-        output = pdf_document.write()
-        pdf_document.close()
-        return output
-    except Exception as e:
-        st.error(f"Error adding watermark: {str(e)}")
-        return pdf_bytes
+    st.caption(f"{len(selection)} of {total_pages} pages selected: {selection or 'none'}")
+
+def update_rotations(rotations, key, total_pages, angle):
+    """Button callback setting the rotation of a page range"""
+    page_ranges = read_range_input(key, total_pages)
+    for start, stop in page_ranges.ranges:
+        for ranges in rotations.values():
+            ranges.remove(start, stop)
+        if angle:
+            rotations[angle].add(start, stop)
+
+def clear_rotations(rotations):
+    """Button callback dropping every rotation that was set"""
+    for ranges in rotations.values():
+        ranges.clear()
 
 # Main app
 def main():
+    # Page config
+    st.set_page_config(
+        page_title="PDF Editor Pro",
+        page_icon="📄",
+        layout="wide"
+    )
+    st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
+    
     # Header
     st.markdown("<h1 style='text-align: center; font-size: 3em;'>📄 PDF Editor Pro</h1>", unsafe_allow_html=True)
     st.markdown("<p style='text-align: center; font-size: 1.2em; margin-bottom: 30px;'>Your Complete PDF Editing Solution</p>", unsafe_allow_html=True)
@@ -288,6 +272,25 @@ def main():
         - Works offline
         - Privacy protected
         """)
+        
+        st.markdown("---")
+        st.markdown("### 🖼️ Thumbnails")
+        thumbnail_tier = st.selectbox(
+            "Quality",
+            list(RENDER_TIERS),
+            help="Thumbnail is fastest; Full renders sharp, large page images"
+        )
+        grayscale_thumbnails = st.checkbox("Grayscale", value=False)
+        page_size = st.selectbox("Thumbnails per screen", [12, 24, 48, 96], index=1)
+        
+        st.markdown("---")
+        st.markdown("### 💾 Saving")
+        save_profile = st.selectbox(
+            "Save profile",
+            list(SAVE_PROFILES),
+            index=list(SAVE_PROFILES).index(DEFAULT_SAVE_PROFILE),
+            help="Fast writes results as-is; Balanced drops unused objects and compresses streams; Smallest also merges duplicates and packs objects into object streams"
+        )
     
     # Operation selection
     operation = st.selectbox(
@@ -310,33 +313,27 @@ def main():
     
     # Process based on operation
     if operation == "Remove Pages" and uploaded_file:
-        pdf_bytes = uploaded_file.read()
-        reader = PdfReader(io.BytesIO(pdf_bytes))
-        total_pages = len(reader.pages)
+        pdf_bytes = uploaded_file.getvalue()
+        doc_key = doc_hash(pdf_bytes)
+        total_pages = document_cache.page_count(pdf_bytes, doc_key)
         
         st.markdown(f"<h3>📄 Total Pages: {total_pages}</h3>", unsafe_allow_html=True)
         
         # Display thumbnails
-        images = pdf_to_images(pdf_bytes)
+        images = pdf_to_images(pdf_bytes, thumbnail_tier, grayscale_thumbnails, doc_key)
         
         if images:
             st.markdown("### Select Pages to KEEP:")
             
-            cols_per_row = 4
-            selected_pages = []
+            selected_pages = page_state("keep", doc_key, PageRanges.all(total_pages))
+            selection_controls("keep", selected_pages, total_pages)
             
-            for i in range(0, len(images), cols_per_row):
-                cols = st.columns(cols_per_row)
-                for j, col in enumerate(cols):
-                    if i + j < len(images):
-                        with col:
-                            st.image(images[i + j], use_container_width=True)
-                            if st.checkbox(f"Page {i + j + 1}", key=f"keep_{i+j}", value=True):
-                                selected_pages.append(i + j)
+            visible_pages = page_window("keep", total_pages, page_size)
+            show_thumbnail_grid(images, visible_pages, 4, "keep", selection=selected_pages)
             
             if st.button("🗑️ Remove Unselected Pages", type="primary"):
                 if selected_pages:
-                    edited_pdf = remove_pages(pdf_bytes, selected_pages)
+                    edited_pdf = remove_pages(pdf_bytes, list(selected_pages), save_profile, key=doc_key)
                     st.success(f"✅ Removed {total_pages - len(selected_pages)} pages!")
                     
                     st.download_button(
@@ -349,37 +346,52 @@ def main():
                     st.error("❌ Please select at least one page to keep!")
     
     elif operation == "Rotate Pages" and uploaded_file:
-        pdf_bytes = uploaded_file.read()
-        reader = PdfReader(io.BytesIO(pdf_bytes))
-        total_pages = len(reader.pages)
+        pdf_bytes = uploaded_file.getvalue()
+        doc_key = doc_hash(pdf_bytes)
+        total_pages = document_cache.page_count(pdf_bytes, doc_key)
         
         st.markdown(f"<h3>📄 Total Pages: {total_pages}</h3>", unsafe_allow_html=True)
         
-        images = pdf_to_images(pdf_bytes)
+        images = pdf_to_images(pdf_bytes, thumbnail_tier, grayscale_thumbnails, doc_key)
         
         if images:
             st.markdown("### Select Pages and Rotation:")
             
-            page_rotations = {}
-            cols_per_row = 3
+            rotations = page_state("rotate", doc_key, {90: PageRanges(), 180: PageRanges(), 270: PageRanges()})
             
-            for i in range(0, len(images), cols_per_row):
-                cols = st.columns(cols_per_row)
-                for j, col in enumerate(cols):
-                    if i + j < len(images):
-                        with col:
-                            st.image(images[i + j], use_container_width=True)
-                            rotation = st.selectbox(
-                                f"Page {i + j + 1}",
-                                [0, 90, 180, 270],
-                                key=f"rotate_{i+j}"
-                            )
-                            if rotation != 0:
-                                page_rotations[i + j] = rotation
+            st.text_input("Pages (e.g. 1-5,10,15-20):", key="rotate_range")
+            col_a, col_b, col_c = st.columns(3)
+            with col_a:
+                angle = st.selectbox("Rotation", [0, 90, 180, 270], key="rotate_angle")
+            with col_b:
+                st.button(
+                    "↩️ Set Rotation",
+                    on_click=update_rotations,
+                    args=(rotations, "rotate", total_pages, angle),
+                    use_container_width=True
+                )
+            with col_c:
+                st.button(
+                    "🧹 Clear Rotations",
+                    on_click=clear_rotations,
+                    args=(rotations,),
+                    use_container_width=True
+                )
+            st.caption(" · ".join(f"{a}°: {r}" for a, r in rotations.items() if r) or "No rotations set")
+            
+            # Preview each visible page with the rotation set for it
+            visible_pages = page_window("rotate", total_pages, page_size)
+            shown_rotations = {}
+            for page_num in visible_pages:
+                for rotation, ranges in rotations.items():
+                    if page_num in ranges:
+                        shown_rotations[page_num] = rotation
+            show_thumbnail_grid(images, visible_pages, 3, "rotate", rotations=shown_rotations)
             
             if st.button("🔄 Apply Rotations", type="primary"):
+                page_rotations = {page_num: rotation for rotation, ranges in rotations.items() for page_num in ranges}
                 if page_rotations:
-                    edited_pdf = rotate_pages(pdf_bytes, page_rotations)
+                    edited_pdf = rotate_pages(pdf_bytes, page_rotations, save_profile, key=doc_key)
                     st.success(f"✅ Rotated {len(page_rotations)} pages!")
                     
                     st.download_button(
@@ -400,23 +412,62 @@ def main():
             for idx, file in enumerate(uploaded_files):
                 st.markdown(f"**{idx + 1}.** {file.name}")
             
+            share_resources = st.checkbox(
+                "Share identical fonts and images",
+                value=True,
+                help="Files made from the same template then keep one copy of each font, logo and image"
+            )
+            
             if st.button("🔗 Merge PDFs", type="primary"):
-                pdf_files = [file.read() for file in uploaded_files]
-                merged_pdf = merge_pdfs(pdf_files)
-                
-                st.success(f"✅ Merged {len(uploaded_files)} PDFs successfully!")
-                
-                st.download_button(
-                    label="💾 Download Merged PDF",
-                    data=merged_pdf,
-                    file_name="merged_document.pdf",
-                    mime="application/pdf"
-                )
+                # Merge through files on disk so memory does not grow with
+                # the number and size of the uploads
+                with tempfile.TemporaryDirectory() as spool_dir:
+                    input_paths = []
+                    for idx, file in enumerate(uploaded_files):
+                        input_path = os.path.join(spool_dir, f"{idx}.pdf")
+                        with open(input_path, "wb") as input_file:
+                            input_file.write(file.getbuffer())
+                        input_paths.append(input_path)
+                    
+                    # Check every input up front (in parallel) so broken
+                    # files are named before anything is merged
+                    inputs = inspect_pdfs(input_paths, spool_dir=spool_dir)
+                    with st.expander("⏱️ Input check times"):
+                        st.dataframe(
+                            [{"File": file.name, "Pages": report["pages"], "Seconds": report["seconds"],
+                              "Problem": report["error"] or ""}
+                             for file, report in zip(uploaded_files, inputs)],
+                            use_container_width=True
+                        )
+                    
+                    broken = [(file, report) for file, report in zip(uploaded_files, inputs) if report["error"]]
+                    for file, report in broken:
+                        st.error(f"❌ {file.name}: {report['error']}")
+                    
+                    if not broken:
+                        merged_path = os.path.join(spool_dir, "merged.pdf")
+                        merge = merge_pdf_files(input_paths, merged_path, inputs=inputs, dedupe=share_resources,
+                                                profile=save_profile)
+                        
+                        st.success(f"✅ Merged {len(uploaded_files)} PDFs successfully!")
+                        if merge.get("dedupe", {}).get("objects"):
+                            dedupe = merge["dedupe"]
+                            st.info(f"♻️ Shared {dedupe['objects']} duplicate resources: "
+                                    f"{dedupe['bytes_saved'] / 1024:,.0f} KB saved "
+                                    f"({dedupe['bytes_before'] / 1024:,.0f} → {dedupe['bytes_after'] / 1024:,.0f} KB)")
+                        
+                        with open(merged_path, "rb") as merged_file:
+                            st.download_button(
+                                label="💾 Download Merged PDF",
+                                data=merged_file,
+                                file_name="merged_document.pdf",
+                                mime="application/pdf"
+                            )
     
     elif operation == "Split PDF" and uploaded_file:
-        pdf_bytes = uploaded_file.read()
-        reader = PdfReader(io.BytesIO(pdf_bytes))
-        total_pages = len(reader.pages)
+        pdf_bytes = uploaded_file.getvalue()
+        doc_key = doc_hash(pdf_bytes)
+        total_pages = document_cache.page_count(pdf_bytes, doc_key)
         
         st.markdown(f"<h3>📄 Total Pages: {total_pages}</h3>", unsafe_allow_html=True)
         st.markdown("### Enter page numbers where you want to split (comma-separated):")
@@ -431,7 +482,7 @@ def main():
                     split_points = [p for p in split_points if 0 < p < total_pages]
                     
                     if split_points:
-                        pdfs = split_pdf(pdf_bytes, split_points)
+                        pdfs = split_pdf(pdf_bytes, split_points, save_profile, key=doc_key)
                         st.success(f"✅ Split into {len(pdfs)} PDFs!")
                         
                         for idx, pdf_data in enumerate(pdfs):
@@ -450,32 +501,26 @@ def main():
                 st.error("❌ Please enter split points!")
     
     elif operation == "Extract Pages" and uploaded_file:
-        pdf_bytes = uploaded_file.read()
-        reader = PdfReader(io.BytesIO(pdf_bytes))
-        total_pages = len(reader.pages)
+        pdf_bytes = uploaded_file.getvalue()
+        doc_key = doc_hash(pdf_bytes)
+        total_pages = document_cache.page_count(pdf_bytes, doc_key)
         
         st.markdown(f"<h3>📄 Total Pages: {total_pages}</h3>", unsafe_allow_html=True)
         
-        images = pdf_to_images(pdf_bytes)
+        images = pdf_to_images(pdf_bytes, thumbnail_tier, grayscale_thumbnails, doc_key)
         
         if images:
             st.markdown("### Select Pages to Extract:")
             
-            cols_per_row = 4
-            pages_to_extract = []
+            pages_to_extract = page_state("extract", doc_key, PageRanges())
+            selection_controls("extract", pages_to_extract, total_pages)
             
-            for i in range(0, len(images), cols_per_row):
-                cols = st.columns(cols_per_row)
-                for j, col in enumerate(cols):
-                    if i + j < len(images):
-                        with col:
-                            st.image(images[i + j], use_container_width=True)
-                            if st.checkbox(f"Page {i + j + 1}", key=f"extract_{i+j}"):
-                                pages_to_extract.append(i + j)
+            visible_pages = page_window("extract", total_pages, page_size)
+            show_thumbnail_grid(images, visible_pages, 4, "extract", selection=pages_to_extract)
             
             if st.button("📤 Extract Selected Pages", type="primary"):
                 if pages_to_extract:
-                    extracted_pdf = extract_pages(pdf_bytes, pages_to_extract)
+                    extracted_pdf = extract_pages(pdf_bytes, list(pages_to_extract), save_profile, key=doc_key)
                     st.success(f"✅ Extracted {len(pages_to_extract)} pages!")
                     
                     st.download_button(
@@ -488,41 +533,35 @@ def main():
                     st.error("❌ Please select at least one page to extract!")
     
     elif operation == "Reorder Pages" and uploaded_file:
-        pdf_bytes = uploaded_file.read()
-        reader = PdfReader(io.BytesIO(pdf_bytes))
-        total_pages = len(reader.pages)
+        pdf_bytes = uploaded_file.getvalue()
+        doc_key = doc_hash(pdf_bytes)
+        total_pages = document_cache.page_count(pdf_bytes, doc_key)
         
         st.markdown(f"<h3>📄 Total Pages: {total_pages}</h3>", unsafe_allow_html=True)
         
-        images = pdf_to_images(pdf_bytes)
+        images = pdf_to_images(pdf_bytes, thumbnail_tier, grayscale_thumbnails, doc_key)
         
         if images:
             st.markdown("### Drag to Reorder (or enter custom order):")
-            st.info("Enter page numbers in desired order (comma-separated). Example: 3,1,2 will reorder to page 3, then 1, then 2")
+            st.info("Enter page numbers or ranges in desired order (comma-separated). Example: 3,1-2 will reorder to page 3, then 1, then 2; 10-1 reverses ten pages")
             
-            default_order = ",".join(str(i+1) for i in range(total_pages))
+            default_order = f"1-{total_pages}" if total_pages > 1 else "1"
             order_input = st.text_input("New order:", default_order)
             
             # Display current order preview
-            cols_per_row = 4
-            for i in range(0, len(images), cols_per_row):
-                cols = st.columns(cols_per_row)
-                for j, col in enumerate(cols):
-                    if i + j < len(images):
-                        with col:
-                            st.image(images[i + j], use_container_width=True)
-                            st.caption(f"Page {i + j + 1}")
+            visible_pages = page_window("reorder", total_pages, page_size)
+            show_thumbnail_grid(images, visible_pages, 4, "reorder")
             
             if st.button("🔀 Reorder Pages", type="primary"):
                 try:
-                    new_order = [int(x.strip())-1 for x in order_input.split(",")]
+                    new_order = parse_page_order(order_input, total_pages)
                     
                     if len(new_order) != total_pages:
                         st.error(f"❌ Please specify all {total_pages} pages!")
                     elif set(new_order) != set(range(total_pages)):
                         st.error("❌ Invalid page numbers!")
                     else:
-                        reordered_pdf = reorder_pages(pdf_bytes, new_order)
+                        reordered_pdf = reorder_pages(pdf_bytes, new_order, save_profile, key=doc_key)
                         st.success("✅ Pages reordered successfully!")
                         
                         st.download_button(
@@ -531,13 +570,13 @@ def main():
                             file_name="reordered_" + uploaded_file.name,
                             mime="application/pdf"
                         )
-                except:
-                    st.error("❌ Invalid input! Use comma-separated page numbers.")
+                except ValueError as e:
+                    st.error(f"❌ Invalid input! {e}")
     
     elif operation == "Add Watermark" and uploaded_file:
-        pdf_bytes = uploaded_file.read()
-        reader = PdfReader(io.BytesIO(pdf_bytes))
-        total_pages = len(reader.pages)
+        pdf_bytes = uploaded_file.getvalue()
+        doc_key = doc_hash(pdf_bytes)
+        total_pages = document_cache.page_count(pdf_bytes, doc_key)
         
         st.markdown(f"<h3>📄 Total Pages: {total_pages}</h3>", unsafe_allow_html=True)
         st.markdown("### Enter Watermark Text:")
@@ -546,17 +585,30 @@ def main():
         
         if st.button("💧 Add Watermark", type="primary"):
             if watermark_text:
-                watermarked_pdf = add_watermark(pdf_bytes, watermark_text)
-                st.success("✅ Watermark added successfully!")
-                
-                st.download_button(
-                    label="💾 Download Watermarked PDF",
-                    data=watermarked_pdf,
-                    file_name="watermarked_" + uploaded_file.name,
-                    mime="application/pdf"
-                )
+                try:
+                    watermarked_pdf = add_watermark(pdf_bytes, watermark_text, save_profile, key=doc_key)
+                except Exception as e:
+                    st.error(f"Error adding watermark: {str(e)}")
+                else:
+                    st.success("✅ Watermark added successfully!")
+                    
+                    st.download_button(
+                        label="💾 Download Watermarked PDF",
+                        data=watermarked_pdf,
+                        file_name="watermarked_" + uploaded_file.name,
+                        mime="application/pdf"
+                    )
             else:
                 st.error("❌ Please enter watermark text!")
+    
+    # Last, so the lookups and operations of this run are counted
+    with st.sidebar:
+        cache_stats = result_cache.stats()
+        st.caption(f"⚡ Result cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+                   f"{cache_stats['bytes'] / 1048576:.1f} MB")
+        if st.checkbox("🩺 Diagnostics", key="show_diagnostics",
+                       help="Wall time, CPU time, peak memory and pages of every operation this server process has run, by phase"):
+            show_diagnostics()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
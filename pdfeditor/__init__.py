@@ -0,0 +1,10 @@
+"""
+PDF engine behind the PDF Editor apps.
+
+The apps are front-ends: document operations (ops), queued edits (edits),
+save profiles (saving), per-session document storage (store), rendering,
+caching and performance metrics (metrics) live here and return results or raise, so they can be
+imported into batch jobs and worker processes without Streamlit. The
+session state and widgets the editing apps share (editor_session) are the
+one Streamlit module, imported only by the apps.
+"""
@@ -0,0 +1,5 @@
+import sys
+
+from pdfeditor.cli import main
+
+sys.exit(main())
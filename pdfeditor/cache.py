@@ -0,0 +1,248 @@
+"""
+Process-wide caches shared by the PDF Editor apps.
+
+Streamlit re-executes the app script on every interaction, but imported
+modules stay loaded, so anything kept here survives reruns and is shared
+by every session served by the same process.
+"""
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+import fitz  # PyMuPDF
+from PyPDF2 import PdfReader
+
+from pdfeditor.metrics import count_pages, instrumented
+
+DEFAULT_DOC_CACHE_BYTES = int(os.environ.get("PDFEDITOR_DOC_CACHE_MB", "512")) * 1024 * 1024
+
+
+def doc_hash(pdf_bytes):
+    """Return the SHA-256 hex digest identifying a PDF by its content"""
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+class LRUCache:
+    """Thread-safe LRU mapping bounded by the total size of its entries, counting get() hits and misses"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._lock = threading.RLock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, size):
+        """Store value, evicting least recently used entries to stay in budget"""
+        with self._lock:
+            self.pop(key)
+            if size > self.max_bytes:
+                # Never worth caching; keeping it would flush everything else
+                return
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, old_size) = self._entries.popitem(last=False)
+                self.current_bytes -= old_size
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return default
+            self.current_bytes -= entry[1]
+            return entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        """{"entries", "bytes", "max_bytes", "hits", "misses"}"""
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.current_bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses}
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class _Handle:
+    """A parsed document plus the lock serializing access to it"""
+
+    def __init__(self, document):
+        self.document = document
+        self.lock = threading.Lock()
+        # Set under the cache's lock once checkout() has taken the document
+        self.checked_out = False
+
+
+class DocumentCache:
+    """
+    Parsed PyMuPDF and PyPDF2 documents keyed by SHA-256 of their bytes.
+
+    Entries are evicted least recently used first once the summed size of
+    the source PDFs exceeds max_bytes. Evicted documents are not closed, so
+    callers still holding one can finish with it safely. Documents are
+    parsed outside the cache's lock, so a large one does not hold up
+    lookups of others; threads asking for one being parsed wait for it.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_DOC_CACHE_BYTES):
+        self._handles = LRUCache(max_bytes)
+        self._opening = {}  # key -> Future of the handle being parsed
+        self._lock = threading.Lock()
+
+    def _handle(self, kind, pdf_bytes, opener, key):
+        key = (kind, key or doc_hash(pdf_bytes))
+        with self._lock:
+            handle = self._handles.get(key)
+            if handle is not None:
+                return handle
+            opening = self._opening.get(key)
+            if opening is None:
+                opening = self._opening[key] = Future()
+                parse = True
+            else:
+                parse = False
+        if not parse:
+            return opening.result()
+        try:
+            handle = _Handle(opener(pdf_bytes))
+        except BaseException as e:
+            with self._lock:
+                del self._opening[key]
+            opening.set_exception(e)
+            raise
+        with self._lock:
+            self._handles.put(key, handle, len(pdf_bytes))
+            del self._opening[key]
+        opening.set_result(handle)
+        return handle
+
+    def _borrow(self, kind, pdf_bytes, opener, key):
+        while True:
+            handle = self._handle(kind, pdf_bytes, opener, key)
+            with handle.lock:
+                # checkout() may have taken it between the lookup and the lock
+                if not handle.checked_out:
+                    yield handle.document
+                    return
+
+    @contextmanager
+    def fitz_document(self, pdf_bytes, key=None):
+        """
+        Borrow the shared, read-only fitz document for pdf_bytes.
+
+        key is the doc_hash() of pdf_bytes when the caller already has it.
+        """
+        yield from self._borrow("fitz", pdf_bytes, _open_fitz, key)
+
+    @contextmanager
+    def reader(self, pdf_bytes, key=None):
+        """Borrow the shared PyPDF2 reader for pdf_bytes"""
+        yield from self._borrow("pypdf2", pdf_bytes, _open_reader, key)
+
+    def checkout(self, pdf_bytes, key=None):
+        """
+        Take a fitz document out of the cache for modification.
+
+        Nobody else can see the document while it is being edited. Hand it
+        back with checkin() once the edited bytes have been written; if the
+        edit fails the document is simply dropped. key is the doc_hash() of
+        pdf_bytes when the caller already has it.
+        """
+        key = ("fitz", key or doc_hash(pdf_bytes))
+        with self._lock:
+            handle = self._handles.pop(key)
+            if handle is not None:
+                handle.checked_out = True
+        if handle is None:
+            return _open_fitz(pdf_bytes)
+        # Wait for a borrower already reading it; later ones see checked_out
+        with handle.lock:
+            return handle.document
+
+    def checkin(self, pdf_bytes, pdf_document):
+        """Cache an edited fitz document under the hash of its written bytes"""
+        self._handles.put(("fitz", doc_hash(pdf_bytes)), _Handle(pdf_document), len(pdf_bytes))
+
+    def page_count(self, pdf_bytes, key=None):
+        with self.fitz_document(pdf_bytes, key) as pdf_document:
+            return pdf_document.page_count
+
+    def clear(self):
+        self._handles.clear()
+
+
+class _BufferStream(io.RawIOBase):
+    """Read-only file over a bytes-like object, without copying it like BytesIO does"""
+
+    def __init__(self, buffer):
+        self._buffer = memoryview(buffer)
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, target):
+        count = max(0, min(len(target), len(self._buffer) - self._position))
+        target[:count] = self._buffer[self._position:self._position + count]
+        self._position += count
+        return count
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        start = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: len(self._buffer)}[whence]
+        self._position = max(0, start + offset)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+
+@instrumented("parse", "fitz_open")
+def _open_fitz(pdf_bytes):
+    # fitz takes a memoryview (e.g. of a memory-mapped file) as-is
+    if not isinstance(pdf_bytes, (bytes, bytearray)):
+        pdf_bytes = memoryview(pdf_bytes)
+    pdf_document = fitz.open(stream=pdf_bytes, filetype="pdf")
+    count_pages(pdf_document.page_count)
+    return pdf_document
+
+
+@instrumented("parse", "pypdf2_open")
+def _open_reader(pdf_bytes):
+    if isinstance(pdf_bytes, bytes):
+        reader = PdfReader(io.BytesIO(pdf_bytes))
+    else:
+        reader = PdfReader(_BufferStream(pdf_bytes))
+    # Loads the page tree, which every operation on the reader needs
+    count_pages(len(reader.pages))
+    return reader
+
+
+document_cache = DocumentCache()
@@ -0,0 +1,231 @@
+"""
+Batch command line: run one operation over every PDF under some paths.
+
+    python -m pdfeditor docs/ "scans/**/*.pdf" -o out/ --workers 8 \
+        --manifest run.jsonl watermark --text CONFIDENTIAL
+
+Files are processed by a pool of worker processes that read their input
+and write their output themselves, so only paths and small results cross
+process boundaries and inputs are discovered as the run goes. Every
+finished file is appended to the manifest (JSON lines); a rerun with the
+same manifest skips files already done by the same job whose size and
+modification time have not changed, so an interrupted run picks up where
+it stopped.
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from pdfeditor.jobs import process_file
+from pdfeditor.saving import DEFAULT_SAVE_PROFILE, SAVE_PROFILES
+
+
+def glob_root(pattern):
+    """Directory part of a glob before its first wildcard, e.g. "in" for "in/**/*.pdf" """
+    parts = []
+    for part in pattern.replace(os.sep, "/").split("/")[:-1]:
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    return "/".join(parts) or ("/" if pattern.startswith("/") else ".")
+
+
+def _input_files(paths):
+    """(path, path relative to its input root) for every PDF under files, directories or globs"""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(".pdf"):
+                        full_path = os.path.join(root, name)
+                        yield full_path, os.path.relpath(full_path, path)
+        elif glob.has_magic(path):
+            root = glob_root(path)
+            for full_path in sorted(glob.iglob(path, recursive=True)):
+                if os.path.isfile(full_path):
+                    yield full_path, os.path.relpath(full_path, root)
+        elif os.path.isfile(path):
+            yield path, os.path.basename(path)
+
+
+def find_pdfs(paths):
+    """
+    Yield (path, path relative to its input root) for every PDF under files, directories or globs.
+
+    Raises ValueError when two inputs would be written to the same
+    relative path, before the second is yielded, so no result is
+    overwritten.
+    """
+    seen = set()
+    outputs = {}
+    for full_path, relative_path in _input_files(paths):
+        if full_path in seen:
+            continue
+        seen.add(full_path)
+        output_key = os.path.normcase(os.path.normpath(relative_path))
+        if output_key in outputs:
+            raise ValueError(f"{outputs[output_key]} and {full_path} would both be written to {relative_path}")
+        outputs[output_key] = full_path
+        yield full_path, relative_path
+
+
+def _file_key(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def load_manifest(path, job):
+    """{input path: (size, mtime)} of files the manifest records as done by job"""
+    done = {}
+    if not path or not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as manifest:
+        for line in manifest:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A run killed mid-write leaves a partial last line
+                continue
+            if entry.get("job") == job and entry.get("status") == "ok":
+                done[entry["input"]] = tuple(entry["file_key"])
+    return done
+
+
+def run_batch(job, paths, output_dir, workers=None, manifest_path=None, out=None):
+    """
+    Run job over every PDF under paths; returns run totals.
+
+    Inputs are all listed before any is processed, so when two would be
+    written to the same output (find_pdfs() raises) nothing is written.
+    """
+    workers = workers or os.cpu_count() or 1
+    out = out or sys.stdout
+    inputs = list(find_pdfs(paths))
+    done = load_manifest(manifest_path, job)
+    manifest = open(manifest_path, "a", encoding="utf-8") if manifest_path else None
+    totals = {"ok": 0, "error": 0, "skipped": 0, "bytes_in": 0, "bytes_out": 0}
+    start = time.perf_counter()
+
+    def record(result, input_path, file_key):
+        entry = dict(input=input_path, **result, job=job, file_key=file_key)
+        totals[entry["status"]] += 1
+        if entry["status"] == "ok":
+            totals["bytes_in"] += entry["bytes_in"]
+            totals["bytes_out"] += entry["bytes_out"]
+            print(f"ok    {entry['seconds']:8.3f}s  {entry['input']} -> {entry['output']} ({entry['detail']})", file=out)
+        else:
+            print(f"error {entry['seconds']:8.3f}s  {entry['input']}: {entry['error']}", file=out)
+        if manifest:
+            manifest.write(json.dumps(entry) + "\n")
+            manifest.flush()
+
+    def jobs():
+        for input_path, relative_path in inputs:
+            file_key = _file_key(input_path)
+            if done.get(input_path) == file_key:
+                totals["skipped"] += 1
+                continue
+            yield input_path, os.path.join(output_dir, relative_path), file_key
+
+    try:
+        if workers == 1:
+            for input_path, output_path, file_key in jobs():
+                record(process_file(job, [input_path], output_path), input_path, file_key)
+        else:
+            with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                # Keep a few files queued per worker instead of submitting
+                # the whole tree up front
+                pending = {}
+                try:
+                    for input_path, output_path, file_key in jobs():
+                        pending[pool.submit(process_file, job, [input_path], output_path)] = input_path, file_key
+                        if len(pending) >= workers * 4:
+                            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                            for future in finished:
+                                record(future.result(), *pending.pop(future))
+                finally:
+                    # Files already submitted are written either way, so
+                    # record them even if a later input failed to stat
+                    for future in list(pending):
+                        record(future.result(), *pending.pop(future))
+    finally:
+        if manifest:
+            manifest.close()
+
+    totals["seconds"] = round(time.perf_counter() - start, 3)
+    return totals
+
+
+def parse_color(value):
+    """ "1,1,0" -> (1.0, 1.0, 0.0)"""
+    parts = [float(part) for part in value.split(",")]
+    if len(parts) != 3 or not all(0 <= part <= 1 for part in parts):
+        raise argparse.ArgumentTypeError("color must be three numbers from 0 to 1, e.g. 1,1,0")
+    return tuple(parts)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m pdfeditor", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("paths", nargs="+", help="PDF files, directories (searched recursively) or globs")
+    parser.add_argument("-o", "--output", required=True, help="directory for the results, mirroring the inputs")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes (1 runs inline)")
+    parser.add_argument("--manifest", help="JSON-lines log of finished files; reruns skip what it records as done")
+    parser.add_argument("--profile", choices=list(SAVE_PROFILES),
+                        help=f"save profile for the outputs (default {DEFAULT_SAVE_PROFILE}; smallest for compact)")
+    operations = parser.add_subparsers(dest="op", required=True, metavar="operation")
+
+    extract = operations.add_parser("extract", help="keep only some pages")
+    extract.add_argument("--pages", required=True, help='pages to keep, e.g. "1-5,10"')
+
+    rotate = operations.add_parser("rotate", help="rotate pages")
+    rotate.add_argument("--angle", type=int, choices=[90, 180, 270], required=True)
+    rotate.add_argument("--pages", default="all", help='pages to rotate, e.g. "1-5,10" (default all)')
+
+    watermark = operations.add_parser("watermark", help="add a text watermark to every page")
+    watermark.add_argument("--text", required=True)
+
+    highlight = operations.add_parser("highlight", help="highlight every occurrence of a text")
+    highlight.add_argument("--text", required=True)
+    highlight.add_argument("--color", type=parse_color, default=(1, 1, 0), help="RGB from 0 to 1 (default 1,1,0)")
+    highlight.add_argument("--pages", default="all")
+
+    replace = operations.add_parser("replace", help="replace every occurrence of a text")
+    replace.add_argument("--old", required=True)
+    replace.add_argument("--new", required=True)
+    replace.add_argument("--pages", default="all")
+    replace.add_argument("--case-sensitive", action="store_true")
+    replace.add_argument("--redact", action="store_true", help="remove the old text instead of covering it")
+
+    redact = operations.add_parser("redact", help="remove everything inside a rectangle")
+    redact.add_argument("--page", type=int, required=True)
+    redact.add_argument("--rect", type=float, nargs=4, metavar=("X1", "Y1", "X2", "Y2"), required=True)
+
+    operations.add_parser("compact", help="drop unused objects and compress streams")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    job = {key: value for key, value in vars(args).items()
+           if key not in ("paths", "output", "workers", "manifest")}
+    # Keep the job JSON-shaped: it is compared with manifest entries
+    if "color" in job:
+        job["color"] = list(job["color"])
+
+    try:
+        totals = run_batch(job, args.paths, args.output, args.workers, args.manifest)
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    files = totals["ok"] + totals["error"]
+    rate = files / totals["seconds"] if totals["seconds"] else 0
+    print(f"\n{totals['ok']} ok, {totals['error']} failed, {totals['skipped']} skipped "
+          f"in {totals['seconds']:.1f}s ({rate:.1f} files/s, "
+          f"{totals['bytes_in'] / 1048576:.1f} MB in, {totals['bytes_out'] / 1048576:.1f} MB out)")
+    return 1 if totals["error"] else 0
@@ -0,0 +1,132 @@
+"""
+Shared-resource deduplication for merged documents.
+
+Documents made from the same template each embed their own copy of the
+template's fonts, logos and letterhead images, so merging N of them
+carries N copies. Here every stream is fingerprinted by its dictionary
+and a hash of its raw bytes, duplicates are redirected to the first copy,
+and the unreferenced copies are dropped when the file is rewritten.
+
+Resource dictionaries and arrays (fonts, font descriptors, graphics
+states, resource dicts, color spaces) only become identical once the
+streams they point at have been merged, so passes repeat until nothing
+new merges. Page, annotation and other dictionaries whose identity
+matters are never merged.
+"""
+import hashlib
+import os
+import re
+
+import fitz  # PyMuPDF
+
+from pdfeditor.metrics import count_pages, instrumented
+from pdfeditor.saving import save_options
+
+# /Type values of dictionaries that are pure resources
+RESOURCE_TYPES = {"/Font", "/FontDescriptor", "/ExtGState", "/Encoding", "/Pattern", "/Shading"}
+
+# Keys of an untyped /Resources dictionary
+RESOURCE_KEYS = {"Font", "XObject", "ExtGState", "ColorSpace", "Pattern", "Shading", "ProcSet", "Properties"}
+
+REFERENCE = re.compile(r"\b(\d+) 0 R\b")
+
+
+def _shareable(pdf_document, xref):
+    """Whether an object can stand in for an identical one without changing the document"""
+    if pdf_document.xref_is_stream(xref):
+        return True
+    source = pdf_document.xref_object(xref, compressed=True)
+    if source.startswith("["):
+        return True
+    if not source.startswith("<<"):
+        return False
+    kind, value = pdf_document.xref_get_key(xref, "Type")
+    if kind == "name":
+        return value in RESOURCE_TYPES
+    return set(pdf_document.xref_get_keys(xref)) <= RESOURCE_KEYS
+
+
+def dedupe_objects(pdf_document):
+    """
+    Redirect references to duplicate shareable objects to one copy.
+
+    Returns the number of objects made redundant; they stay in the file
+    until it is saved with garbage collection.
+    """
+    shareable = [xref for xref in range(1, pdf_document.xref_length()) if _shareable(pdf_document, xref)]
+    # Stream bytes never change here, only the references in dictionaries
+    stream_digests = {xref: hashlib.sha256(pdf_document.xref_stream_raw(xref)).digest()
+                      for xref in shareable if pdf_document.xref_is_stream(xref)}
+    redirected = {}
+    while True:
+        first_copy = {}
+        merged = {}
+        for xref in shareable:
+            if xref in redirected:
+                continue
+            key = (pdf_document.xref_object(xref, compressed=True), stream_digests.get(xref))
+            if key in first_copy:
+                merged[xref] = first_copy[key]
+            else:
+                first_copy[key] = xref
+        if not merged:
+            return len(redirected)
+        redirected.update(merged)
+        _redirect(pdf_document, merged, redirected)
+
+
+def _redirect(pdf_document, merged, redirected):
+    """Point references to merged objects at their kept copy"""
+    def replace(match):
+        return f"{merged.get(int(match.group(1)), match.group(1))} 0 R"
+
+    for xref in range(1, pdf_document.xref_length()):
+        if xref in redirected:
+            continue
+        if pdf_document.xref_is_stream(xref):
+            # update_object() would replace the stream's data too, so its
+            # dictionary is rewritten key by key
+            for key in pdf_document.xref_get_keys(xref):
+                value = pdf_document.xref_get_key(xref, key)[1]
+                updated = REFERENCE.sub(replace, value)
+                if updated != value:
+                    pdf_document.xref_set_key(xref, key, updated)
+            continue
+        source = pdf_document.xref_object(xref, compressed=True)
+        if " 0 R" not in source:
+            continue
+        updated = REFERENCE.sub(replace, source)
+        if updated != source:
+            pdf_document.update_object(xref, updated)
+
+
+@instrumented("edit")
+def dedupe_pdf_file(path, profile=None):
+    """
+    Deduplicate a PDF on disk in place, rewriting it with a save profile.
+
+    Returns {"objects": objects merged, "bytes_before", "bytes_after",
+    "bytes_saved"}; bytes_before is the size of the file rewritten with
+    the same profile but not deduplicated, which takes one more write.
+    """
+    options = save_options(profile)
+    if options:
+        with fitz.open(path) as pdf_document:
+            pdf_document.save(path + ".plain", **options)
+        bytes_before = os.path.getsize(path + ".plain")
+        os.remove(path + ".plain")
+    else:
+        bytes_before = os.path.getsize(path)
+    with fitz.open(path) as pdf_document:
+        count_pages(pdf_document.page_count)
+        objects = dedupe_objects(pdf_document)
+        if objects:
+            # garbage=2 at least drops the now unreferenced copies and renumbers
+            options["garbage"] = max(options.get("garbage", 0), 2)
+        if options:
+            pdf_document.save(path + ".dedupe", **options)
+    if options:
+        os.replace(path + ".dedupe", path)
+    bytes_after = os.path.getsize(path)
+    return {"objects": objects, "bytes_before": bytes_before, "bytes_after": bytes_after,
+            "bytes_saved": bytes_before - bytes_after}
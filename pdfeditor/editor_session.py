@@ -0,0 +1,217 @@
+"""
+Session state and widgets shared by the editing apps (main.py, pdf2.py):
+the working PDF with its undo history, the queue of pending edits, page
+selection, thumbnails, downloads and the live preview.
+
+The only module of the package that imports Streamlit; nothing else here
+imports it, so the engine still loads without it.
+"""
+import uuid
+
+import streamlit as st
+
+from pdfeditor.cache import document_cache
+from pdfeditor.edits import apply_edits, compact_pdf, describe_edit
+from pdfeditor.pages import parse_page_numbers
+from pdfeditor.render import render_pages, render_preview_pages
+from pdfeditor.saving import compare_profiles, save_options
+from pdfeditor.store import document_store
+
+
+def init_session_state():
+    """Default session values, set on the first run"""
+    if 'store_session' not in st.session_state:
+        st.session_state.store_session = uuid.uuid4().hex
+    if 'original_pdf' not in st.session_state:
+        st.session_state.original_pdf = None
+    if 'modified_pdf' not in st.session_state:
+        st.session_state.modified_pdf = None
+    if 'pending_edits' not in st.session_state:
+        st.session_state.pending_edits = []
+    if 'history' not in st.session_state:
+        st.session_state.history = None
+
+
+def store_pdf(pdf_bytes):
+    """Keep a PDF in this session's part of the document store, which may spill it to disk"""
+    return document_store.put(st.session_state.store_session, pdf_bytes)
+
+
+def set_working_pdf(document, label):
+    """Replace the working PDF (a stored PDF), recording the change in the undo history"""
+    st.session_state.history.record(document, label)
+    st.session_state.modified_pdf = document
+
+
+def undo_edit():
+    st.session_state.modified_pdf = st.session_state.history.undo()
+
+
+def redo_edit():
+    st.session_state.modified_pdf = st.session_state.history.redo()
+
+
+def show_history_controls():
+    """Undo/redo buttons for the working PDF"""
+    history = st.session_state.history
+    col_a, col_b, col_c = st.columns([1, 1, 2])
+    with col_a:
+        st.button("↩️ Undo", key="undo_btn", on_click=undo_edit, disabled=not history.can_undo(),
+                  help=f"Undo: {history.undo_label()}" if history.can_undo() else None)
+    with col_b:
+        st.button("↪️ Redo", key="redo_btn", on_click=redo_edit, disabled=not history.can_redo(),
+                  help=f"Redo: {history.redo_label()}" if history.can_redo() else None)
+    with col_c:
+        st.caption(f"Version {history.position} of {len(history.steps)} · history {history.stored_bytes / 1024:.1f} KB")
+
+
+def queue_edit(edit):
+    """Add an edit to the pending queue, applied later together with the others"""
+    st.session_state.pending_edits.append(edit)
+    st.toast(f"🕒 Queued: {describe_edit(edit)}")
+
+
+def commit_pending_edits():
+    """Button callback: apply every pending edit with one open and one write"""
+    try:
+        output, reports = apply_edits(
+            st.session_state.modified_pdf.data,
+            st.session_state.pending_edits,
+            incremental=st.session_state.get("incremental_save", True),
+            profile=st.session_state.get("save_profile"),
+            key=st.session_state.modified_pdf.key
+        )
+    except Exception as e:
+        st.session_state.edit_error = f"Error applying edits: {str(e)}"
+        return
+    edits = st.session_state.pending_edits
+    set_working_pdf(store_pdf(output), f"Apply {len(edits)} edit{'s' if len(edits) > 1 else ''}")
+    st.session_state.pending_edits = []
+    st.session_state.edit_reports = reports
+
+
+def discard_pending_edits():
+    st.session_state.pending_edits = []
+
+
+def show_pending_edits():
+    """List queued edits with apply/discard buttons, then the outcome of the last apply"""
+    pending = st.session_state.pending_edits
+    if pending:
+        st.markdown(f"#### 🕒 Pending Edits ({len(pending)})")
+        for edit in pending:
+            st.markdown(f"- {describe_edit(edit)}")
+
+        col_a, col_b = st.columns(2)
+        with col_a:
+            st.button(f"✅ Apply {len(pending)} Edits", type="primary", use_container_width=True,
+                      key="apply_edits", on_click=commit_pending_edits)
+        with col_b:
+            st.button("🗑️ Discard", use_container_width=True,
+                      key="discard_edits", on_click=discard_pending_edits)
+
+    if "edit_error" in st.session_state:
+        st.error(st.session_state.pop("edit_error"))
+    for report in st.session_state.pop("edit_reports", []):
+        if report["count"] > 0:
+            st.success(f"✅ {describe_edit(report['edit'])}: {report['count']} changes on pages {', '.join(map(str, report['pages']))}")
+        else:
+            st.warning(f"⚠️ {describe_edit(report['edit'])}: text not found")
+        if report.get("term_pages"):
+            with st.expander("📊 Matches per term and page"):
+                st.dataframe(
+                    [{"Term": text, "Page": page, "Matches": count}
+                     for text, pages in report["term_pages"].items() for page, count in pages.items()],
+                    use_container_width=True
+                )
+
+
+def parse_page_selection(selection_str, total_pages):
+    """Parse page selection: 2,10,45 or 21-45 or 1-5,10,15-20"""
+    pages, errors = parse_page_numbers(selection_str, total_pages)
+    for error in errors:
+        st.error(f"❌ {error}")
+    return pages
+
+
+def pdf_to_images(document, page_numbers=None, tier="thumbnail"):
+    """(page number, image) pairs for 0-indexed pages of a stored PDF (default all)"""
+    try:
+        pdf_bytes, key = document.data, document.key
+        total_pages = document_cache.page_count(pdf_bytes, key)
+        if page_numbers is None:
+            page_numbers = range(total_pages)
+        page_numbers = [page_num for page_num in page_numbers if page_num < total_pages]
+        rendered = render_pages(pdf_bytes, page_numbers, tier, key=key, path=document.path)
+        return [(page_num + 1, img) for page_num, img in zip(page_numbers, rendered)]
+    except Exception as e:
+        st.error(f"Error: {str(e)}")
+        return []
+
+
+def download_data():
+    """Working PDF for the download button; pending edits are applied only when it is clicked"""
+    document = st.session_state.modified_pdf
+    edits = list(st.session_state.pending_edits)
+    incremental = st.session_state.get("incremental_save", True)
+    profile = st.session_state.get("save_profile")
+    # Always deferred, so a rerun does not hand Streamlit another copy
+    if not save_options(profile):
+        if not edits:
+            return lambda: bytes(document.data)
+        return lambda: apply_edits(document.data, edits, incremental, key=document.key)[0]
+    # Any other profile rewrites the whole file, so the download is one
+    # full write of the working PDF with the queue applied
+    if not edits:
+        return lambda: compact_pdf(document.data, profile, document.key)
+    return lambda: apply_edits(document.data, edits, profile=profile, key=document.key)[0]
+
+
+def show_profile_comparison():
+    """Size and write time of the working PDF under each save profile, measured on request once per version"""
+    document = st.session_state.modified_pdf
+    # Writing the document once per profile takes seconds on large files
+    comparisons = st.session_state.setdefault("profile_comparisons", {})
+    st.markdown("#### 🗜️ Save Profiles")
+    if st.button("📊 Compare save profiles", key="compare_profiles_btn") and document.key not in comparisons:
+        comparisons[document.key] = compare_profiles(document.data)
+    if document.key in comparisons:
+        st.dataframe(
+            [{"Profile": row["profile"], "Size (KB)": round(row["bytes"] / 1024, 1), "Seconds": row["seconds"]}
+             for row in comparisons[document.key]],
+            use_container_width=True,
+            hide_index=True
+        )
+
+
+def show_pdf_preview(document, lineage=None):
+    """
+    Live preview of a stored PDF showing only the current page(s) as cached images.
+    
+    lineage is the original upload: pages whose content did not change
+    since an earlier version reuse that version's render.
+    """
+    pdf_bytes, key = document.data, document.key
+    lineage_key = lineage.key if lineage is not None else key
+    total_pages = document_cache.page_count(pdf_bytes, key)
+    
+    # Pages can disappear after an extraction
+    if st.session_state.get("preview_page", 1) > total_pages:
+        st.session_state.preview_page = total_pages
+    
+    col_a, col_b = st.columns([2, 1])
+    with col_a:
+        first_page = st.number_input(
+            f"Page (1-{total_pages})",
+            min_value=1,
+            max_value=total_pages,
+            value=1,
+            key="preview_page"
+        )
+    with col_b:
+        pages_shown = st.selectbox("Pages shown", [1, 2, 4], key="preview_count")
+    
+    page_numbers = range(first_page - 1, min(first_page - 1 + pages_shown, total_pages))
+    images = render_preview_pages(pdf_bytes, page_numbers, lineage_key, key=key)
+    for page_num, image_bytes in zip(page_numbers, images):
+        st.image(image_bytes, caption=f"Page {page_num + 1} of {total_pages}", use_container_width=True)
@@ -0,0 +1,406 @@
+"""
+Queued text edits applied to a document in a single pass.
+
+Each edit is a plain dict such as {"op": "highlight", "text": ..., ...}
+so a list of them can sit in Streamlit session state. apply_edits() opens
+the document once, loads every touched page once, runs that page's edits
+in queue order and writes the result once, however many edits are queued.
+Text searches only visit the pages the document's text index says can
+contain the term.
+
+With incremental=True only the changed objects are appended to the
+original bytes (a PDF incremental update), so writing costs about the size
+of the edit rather than the size of the document; the original bytes are
+still copied into the output once, in memory. Each such save leaves
+the superseded objects in the file; compact_pdf() does a full rewrite
+that drops them. Full rewrites use a save profile, see saving.py.
+"""
+import csv
+import io
+import json
+from collections import Counter, defaultdict
+from functools import lru_cache
+
+import fitz  # PyMuPDF
+
+from pdfeditor.cache import document_cache
+from pdfeditor.metrics import count_pages, instrumented, measure
+from pdfeditor.saving import save_options, write_document
+from pdfeditor.terms import get_matcher, page_matches, term, word_matches
+from pdfeditor.textindex import get_text_index, page_words
+
+
+def highlight_edit(text, color, pages="all"):
+    """Highlight every instance of text; pages is "all" or 1-indexed page numbers"""
+    return {"op": "highlight", "text": text, "color": tuple(color), "pages": pages}
+
+
+def highlight_terms_edit(terms, pages="all"):
+    """Highlight every term of a list, each in its own color; see terms.term()"""
+    return {"op": "highlight_terms", "terms": list(terms), "pages": pages}
+
+
+def replace_edit(old_text, new_text, pages="all", case_sensitive=False, redact=False):
+    """
+    Put new_text where old_text is.
+
+    By default old_text is covered with a white box and new_text drawn on
+    top; with redact=True old_text is removed from the page instead.
+    """
+    return {"op": "replace", "old_text": old_text, "new_text": new_text,
+            "pages": pages, "case_sensitive": case_sensitive, "redact": redact}
+
+
+def replace_map_edit(replacements, pages="all", case_sensitive=False, whole_word=False):
+    """
+    Replace many texts at once; replacements is a list of (old, new) pairs.
+
+    Old text is redacted, so it is removed from the page rather than
+    covered, and the new text is written in its place.
+    """
+    return {"op": "replace_map", "replacements": [list(pair) for pair in replacements],
+            "pages": pages, "case_sensitive": case_sensitive, "whole_word": whole_word}
+
+
+# Header rows skipped at the top of a CSV mapping
+MAPPING_HEADERS = [["old", "new"], ["find", "replace"], ["from", "to"], ["search", "replace"]]
+
+
+def parse_replacements(data, filename):
+    """
+    Read (old, new) pairs from a CSV or JSON mapping file.
+
+    CSV has two columns, optionally under an old,new style header. JSON is
+    an {"old": "new"} object or a list of [old, new] pairs or
+    {"old": ..., "new": ...} objects. Raises ValueError for anything else.
+    """
+    text = data.decode("utf-8-sig") if isinstance(data, bytes) else data
+    if filename.lower().endswith(".json"):
+        try:
+            mapping = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON: {e}")
+        if isinstance(mapping, dict):
+            rows = list(mapping.items())
+        elif isinstance(mapping, list):
+            rows = [(row["old"], row["new"]) if isinstance(row, dict) else row for row in mapping]
+        else:
+            raise ValueError("JSON mapping must be an object or a list")
+    else:
+        rows = [row for row in csv.reader(io.StringIO(text)) if row]
+        if rows and [cell.strip().lower() for cell in rows[0][:2]] in MAPPING_HEADERS:
+            rows = rows[1:]
+
+    replacements = []
+    for number, row in enumerate(rows, 1):
+        if len(row) != 2 or not all(isinstance(cell, str) for cell in row):
+            raise ValueError(f"Row {number}: expected an old and a new text, got {row!r}")
+        if row[0].strip():
+            replacements.append((row[0].strip(), row[1].strip()))
+    return replacements
+
+
+def add_text_edit(page, text, x, y, font_size, color):
+    """Write text at (x, y) on a 1-indexed page"""
+    return {"op": "add_text", "pages": [page], "text": text, "point": (x, y),
+            "font_size": font_size, "color": tuple(color)}
+
+
+def redact_edit(page, x1, y1, x2, y2):
+    """Permanently remove content inside a rectangle on a 1-indexed page"""
+    return {"op": "redact", "pages": [page], "rect": (x1, y1, x2, y2)}
+
+
+def describe_edit(edit):
+    """One-line, human readable summary of an edit"""
+    pages = edit["pages"]
+    where = "all pages" if pages == "all" else "page " + ", ".join(map(str, pages))
+    if edit["op"] == "highlight":
+        return f"Highlight '{edit['text']}' on {where}"
+    if edit["op"] == "highlight_terms":
+        return f"Highlight {len(edit['terms'])} terms on {where}"
+    if edit["op"] == "replace":
+        return f"Replace '{edit['old_text']}' with '{edit['new_text']}' on {where}"
+    if edit["op"] == "replace_map":
+        return f"Replace {len(edit['replacements'])} texts on {where}"
+    if edit["op"] == "add_text":
+        return f"Add text '{edit['text']}' on {where}"
+    return f"Redact area {edit['rect']} on {where}"
+
+
+@lru_cache(maxsize=1)
+def replacement_font():
+    """Font for replacement text, shared by every page's text writer"""
+    return fitz.Font("helv")
+
+
+def _redact_match(page, writer, match, new_text):
+    """Mark a match for redaction and queue its replacement on the page's text writer"""
+    for rect in match.rects:
+        page.add_redact_annot(rect, fill=(1, 1, 1), cross_out=False)
+    if new_text:
+        font = replacement_font()
+        # Keep the matched text's size unless the new text would not fit
+        width = font.text_length(new_text, fontsize=1)
+        font_size = min(match.font_size, match.rects[0].width / width) if width else match.font_size
+        writer.append(match.origin, new_text, font=font, fontsize=font_size)
+
+
+def _highlight(page, edit, writer):
+    with measure("search", "search_for"):
+        text_instances = page.search_for(edit["text"])
+        count_pages(1)
+    for inst in text_instances:
+        highlight = page.add_highlight_annot(inst)
+        highlight.set_colors(stroke=edit["color"])
+        highlight.update()
+    return len(text_instances)
+
+
+def _highlight_terms(page, edit, writer):
+    term_rects = defaultdict(list)
+    counts = Counter()
+    for index, rects in word_matches(page_words(page), get_matcher(edit["terms"])):
+        term_rects[index].extend(rects)
+        counts[index] += 1
+    # One annotation per term, with a quad per match
+    for index, rects in term_rects.items():
+        highlight = page.add_highlight_annot(rects)
+        highlight.set_colors(stroke=edit["terms"][index]["color"])
+        highlight.update()
+    return counts
+
+
+def _replace(page, edit, writer):
+    matcher = get_matcher([term(edit["old_text"], case_sensitive=edit["case_sensitive"])])
+    matches = list(page_matches(page, matcher, overlapping=not edit.get("redact")))
+    for match in matches:
+        if edit.get("redact"):
+            _redact_match(page, writer, match, edit["new_text"])
+            continue
+
+        # Add white rectangles to cover old text
+        for rect in match.rects:
+            page.draw_rect(rect, color=(1, 1, 1), fill=(1, 1, 1))
+
+        # Add new text at the same position
+        page.insert_text(
+            match.rects[0].top_left,
+            edit["new_text"],
+            fontsize=11,
+            color=(0, 0, 0)
+        )
+    return len(matches)
+
+
+def _replacement_matcher(edit):
+    return get_matcher([term(old, case_sensitive=edit["case_sensitive"], whole_word=edit["whole_word"])
+                        for old, _ in edit["replacements"]])
+
+
+def _replace_map(page, edit, writer):
+    counts = Counter()
+    for match in page_matches(page, _replacement_matcher(edit), overlapping=False):
+        _redact_match(page, writer, match, edit["replacements"][match.index][1])
+        counts[match.index] += 1
+    return counts
+
+
+def _add_text(page, edit, writer):
+    page.insert_text(
+        edit["point"],
+        edit["text"],
+        fontsize=edit["font_size"],
+        color=edit["color"]
+    )
+    return 1
+
+
+def _redact(page, edit, writer):
+    # Applied together with the page's other redactions, see apply_edits()
+    page.add_redact_annot(fitz.Rect(edit["rect"]), fill=(1, 1, 1))
+    return 1
+
+
+EDIT_HANDLERS = {
+    "highlight": _highlight,
+    "highlight_terms": _highlight_terms,
+    "replace": _replace,
+    "replace_map": _replace_map,
+    "add_text": _add_text,
+    "redact": _redact,
+}
+
+# Edits that only change pages where their text is found
+SEARCH_EDITS = {"highlight", "highlight_terms", "replace", "replace_map"}
+
+# Edits that can change a page's text
+TEXT_EDITS = {"replace", "replace_map", "add_text", "redact"}
+
+
+def _redacts(edit):
+    """Whether an edit removes content through redaction annotations"""
+    return edit["op"] in ("redact", "replace_map") or (edit["op"] == "replace" and edit.get("redact"))
+
+
+def run_edits(pdf_document, edits, text_index=None):
+    """
+    Run edits on an open fitz document, loading each touched page once.
+
+    Per page, all redactions are applied together after the page's edits,
+    then the replacement text they queued is written in one go through a
+    single TextWriter.
+
+    text_index, the TextIndex of the document before the edits, lets
+    searching edits skip pages that cannot contain their text.
+
+    Returns one report per edit: {"edit": edit, "count": matches or
+    changes, "pages": 1-indexed pages changed, "invalid_pages": requested
+    pages outside the document}. Reports of multi-term edits also have
+    "term_pages": {term: {page: matches}}.
+    """
+    page_count = pdf_document.page_count
+    reports = [{"edit": edit, "count": 0, "pages": [], "invalid_pages": []} for edit in edits]
+
+    # Group edits by page, keeping queue order within each page
+    page_edits = defaultdict(list)
+    changed_pages = set()
+    for index, edit in enumerate(edits):
+        pages = []
+        for page in range(1, page_count + 1) if edit["pages"] == "all" else edit["pages"]:
+            if 1 <= page <= page_count:
+                pages.append(page - 1)
+            else:
+                reports[index]["invalid_pages"].append(page)
+        if text_index is not None and edit["op"] in SEARCH_EDITS:
+            # The index predates the queue: pages an earlier edit may have
+            # changed text on are searched regardless
+            candidates = set(_candidate_pages(text_index, edit, pages))
+            pages = [page for page in pages if page in candidates or page in changed_pages]
+        if edit["op"] in TEXT_EDITS:
+            changed_pages.update(pages)
+        for page in pages:
+            page_edits[page].append(index)
+
+    count_pages(len(page_edits))
+    for page_num in sorted(page_edits):
+        page = pdf_document[page_num]
+        writer = fitz.TextWriter(page.rect)
+        for index in page_edits[page_num]:
+            count = EDIT_HANDLERS[edits[index]["op"]](page, edits[index], writer)
+            if isinstance(count, Counter):
+                term_pages = reports[index].setdefault("term_pages", {})
+                for term_index, term_count in count.items():
+                    term_pages.setdefault(_term_text(edits[index], term_index), {})[page_num + 1] = term_count
+                count = sum(count.values())
+            if count:
+                reports[index]["count"] += count
+                reports[index]["pages"].append(page_num + 1)
+        if any(_redacts(edits[index]) for index in page_edits[page_num]):
+            page.apply_redactions()
+        if not writer.text_rect.is_empty:
+            writer.write_text(page)
+
+    return reports
+
+
+def _term_text(edit, term_index):
+    if edit["op"] == "replace_map":
+        return edit["replacements"][term_index][0]
+    return edit["terms"][term_index]["text"]
+
+
+def _candidate_pages(text_index, edit, pages):
+    """Pages the text index says a searching edit can match on"""
+    if edit["op"] in ("highlight_terms", "replace_map"):
+        matcher = get_matcher(edit["terms"]) if edit["op"] == "highlight_terms" else _replacement_matcher(edit)
+        return [page for page in pages if page not in text_index or matcher.search(text_index.page_text(page))]
+    return text_index.candidate_pages(edit["text"] if edit["op"] == "highlight" else edit["old_text"], pages)
+
+
+@instrumented("edit")
+def apply_edits(pdf_bytes, edits, incremental=False, profile=None, key=None):
+    """
+    Apply queued edits with one open and one write.
+
+    key is the doc_hash() of pdf_bytes when the caller already has it.
+    Returns (output bytes, reports), see run_edits(). With incremental=True
+    the output is pdf_bytes plus an appended update, otherwise the document
+    is rewritten with the save profile. Queues containing a
+    redaction (including bulk and redacting replacements) are always fully rewritten: an
+    incremental update would keep the redacted content in the file's
+    earlier revision.
+    """
+    text_index = None
+    search_edits = [edit for edit in edits if edit["op"] in SEARCH_EDITS]
+    if search_edits:
+        # Only the pages the searches are limited to need indexing
+        pages = None
+        if all(edit["pages"] != "all" for edit in search_edits):
+            pages = {page - 1 for edit in search_edits for page in edit["pages"]}
+        text_index = get_text_index(pdf_bytes, key, pages)
+
+    if incremental and not any(_redacts(edit) for edit in edits):
+        result = _apply_incremental(pdf_bytes, edits, text_index)
+        if result is not None:
+            return result
+
+    pdf_document = document_cache.checkout(pdf_bytes, key)
+    reports = run_edits(pdf_document, edits, text_index)
+    options = save_options(profile)
+    if any(_redacts(edit) for edit in edits):
+        # Applied redaction annotations leave their appearance streams
+        # behind; drop them (and compress the rewritten content) so output
+        # does not grow with every replacement, whatever the profile
+        options["garbage"] = max(options.get("garbage", 0), 1)
+        options["deflate"] = True
+    with measure("save", "write"):
+        count_pages(pdf_document.page_count)
+        output = pdf_document.write(**options)
+    document_cache.checkin(output, pdf_document)
+    return output, reports
+
+
+def _apply_incremental(pdf_bytes, edits, text_index=None):
+    """
+    Incremental save; None if the document cannot be updated incrementally.
+
+    Only the changed objects are written, in memory, but the output still
+    holds a copy of pdf_bytes, so a large document costs one memory copy.
+    """
+    # Not the cached document: an incremental write appends everything
+    # changed since the document was opened, which for one that was already
+    # written is more than this edit and no longer fits pdf_bytes
+    pdf_document = fitz.open(stream=pdf_bytes, filetype="pdf")
+    try:
+        if not pdf_document.can_save_incrementally():
+            return None
+        reports = run_edits(pdf_document, edits, text_index)
+        with measure("save", "save_incremental"):
+            output = _write_incremental(pdf_document)
+    finally:
+        pdf_document.close()
+    return output, reports
+
+
+def _write_incremental(pdf_document):
+    """Bytes the document was opened from, followed by an update with its changes"""
+    # Document.save() appends only to the file the document was opened
+    # from; MuPDF's writer copies the source into any output
+    mupdf = fitz.mupdf
+    buffer = mupdf.FzBuffer(0)
+    output = mupdf.FzOutput(buffer)
+    options = mupdf.PdfWriteOptions()
+    options.do_incremental = 1
+    mupdf.pdf_write_document(mupdf.PdfDocument(pdf_document.this), output, options)
+    output.fz_close_output()
+    return mupdf.fz_buffer_extract_copy(buffer)
+
+
+@instrumented("save")
+def compact_pdf(pdf_bytes, profile="smallest", key=None):
+    """Full rewrite that folds incremental updates in and drops unused objects"""
+    pdf_document = document_cache.checkout(pdf_bytes, key)
+    output = write_document(pdf_document, profile)
+    document_cache.checkin(output, pdf_document)
+    return output
@@ -0,0 +1,129 @@
+"""
+Undo/redo history for a working PDF.
+
+Rather than a full copy per version, each step stores a delta against the
+version before it. An incremental save only appends to the previous
+bytes, so its step is just the appended tail, and undoing it is a
+truncation rather than a parse and write: the earlier version becomes a
+view of the current one's storage, neither copied nor hashed again, and
+the version undone is kept for redo. Full rewrites (redactions,
+extraction, compaction) cannot be expressed as a tail and are kept as
+snapshots. When the steps outgrow the memory budget the oldest ones are
+folded into the base version and can no longer be undone.
+
+Versions are StoredPDF documents (see store.py), so whole versions can be
+spilled to disk; versions rebuilt by undo are stored in the same session
+as the one they derive from.
+"""
+import os
+from collections import namedtuple
+
+DEFAULT_HISTORY_BYTES = int(os.environ.get("PDFEDITOR_HISTORY_MB", "256")) * 1024 * 1024
+
+# kind is "append" (data is the bytes appended to the previous version) or
+# "snapshot" (data is the StoredPDF of the whole new version); key is the
+# previous version's doc_hash()
+Step = namedtuple("Step", "label kind data key")
+
+
+class History:
+    """Linear version history of one document, starting from its upload"""
+
+    def __init__(self, document, max_bytes=DEFAULT_HISTORY_BYTES):
+        self.max_bytes = max_bytes
+        self.base = document
+        self.steps = []
+        self.position = 0
+        self.current = document
+        # Versions undone, latest last, so redo needs no rebuilding
+        self.undone = []
+
+    @property
+    def stored_bytes(self):
+        """Memory held by deltas and snapshots, not counting the base version"""
+        return sum(len(step.data) for step in self.steps)
+
+    def can_undo(self):
+        return self.position > 0
+
+    def can_redo(self):
+        return self.position < len(self.steps)
+
+    def undo_label(self):
+        return self.steps[self.position - 1].label if self.can_undo() else None
+
+    def redo_label(self):
+        return self.steps[self.position].label if self.can_redo() else None
+
+    def record(self, document, label):
+        """Make document the current version, discarding anything that could be redone"""
+        if document is self.current:
+            return
+        del self.steps[self.position:]
+        del self.undone[:]
+        pdf_bytes, current = document.data, self.current.data
+        if _extends(pdf_bytes, current):
+            step = Step(label, "append", bytes(memoryview(pdf_bytes)[len(current):]), self.current.key)
+        else:
+            step = Step(label, "snapshot", document, self.current.key)
+        self.steps.append(step)
+        self.position += 1
+        self.current = document
+        self._trim()
+
+    def undo(self):
+        """Step back one version and return it"""
+        if not self.can_undo():
+            return self.current
+        self.position -= 1
+        step = self.steps[self.position]
+        self.undone.append(self.current)
+        if step.kind == "append":
+            self.current = self.current.prefix(len(self.current) - len(step.data), step.key)
+        else:
+            self.current = self._version(self.position)
+        return self.current
+
+    def redo(self):
+        """Step forward one version and return it"""
+        if not self.can_redo():
+            return self.current
+        self.position += 1
+        self.current = self.undone.pop()
+        return self.current
+
+    def _version(self, position):
+        """A version before the current one, rebuilt from the nearest snapshot (or the base) unless still stored"""
+        key = self.steps[position].key
+        stored = self.current.store.get(self.current.session_id, key)
+        if stored is not None:
+            return stored
+        start = position
+        while start > 0 and self.steps[start - 1].kind != "snapshot":
+            start -= 1
+        document = self.steps[start - 1].data if start else self.base
+        if start == position:
+            return document
+        return document.derive(b"".join([document.data] + [step.data for step in self.steps[start:position]]), key)
+
+    def _trim(self):
+        """Fold the oldest steps into the base until the rest fit in the budget"""
+        size = self.stored_bytes
+        drop = 0
+        while size > self.max_bytes and drop < self.position:
+            size -= len(self.steps[drop].data)
+            drop += 1
+        if drop:
+            self.base = self.current if drop == self.position else self._version(drop)
+            del self.steps[:drop]
+            self.position -= drop
+
+
+def _extends(pdf_bytes, prefix):
+    """Whether pdf_bytes is prefix with something appended"""
+    if len(pdf_bytes) <= len(prefix):
+        return False
+    if isinstance(pdf_bytes, bytes):
+        return pdf_bytes.startswith(prefix)
+    # A memory-mapped version; comparing views reads it without a copy
+    return pdf_bytes[:len(prefix)] == prefix
@@ -0,0 +1,167 @@
+"""
+Jobs for the batch command line and the HTTP service.
+
+A job is a JSON-ready dict naming an operation and its parameters, e.g.
+{"op": "rotate", "angle": 90, "pages": "1-3"}. Page selections are text
+resolved against each document, so one job can run over many files. An
+optional "profile" names the save profile for the output (saving.py).
+process_file() is the worker-process entry point: it reads its inputs
+and writes its output itself, so only paths and a small result dict
+cross process boundaries. The dict carries the job's operation metrics
+(metrics.py) for the parent to merge.
+"""
+import io
+import os
+import time
+import zipfile
+
+from pdfeditor import ops
+from pdfeditor.cache import document_cache
+from pdfeditor.edits import compact_pdf
+from pdfeditor.metrics import operation_metrics
+from pdfeditor.pages import parse_page_numbers
+from pdfeditor.textindex import text_index_cache
+
+
+def _selected_pages(pdf_bytes, selection):
+    """1-indexed pages of a "1-5,10" selection; raises ValueError on bad parts"""
+    total_pages = document_cache.page_count(pdf_bytes)
+    if selection == "all":
+        return list(range(1, total_pages + 1))
+    pages, errors = parse_page_numbers(selection, total_pages)
+    if errors:
+        raise ValueError("; ".join(errors))
+    return pages
+
+
+def _extract(pdf_bytes, job):
+    pages = _selected_pages(pdf_bytes, job["pages"])
+    return ops.extract_pages_by_numbers(pdf_bytes, pages, job.get("profile")), f"{len(pages)} pages"
+
+
+def _rotate(pdf_bytes, job):
+    pages = _selected_pages(pdf_bytes, job["pages"])
+    rotations = {page - 1: job["angle"] for page in pages}
+    return ops.rotate_pages(pdf_bytes, rotations, job.get("profile")), f"{len(pages)} pages rotated"
+
+
+def _watermark(pdf_bytes, job):
+    return ops.add_watermark(pdf_bytes, job["text"], job.get("profile")), "watermarked"
+
+
+def _edit_pages(pdf_bytes, selection):
+    return "all" if selection == "all" else _selected_pages(pdf_bytes, selection)
+
+
+def _highlight(pdf_bytes, job):
+    output, report = ops.highlight_text(pdf_bytes, job["text"], job["color"], _edit_pages(pdf_bytes, job["pages"]),
+                                        job.get("profile"))
+    return output, f"{report['count']} highlights"
+
+
+def _replace(pdf_bytes, job):
+    output, report = ops.replace_text(pdf_bytes, job["old"], job["new"], _edit_pages(pdf_bytes, job["pages"]),
+                                      job["case_sensitive"], job["redact"], job.get("profile"))
+    return output, f"{report['count']} replacements"
+
+
+def _redact(pdf_bytes, job):
+    output, _ = ops.redact_area(pdf_bytes, job["page"], *job["rect"], profile=job.get("profile"))
+    return output, f"page {job['page']} redacted"
+
+
+def _compact(pdf_bytes, job):
+    # A compaction without a profile asks for the smallest file
+    return compact_pdf(pdf_bytes, job.get("profile") or "smallest"), "compacted"
+
+
+def _split(pdf_bytes, job):
+    total_pages = document_cache.page_count(pdf_bytes)
+    for point in job["points"]:
+        if not 1 <= point < total_pages:
+            raise ValueError(f"Split point {point} out of range (1-{total_pages - 1})")
+    pdfs = ops.split_pdf(pdf_bytes, set(job["points"]), job.get("profile"))
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zip_file:
+        for i, part in enumerate(pdfs, 1):
+            zip_file.writestr(f"part_{i}.pdf", part)
+    return archive.getvalue(), f"{len(pdfs)} parts"
+
+
+OPERATIONS = {
+    "extract": _extract,
+    "rotate": _rotate,
+    "watermark": _watermark,
+    "highlight": _highlight,
+    "replace": _replace,
+    "redact": _redact,
+    "compact": _compact,
+    "split": _split,
+}
+
+# Operations whose result is not a single PDF
+OUTPUT_TYPES = {"split": ("application/zip", ".zip")}
+
+
+def run_operation(job, inputs):
+    """Run job on a list of PDF bytes; returns (output bytes, one-line detail)"""
+    if job["op"] == "merge":
+        return ops.merge_pdfs(inputs, job.get("profile")), f"{len(inputs)} files merged"
+    if job["op"] not in OPERATIONS:
+        raise ValueError(f"Unknown operation: {job['op']}")
+    if len(inputs) != 1:
+        raise ValueError(f"{job['op']} takes one PDF, got {len(inputs)}")
+    return OPERATIONS[job["op"]](inputs[0], job)
+
+
+def process_file(job, input_paths, output_path):
+    """
+    Worker entry point: run job on files and write the result to output_path.
+
+    Returns a JSON-ready entry with status "ok" (plus detail and sizes) or
+    "error" (plus the message), and "metrics": operation_metrics rows of
+    this job alone; failures do not raise.
+    """
+    start = time.perf_counter()
+    entry = {"output": output_path}
+    # Jobs run inline (cli.py --workers 1) share the caller's totals, so
+    # this job's share is the difference
+    metrics_before = operation_metrics.snapshot()
+    try:
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        # Write under a temporary name so a killed run never leaves a
+        # truncated file behind
+        partial_path = output_path + ".partial"
+        bytes_in = sum(os.path.getsize(input_path) for input_path in input_paths)
+        if job["op"] == "merge":
+            # Inputs stay on disk and the output is built in place, so
+            # memory does not grow with the number or size of inputs. This
+            # already runs in a worker process, so inputs are checked inline
+            merge = ops.merge_pdf_files(input_paths, partial_path, workers=1, dedupe=job.get("dedupe", False),
+                                        profile=job.get("profile"))
+            detail = f"{merge['pages']} pages from {len(input_paths)} files"
+            if "dedupe" in merge:
+                detail += f", {merge['dedupe']['bytes_saved']} bytes saved by sharing resources"
+                entry["dedupe"] = merge["dedupe"]
+            entry["inputs"] = [{key: report[key] for key in ("pages", "seconds")} for report in merge["inputs"]]
+        else:
+            inputs = []
+            for input_path in input_paths:
+                with open(input_path, "rb") as pdf_file:
+                    inputs.append(pdf_file.read())
+            output, detail = run_operation(job, inputs)
+            with open(partial_path, "wb") as output_file:
+                output_file.write(output)
+        os.replace(partial_path, output_path)
+        entry.update(status="ok", detail=detail, bytes_in=bytes_in, bytes_out=os.path.getsize(output_path))
+    except Exception as e:
+        entry.update(status="error", error=f"{type(e).__name__}: {e}")
+    finally:
+        # Jobs rarely share documents, so the parsed copies, text indexes
+        # and results the apps keep around would only pile up in the worker
+        document_cache.clear()
+        text_index_cache.clear()
+        ops.result_cache.clear()
+    entry["seconds"] = round(time.perf_counter() - start, 4)
+    entry["metrics"] = operation_metrics.since(metrics_before)
+    return entry
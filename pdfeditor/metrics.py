@@ -0,0 +1,338 @@
+"""
+Operation-level performance metrics.
+
+Processing functions report their wall time, the CPU time of the calling
+thread, how far the process's resident memory peaked above where it
+started, and how many pages they touched. Each belongs to a phase:
+
+    parse   opening documents with fitz or PyPDF2
+    render  rasterizing pages
+    search  extracting page text and finding terms
+    edit    page operations and queued edits
+    save    writing documents
+
+Measurements nest (an edit parses, searches and saves), so each also
+keeps its self time, its own time minus that of nested measurements;
+per-phase totals add up self times and never count work twice.
+
+Everything is collected in operation_metrics for the whole process:
+totals per (phase, operation) and a log of the latest top-level
+operations with their per-phase breakdown. prometheus_text() and
+json_log() export them. With PDFEDITOR_METRICS_FILE set, the Prometheus
+text is also rewritten there at most every PDFEDITOR_METRICS_INTERVAL_S
+seconds (for a node exporter textfile collector); with
+PDFEDITOR_METRICS_LOG set, every top-level operation is appended to it
+as a JSON line. PDFEDITOR_METRICS=0 turns measuring off.
+
+Peak memory comes from the resident set high-water mark, which is per
+process: operations running at the same time in other threads share it,
+and work in other processes (e.g. the render pool) is not counted. On
+Linux the mark is reset whenever no other measurement is running; on
+other systems an operation only shows growth of the process's all-time
+peak.
+"""
+import functools
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+METRICS_ENABLED = os.environ.get("PDFEDITOR_METRICS", "1") != "0"
+METRICS_FILE = os.environ.get("PDFEDITOR_METRICS_FILE")
+METRICS_LOG = os.environ.get("PDFEDITOR_METRICS_LOG")
+METRICS_INTERVAL_SECONDS = float(os.environ.get("PDFEDITOR_METRICS_INTERVAL_S", "10"))
+
+PHASES = ["parse", "render", "search", "edit", "save"]
+
+# Top-level operations kept for the log
+RECENT_OPERATIONS = 200
+
+# (metric name, totals key, type, help) for the Prometheus export
+PROMETHEUS_METRICS = [
+    ("pdfeditor_operation_calls_total", "calls", "counter", "Operations run"),
+    ("pdfeditor_operation_seconds_total", "seconds", "counter", "Wall time of operations, including nested ones"),
+    ("pdfeditor_operation_self_seconds_total", "self_seconds", "counter", "Wall time of operations, excluding nested ones"),
+    ("pdfeditor_operation_cpu_seconds_total", "cpu_seconds", "counter", "CPU time of operations, including nested ones"),
+    ("pdfeditor_operation_pages_total", "pages", "counter", "Pages touched by operations"),
+    ("pdfeditor_operation_peak_memory_bytes", "peak_memory_bytes", "gauge",
+     "Largest resident memory growth during one operation"),
+]
+
+_local = threading.local()
+_active_lock = threading.Lock()
+_active = 0
+# Linux /proc files, kept open since measuring must be cheap: name ->
+# (pid, descriptor), reopened in a forked child; None once unavailable
+_proc_files = {"status": (None, None), "clear_refs": (None, None)}
+
+
+def _proc_file(name, flags):
+    pid, fd = _proc_files[name]
+    if pid != os.getpid() and pid is not False:
+        try:
+            fd = os.open(f"/proc/self/{name}", flags)
+        except OSError:
+            fd = None
+        _proc_files[name] = (os.getpid() if fd is not None else False), fd
+    return fd
+
+
+def _kilobytes(status, field):
+    start = status.find(field)
+    if start < 0:
+        return None
+    return int(status[start + len(field):status.index(b"kB", start)]) * 1024
+
+
+def _memory():
+    """(current, peak) resident set of the process in bytes; either is None where unknown"""
+    fd = _proc_file("status", os.O_RDONLY)
+    if fd is not None:
+        status = os.pread(fd, 8192, 0)
+        return _kilobytes(status, b"VmRSS:"), _kilobytes(status, b"VmHWM:")
+    if resource is None:
+        return None, None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return None, peak if sys.platform == "darwin" else peak * 1024
+
+
+def _reset_peak():
+    """Restart the high-water mark from the current resident set (Linux)"""
+    fd = _proc_file("clear_refs", os.O_WRONLY)
+    if fd is not None:
+        try:
+            os.write(fd, b"5")
+        except OSError:
+            _proc_files["clear_refs"] = (False, None)
+
+
+class Measurement:
+    """One running operation on the current thread"""
+
+    def __init__(self, phase, operation, parent):
+        self.phase = phase
+        self.operation = operation
+        self.parent = parent
+        self.root = parent.root if parent else self
+        self.pages = 0
+        self.child_seconds = 0.0
+        # Self time of this operation and everything nested in it, by
+        # phase; only filled in on the top-level measurement
+        self.phase_seconds = defaultdict(float)
+
+
+def _stack():
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+@contextmanager
+def measure(phase, operation):
+    """Measure the block as one operation of a phase"""
+    global _active
+    if not METRICS_ENABLED:
+        yield
+        return
+    stack = _stack()
+    measurement = Measurement(phase, operation, stack[-1] if stack else None)
+    with _active_lock:
+        if not _active:
+            _reset_peak()
+        _active += 1
+    current, peak = _memory()
+    baseline = current if current is not None else peak
+    start = time.perf_counter()
+    start_cpu = time.thread_time()
+    stack.append(measurement)
+    try:
+        yield
+    finally:
+        stack.pop()
+        seconds = time.perf_counter() - start
+        cpu_seconds = time.thread_time() - start_cpu
+        _, peak = _memory()
+        with _active_lock:
+            _active -= 1
+        peak_memory = None if peak is None or baseline is None else max(0, peak - baseline)
+        operation_metrics.record(measurement, seconds, cpu_seconds, peak_memory)
+
+
+def instrumented(phase, operation=None):
+    """Decorator: measure every call of a function, named after it unless operation is given"""
+    def decorate(function):
+        name = operation or function.__name__
+
+        @functools.wraps(function)
+        def run(*args, **kwargs):
+            with measure(phase, name):
+                return function(*args, **kwargs)
+
+        return run
+
+    return decorate
+
+
+def count_pages(count):
+    """Add pages touched to the innermost running measurement of this thread"""
+    stack = getattr(_local, "stack", None)
+    if stack:
+        stack[-1].pages += count
+
+
+class OperationMetrics:
+    """Totals and recent operations of this process, see the module docstring"""
+
+    def __init__(self, recent=RECENT_OPERATIONS, export_path=METRICS_FILE, log_path=METRICS_LOG,
+                 export_interval=METRICS_INTERVAL_SECONDS):
+        self.export_path = export_path
+        self.log_path = log_path
+        self.export_interval = export_interval
+        self._totals = {}
+        self._recent = deque(maxlen=recent)
+        self._lock = threading.Lock()
+        self._exported = 0.0
+
+    def record(self, measurement, seconds, cpu_seconds, peak_memory):
+        """Account for a finished measurement"""
+        self_seconds = max(0.0, seconds - measurement.child_seconds)
+        parent = measurement.parent
+        if parent is not None:
+            parent.child_seconds += seconds
+        measurement.root.phase_seconds[measurement.phase] += self_seconds
+        self._add(measurement.phase, measurement.operation, {
+            "calls": 1, "seconds": seconds, "self_seconds": self_seconds, "cpu_seconds": cpu_seconds,
+            "pages": measurement.pages, "peak_memory_bytes": peak_memory,
+        })
+        if parent is not None:
+            return
+        event = {"time": round(time.time(), 3), "pid": os.getpid(), "phase": measurement.phase,
+                 "operation": measurement.operation, "seconds": round(seconds, 6), "cpu_seconds": round(cpu_seconds, 6),
+                 "peak_memory_bytes": peak_memory, "pages": measurement.pages,
+                 "phases": {phase: round(value, 6) for phase, value in measurement.phase_seconds.items()}}
+        with self._lock:
+            self._recent.append(event)
+        if self.log_path:
+            with open(self.log_path, "a") as log_file:
+                log_file.write(json.dumps(event) + "\n")
+        self._export_if_due()
+
+    def _add(self, phase, operation, values):
+        with self._lock:
+            totals = self._totals.get((phase, operation))
+            if totals is None:
+                totals = self._totals[(phase, operation)] = {
+                    "calls": 0, "seconds": 0.0, "self_seconds": 0.0, "cpu_seconds": 0.0, "pages": 0,
+                    "peak_memory_bytes": None}
+            for key in ("calls", "seconds", "self_seconds", "cpu_seconds", "pages"):
+                totals[key] += values[key]
+            if values["peak_memory_bytes"] is not None:
+                totals["peak_memory_bytes"] = max(totals["peak_memory_bytes"] or 0, values["peak_memory_bytes"])
+
+    def merge(self, rows):
+        """Add rows() from another process, e.g. a job's worker"""
+        for row in rows:
+            self._add(row["phase"], row["operation"], row)
+        self._export_if_due()
+
+    def rows(self):
+        """[{"phase", "operation", "calls", "seconds", "self_seconds", "cpu_seconds", "pages", "peak_memory_bytes"}], most self time first"""
+        return _rows(self.snapshot())
+
+    def snapshot(self):
+        """The totals as they are now, for since()"""
+        with self._lock:
+            return {key: dict(totals) for key, totals in self._totals.items()}
+
+    def since(self, snapshot):
+        """
+        rows() of what was recorded after snapshot() was taken. Only the
+        largest peak is kept, so peak_memory_bytes is None for operations
+        that did not set a new one since.
+        """
+        added = {}
+        for key, totals in self.snapshot().items():
+            before = snapshot.get(key)
+            if before is None:
+                added[key] = totals
+                continue
+            if totals["calls"] == before["calls"]:
+                continue
+            added[key] = {name: totals[name] - before[name]
+                          for name in ("calls", "seconds", "self_seconds", "cpu_seconds", "pages")}
+            added[key]["peak_memory_bytes"] = (
+                totals["peak_memory_bytes"] if totals["peak_memory_bytes"] != before["peak_memory_bytes"] else None)
+        return _rows(added)
+
+    def phase_seconds(self):
+        """{phase: self seconds} over all operations, in PHASES order"""
+        totals = dict.fromkeys(PHASES, 0.0)
+        for row in self.rows():
+            totals[row["phase"]] = totals.get(row["phase"], 0.0) + row["self_seconds"]
+        return totals
+
+    def recent_operations(self):
+        """Latest top-level operations, newest first"""
+        with self._lock:
+            return list(reversed(self._recent))
+
+    def clear(self):
+        with self._lock:
+            self._totals.clear()
+            self._recent.clear()
+
+    def prometheus_text(self):
+        """Totals in the Prometheus text exposition format"""
+        rows = sorted(self.rows(), key=lambda row: (row["phase"], row["operation"]))
+        lines = []
+        for name, key, kind, description in PROMETHEUS_METRICS:
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+            for row in rows:
+                if row[key] is not None:
+                    lines.append(f'{name}{{phase="{row["phase"]}",operation="{row["operation"]}"}} {row[key]:g}')
+        lines += ["# HELP pdfeditor_phase_seconds_total Wall time by phase, excluding nested operations",
+                  "# TYPE pdfeditor_phase_seconds_total counter"]
+        for phase, seconds in self.phase_seconds().items():
+            lines.append(f'pdfeditor_phase_seconds_total{{phase="{phase}"}} {seconds:g}')
+        return "\n".join(lines) + "\n"
+
+    def json_log(self):
+        """Recent top-level operations as JSON lines, oldest first"""
+        return "".join(json.dumps(event) + "\n" for event in reversed(self.recent_operations()))
+
+    def _export_if_due(self):
+        # Worker processes send their totals back to the parent instead,
+        # which would otherwise overwrite the file with less
+        if not self.export_path or multiprocessing.parent_process() is not None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self._exported < self.export_interval:
+                return
+            self._exported = now
+        self.write_prometheus(self.export_path)
+
+    def write_prometheus(self, path):
+        """Write prometheus_text() to path, replacing it atomically"""
+        with open(path + ".tmp", "w") as metrics_file:
+            metrics_file.write(self.prometheus_text())
+        os.replace(path + ".tmp", path)
+
+
+def _rows(totals):
+    rows = [dict(values, phase=phase, operation=operation) for (phase, operation), values in totals.items()]
+    return sorted(rows, key=lambda row: row["self_seconds"], reverse=True)
+
+
+operation_metrics = OperationMetrics()
@@ -0,0 +1,358 @@
+"""
+Whole-document operations behind the apps' buttons.
+
+Each takes PDF bytes and returns new bytes (split returns a list), or
+(bytes, report) for edits, with report as in edits.run_edits(). Output
+is written with a save profile, see saving.py. Nothing here touches the
+UI: bad input raises ValueError and library errors propagate, so the
+same calls work from the apps, a batch job or a worker process.
+
+Page operations are deterministic, so their results are memoized in
+result_cache: repeating one on the same document, from any session,
+returns the earlier output without recomputing it.
+"""
+import functools
+import inspect
+import io
+import os
+import tempfile
+import time
+from itertools import repeat
+
+import fitz  # PyMuPDF
+from PyPDF2 import PdfWriter
+
+from pdfeditor.cache import LRUCache, doc_hash, document_cache
+from pdfeditor.dedupe import dedupe_pdf_file
+from pdfeditor.edits import add_text_edit, apply_edits, highlight_edit, redact_edit, replace_edit
+from pdfeditor.metrics import count_pages, instrumented, measure
+from pdfeditor.render import DEFAULT_RENDER_WORKERS, get_render_pool
+from pdfeditor.saving import DEFAULT_SAVE_PROFILE, optimize_pdf, optimize_pdf_file, write_document
+
+# Input bytes merged between incremental saves of the output
+DEFAULT_MERGE_BATCH_BYTES = int(os.environ.get("PDFEDITOR_MERGE_BATCH_MB", "64")) * 1024 * 1024
+
+# Below this many inputs, checking them on the calling thread is faster
+# than handing them to worker processes
+PARALLEL_MIN_INPUTS = 4
+
+DEFAULT_RESULT_CACHE_BYTES = int(os.environ.get("PDFEDITOR_RESULT_CACHE_MB", "256")) * 1024 * 1024
+
+# Outputs of page operations keyed by (input hash, operation, normalized
+# arguments); outputs are immutable bytes, so every caller can share one
+result_cache = LRUCache(DEFAULT_RESULT_CACHE_BYTES)
+
+
+def _frozen(value):
+    """Hashable form of an argument; dicts and sets are sorted so equal arguments give equal keys"""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _frozen(item)) for key, item in value.items()))
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted(value))
+    if isinstance(value, (list, tuple, range)):
+        return tuple(_frozen(item) for item in value)
+    return value
+
+
+def _memoized(operation):
+    """
+    Serve repeated calls of a page operation from result_cache.
+
+    The wrapped operation takes an extra key=, the doc_hash() of its input
+    when the caller already has it (a list of them for merge_pdfs). An
+    operation with a key parameter of its own gets it passed on.
+    """
+    signature = inspect.signature(operation)
+    input_name = next(iter(signature.parameters))
+    takes_key = "key" in signature.parameters
+
+    @functools.wraps(operation)
+    def run(pdf_input, *args, key=None, **kwargs):
+        if key is None:
+            key = [doc_hash(pdf) for pdf in pdf_input] if isinstance(pdf_input, list) else doc_hash(pdf_input)
+        arguments = signature.bind(pdf_input, *args, **kwargs)
+        arguments.apply_defaults()
+        arguments = dict(arguments.arguments)
+        del arguments[input_name]
+        arguments.pop("key", None)
+        arguments["profile"] = arguments["profile"] or DEFAULT_SAVE_PROFILE
+        cache_key = (_frozen(key), operation.__name__, _frozen(arguments))
+
+        result = result_cache.get(cache_key)
+        if result is None:
+            if takes_key:
+                kwargs["key"] = key
+            result = operation(pdf_input, *args, **kwargs)
+            if isinstance(result, list):
+                result_cache.put(cache_key, tuple(result), sum(len(part) for part in result))
+            else:
+                result_cache.put(cache_key, result, len(result))
+            return result
+        return list(result) if isinstance(result, tuple) else result
+
+    return run
+
+
+def _write(writer, profile=None):
+    count_pages(len(writer.pages))
+    output = io.BytesIO()
+    with measure("save", "pypdf2_write"):
+        writer.write(output)
+    # PyPDF2 neither compresses streams nor writes object streams
+    return optimize_pdf(output.getvalue(), profile)
+
+
+@_memoized
+@instrumented("edit")
+def extract_pages(pdf_bytes, pages_to_extract, profile=None):
+    """New PDF of the given 0-indexed pages, in the order given"""
+    writer = PdfWriter()
+
+    with document_cache.reader(pdf_bytes) as reader:
+        for page_num in pages_to_extract:
+            writer.add_page(reader.pages[page_num])
+
+    return _write(writer, profile)
+
+
+# Keeping pages and reordering them are the same copy
+remove_pages = extract_pages
+reorder_pages = extract_pages
+
+
+@_memoized
+@instrumented("edit")
+def extract_pages_by_numbers(pdf_bytes, page_numbers, profile=None):
+    """New PDF of the given 1-indexed pages, skipping numbers past the end"""
+    writer = PdfWriter()
+
+    with document_cache.reader(pdf_bytes) as reader:
+        for page_num in page_numbers:
+            if 1 <= page_num <= len(reader.pages):
+                writer.add_page(reader.pages[page_num - 1])
+
+    return _write(writer, profile)
+
+
+@_memoized
+@instrumented("edit")
+def rotate_pages(pdf_bytes, page_rotations, profile=None):
+    """Rotate pages by {0-indexed page: degrees}"""
+    writer = PdfWriter()
+
+    with document_cache.reader(pdf_bytes) as reader:
+        for i, page in enumerate(reader.pages):
+            # Rotate the writer's copy so the cached reader stays untouched
+            added_page = writer.add_page(page)
+            if i in page_rotations:
+                added_page.rotate(page_rotations[i])
+
+    return _write(writer, profile)
+
+
+@_memoized
+@instrumented("edit")
+def merge_pdfs(pdf_files, profile=None):
+    """One PDF with the pages of every input, in order"""
+    writer = PdfWriter()
+
+    for pdf_file in pdf_files:
+        with document_cache.reader(pdf_file) as reader:
+            for page in reader.pages:
+                writer.add_page(page)
+
+    return _write(writer, profile)
+
+
+@instrumented("parse")
+def inspect_pdf(input_path, spool_dir=None):
+    """
+    Check that a PDF on disk can be merged: it opens without a password and
+    every page in its page tree loads.
+
+    Returns {"path", "pages", "seconds", "error", "prepared_path"}; error is
+    None for a good file. A file MuPDF had to repair is also test-copied,
+    and the copy saved into spool_dir (when given) as prepared_path so it
+    is not rebuilt again when merged.
+    """
+    start = time.perf_counter()
+    report = {"path": input_path, "pages": 0, "seconds": None, "error": None, "prepared_path": None}
+    try:
+        with fitz.open(input_path) as source:
+            if source.needs_pass:
+                raise ValueError("password required")
+            if not source.is_pdf:
+                raise ValueError("not a PDF")
+            for page_num in range(source.page_count):
+                source.load_page(page_num)
+            if source.is_repaired:
+                # A rebuilt file can still point at objects it lost, which
+                # only copying it reveals; the copy is then clean to merge
+                with fitz.open() as copy:
+                    copy.insert_pdf(source)
+                    if spool_dir:
+                        handle, prepared_path = tempfile.mkstemp(suffix=".pdf", dir=spool_dir)
+                        os.close(handle)
+                        copy.save(prepared_path)
+                        report["prepared_path"] = prepared_path
+            report["pages"] = source.page_count
+    except Exception as e:
+        report["error"] = f"{type(e).__name__}: {e}"
+    report["seconds"] = round(time.perf_counter() - start, 4)
+    return report
+
+
+def inspect_pdfs(input_paths, workers=None, spool_dir=None):
+    """inspect_pdf() for every input, in worker processes when there are enough; reports keep input order"""
+    workers = workers or DEFAULT_RENDER_WORKERS
+    if workers > 1 and len(input_paths) >= PARALLEL_MIN_INPUTS:
+        # Parsing, decryption checks and page-tree loading are independent
+        # per file; the rendering pool doubles as a general worker pool
+        return list(get_render_pool(workers).map(inspect_pdf, input_paths, repeat(spool_dir)))
+    return [inspect_pdf(input_path, spool_dir) for input_path in input_paths]
+
+
+@instrumented("edit")
+def merge_pdf_files(input_paths, output_path, batch_bytes=DEFAULT_MERGE_BATCH_BYTES, workers=None, inputs=None,
+                    dedupe=False, profile=None):
+    """
+    Merge PDF files on disk into output_path.
+
+    Inputs are first checked concurrently with inspect_pdfs() (pass its
+    reports as inputs to reuse an earlier check); if any is broken, or
+    there are no pages to merge, nothing is written and ValueError says
+    why, naming every bad file. Returns {"pages":
+    merged page count, "inputs": the input reports}. With dedupe=True,
+    fonts, images and other resources the inputs have in common are
+    written once, see dedupe.py, and the result also has "dedupe": its
+    size report. The finished file is rewritten with the save profile.
+
+    For inputs too large to hold at once: each input is opened from its
+    path (MuPDF reads objects on demand) and copied into the output, which
+    is flushed to output_path with an incremental save whenever about
+    batch_bytes of input has been copied, then reopened so the copied
+    objects are released. Peak memory is roughly one batch, however many
+    inputs there are. Paths of spooled temporary files work too.
+    """
+    with tempfile.TemporaryDirectory() as spool_dir:
+        if inputs is None:
+            inputs = inspect_pdfs(input_paths, workers, spool_dir)
+        broken = [report for report in inputs if report["error"]]
+        if broken:
+            raise ValueError(f"{len(broken)} of {len(inputs)} inputs cannot be merged: "
+                             + "; ".join(f"{os.path.basename(report['path'])}: {report['error']}" for report in broken))
+        # MuPDF would only refuse once the output is being written
+        if not inputs:
+            raise ValueError("No PDF files to merge")
+        if not any(report["pages"] for report in inputs):
+            raise ValueError(f"None of the {len(inputs)} inputs has any pages to merge")
+
+        # Assembly keeps the caller's order
+        merged = fitz.open()
+        saved = False
+        batch = 0
+        for report in inputs:
+            input_path = report["prepared_path"] or report["path"]
+            with fitz.open(input_path) as source:
+                merged.insert_pdf(source)
+            batch += os.path.getsize(input_path)
+            if batch >= batch_bytes:
+                merged = _flush_merge(merged, output_path, saved)
+                saved = True
+                batch = 0
+        if batch or not saved:
+            merged = _flush_merge(merged, output_path, saved)
+        page_count = merged.page_count
+        merged.close()
+    result = {"pages": page_count, "inputs": inputs}
+    if dedupe:
+        result["dedupe"] = dedupe_pdf_file(output_path, profile)
+    else:
+        # Incremental saves cannot collect garbage or restructure the
+        # file, so the profile applies to one final rewrite
+        optimize_pdf_file(output_path, profile)
+    return result
+
+
+def _flush_merge(merged, output_path, saved):
+    """Write what has been merged so far and reopen the output from disk"""
+    if saved:
+        merged.saveIncr()
+    else:
+        merged.save(output_path)
+    merged.close()
+    return fitz.open(output_path)
+
+
+@_memoized
+@instrumented("edit")
+def split_pdf(pdf_bytes, split_points, profile=None):
+    """PDFs for the parts of a document cut before each 0-indexed split point"""
+    pdfs = []
+
+    with document_cache.reader(pdf_bytes) as reader:
+        split_points = [0] + sorted(split_points) + [len(reader.pages)]
+
+        for i in range(len(split_points) - 1):
+            writer = PdfWriter()
+            for page_num in range(split_points[i], split_points[i + 1]):
+                writer.add_page(reader.pages[page_num])
+            pdfs.append(_write(writer, profile))
+
+    return pdfs
+
+
+@_memoized
+@instrumented("edit")
+def add_watermark(pdf_bytes, watermark_text, profile=None, key=None):
+    """Grey centered text along the bottom of every page"""
+    pdf_document = document_cache.checkout(pdf_bytes, key)
+    count_pages(pdf_document.page_count)
+
+    for page in pdf_document:
+        rect = page.rect
+        text_rect = fitz.Rect(50, rect.height - 50, rect.width - 50, rect.height - 20)
+        page.insert_textbox(
+            text_rect,
+            watermark_text,
+            fontsize=12,
+            color=(0.7, 0.7, 0.7),
+            align=fitz.TEXT_ALIGN_CENTER
+        )
+
+    output = write_document(pdf_document, profile)
+    document_cache.checkin(output, pdf_document)
+    return output
+
+
+def apply_edit(pdf_bytes, edit, profile=None):
+    """
+    Apply one edit, returning (output, report).
+
+    Raises ValueError when the edit names a page that does not exist.
+    """
+    output, reports = apply_edits(pdf_bytes, [edit], profile=profile)
+    report = reports[0]
+    if report["invalid_pages"]:
+        raise ValueError(f"Invalid page number: {report['invalid_pages'][0]}")
+    return output, report
+
+
+def replace_text(pdf_bytes, old_text, new_text, pages="all", case_sensitive=False, redact=False, profile=None):
+    """Replace every occurrence of old_text, see edits.replace_edit()"""
+    return apply_edit(pdf_bytes, replace_edit(old_text, new_text, pages, case_sensitive, redact), profile)
+
+
+def highlight_text(pdf_bytes, search_text, color=(1, 1, 0), pages="all", profile=None):
+    """Highlight every occurrence of search_text"""
+    return apply_edit(pdf_bytes, highlight_edit(search_text, color, pages), profile)
+
+
+def add_text(pdf_bytes, page_num, text, x, y, font_size=12, color=(0, 0, 0), profile=None):
+    """Write text at a point on a 1-indexed page"""
+    return apply_edit(pdf_bytes, add_text_edit(page_num, text, x, y, font_size, color), profile)
+
+
+def redact_area(pdf_bytes, page_num, x1, y1, x2, y2, profile=None):
+    """Remove everything inside a rectangle on a 1-indexed page"""
+    return apply_edit(pdf_bytes, redact_edit(page_num, x1, y1, x2, y2), profile)
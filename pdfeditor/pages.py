@@ -0,0 +1,168 @@
+"""
+Compact page selections.
+
+A selection is stored as sorted, disjoint runs of 0-indexed pages rather
+than one entry per page, so selecting all 2,000 pages of a document is a
+single (0, 2000) pair. Text forms use 1-indexed page numbers like
+"1-5,10,15-20", as typed in the apps.
+"""
+from bisect import bisect_right
+
+
+class PageRanges:
+    """Set of 0-indexed pages kept as sorted, disjoint [start, stop) runs"""
+
+    def __init__(self, ranges=()):
+        self.ranges = []
+        for start, stop in ranges:
+            self.add(start, stop)
+
+    @classmethod
+    def all(cls, total_pages):
+        return cls([(0, total_pages)] if total_pages else [])
+
+    @classmethod
+    def parse(cls, selection_str, total_pages):
+        """Parse "1-5,10" style text; raises ValueError naming the bad part"""
+        selection = cls()
+        for part in selection_str.split(','):
+            part = part.strip()
+            if not part:
+                continue
+            start, stop = _parse_part(part, total_pages)
+            selection.add(min(start, stop), max(start, stop) + 1)
+        return selection
+
+    def add(self, start, stop):
+        """Add pages start..stop-1, merging with touching runs"""
+        if start >= stop:
+            return
+        kept = []
+        for run_start, run_stop in self.ranges:
+            if run_stop < start or run_start > stop:
+                kept.append((run_start, run_stop))
+            else:
+                start, stop = min(start, run_start), max(stop, run_stop)
+        kept.append((start, stop))
+        self.ranges = sorted(kept)
+
+    def remove(self, start, stop):
+        """Remove pages start..stop-1"""
+        kept = []
+        for run_start, run_stop in self.ranges:
+            if run_start < start:
+                kept.append((run_start, min(run_stop, start)))
+            if run_stop > stop:
+                kept.append((max(run_start, stop), run_stop))
+        self.ranges = kept
+
+    def toggle(self, page):
+        if page in self:
+            self.remove(page, page + 1)
+        else:
+            self.add(page, page + 1)
+
+    def clear(self):
+        self.ranges = []
+
+    def __contains__(self, page):
+        i = bisect_right(self.ranges, (page, float("inf"))) - 1
+        return i >= 0 and self.ranges[i][0] <= page < self.ranges[i][1]
+
+    def __iter__(self):
+        for start, stop in self.ranges:
+            yield from range(start, stop)
+
+    def __len__(self):
+        return sum(stop - start for start, stop in self.ranges)
+
+    def __bool__(self):
+        return bool(self.ranges)
+
+    def __eq__(self, other):
+        return isinstance(other, PageRanges) and self.ranges == other.ranges
+
+    def __str__(self):
+        parts = []
+        for start, stop in self.ranges:
+            if stop - start == 1:
+                parts.append(str(start + 1))
+            else:
+                parts.append(f"{start + 1}-{stop}")
+        return ",".join(parts)
+
+    def __repr__(self):
+        return f"PageRanges({self.ranges!r})"
+
+
+def parse_page_order(order_str, total_pages):
+    """
+    Parse an ordered page list such as "3,1-2" or "10-1" into 0-indexed pages.
+
+    Ranges may run backwards. Raises ValueError naming the bad part.
+    """
+    order = []
+    for part in order_str.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        start, stop = _parse_part(part, total_pages)
+        step = 1 if stop >= start else -1
+        order.extend(range(start, stop + step, step))
+    return order
+
+
+def parse_page_numbers(selection_str, total_pages):
+    """
+    Parse a lenient "2,10,45" / "21-45" / "1-5,10,15-20" selection.
+
+    Returns (sorted 1-indexed pages, error messages): bad parts are reported
+    and skipped rather than failing the whole selection.
+    """
+    pages = set()
+    errors = []
+
+    for part in selection_str.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            try:
+                start, end = part.split('-')
+                start = int(start.strip())
+                end = int(end.strip())
+            except ValueError:
+                errors.append(f"Invalid range format: {part}")
+                continue
+            if start < 1 or end > total_pages or start > end:
+                errors.append(f"Invalid range: {part}")
+                continue
+            pages.update(range(start, end + 1))
+        else:
+            try:
+                page = int(part)
+            except ValueError:
+                errors.append(f"Invalid page number: {part}")
+                continue
+            if 1 <= page <= total_pages:
+                pages.add(page)
+            else:
+                errors.append(f"Page {page} out of range (1-{total_pages})")
+
+    return sorted(pages), errors
+
+
+def _parse_part(part, total_pages):
+    """Parse "7" or "3-9" into 0-indexed, inclusive (start, stop)"""
+    try:
+        if '-' in part:
+            start, end = part.split('-')
+            start, end = int(start.strip()), int(end.strip())
+        else:
+            start = end = int(part)
+    except ValueError:
+        raise ValueError(f"Invalid page or range: {part}")
+    for page in (start, end):
+        if not 1 <= page <= total_pages:
+            raise ValueError(f"Page {page} out of range (1-{total_pages})")
+    return start - 1, end - 1
@@ -0,0 +1,321 @@
+"""
+Page rendering for thumbnails and previews.
+
+Pages are rendered at one of a few quality tiers: the zoom matrix is fitted
+so the output is the tier's pixel width, and the pixmap is encoded to a
+compact JPEG/WebP/PNG that st.image can send to the browser as-is.
+Encoded pages are kept in a process-wide LRU cache keyed by
+(document hash, page, tier, rotation), so a page is only rasterized the
+first time it is displayed and reruns reuse the result.
+"""
+import atexit
+import hashlib
+import io
+import multiprocessing
+import os
+import tempfile
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+from pdfeditor.cache import LRUCache, doc_hash, document_cache
+from pdfeditor.metrics import count_pages, measure
+
+DEFAULT_THUMBNAIL_CACHE_BYTES = int(os.environ.get("PDFEDITOR_THUMBNAIL_CACHE_MB", "256")) * 1024 * 1024
+DEFAULT_RENDER_WORKERS = int(os.environ.get("PDFEDITOR_RENDER_WORKERS", "0")) or os.cpu_count() or 1
+
+# Each worker opens its own copy of the document, so it only pays off with
+# this many uncached pages per worker, plus one for every
+# PARALLEL_BYTES_PER_PAGE of PDF it has to open
+PARALLEL_PAGES_PER_WORKER = 4
+PARALLEL_BYTES_PER_PAGE = 1024 * 1024
+
+# Temporary copies of in-memory documents kept for the render workers
+SPOOLED_DOCUMENTS = 4
+
+# width: target pixel width, image_format: "jpeg", "webp" or "png",
+# quality: JPEG/WebP quality (ignored for PNG)
+RenderTier = namedtuple("RenderTier", "width grayscale image_format quality")
+
+RENDER_TIERS = {
+    "thumbnail": RenderTier(width=160, grayscale=False, image_format="jpeg", quality=70),
+    "preview": RenderTier(width=800, grayscale=False, image_format="jpeg", quality=85),
+    "full": RenderTier(width=1600, grayscale=False, image_format="png", quality=None),
+}
+
+thumbnail_cache = LRUCache(DEFAULT_THUMBNAIL_CACHE_BYTES)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+_spooled = OrderedDict()  # doc hash -> [path, renders using it]
+_spooled_lock = threading.Lock()
+
+
+def get_tier(tier="thumbnail", **overrides):
+    """Look up a tier by name and apply overrides such as grayscale=True"""
+    if not isinstance(tier, RenderTier):
+        tier = RENDER_TIERS[tier]
+    overrides = {name: value for name, value in overrides.items() if value is not None}
+    return tier._replace(**overrides)
+
+
+def fitted_matrix(page, width, rotation=0):
+    """Zoom matrix that renders page (after rotation) at the given pixel width"""
+    rect = page.rect
+    page_width = rect.height if rotation % 180 else rect.width
+    zoom = width / page_width
+    return fitz.Matrix(zoom, zoom).prerotate(rotation)
+
+
+def encode_pixmap(pix, tier):
+    """Encode a pixmap in the tier's image format"""
+    if tier.image_format == "webp":
+        mode = "L" if pix.n == 1 else "RGB"
+        img = Image.frombytes(mode, [pix.width, pix.height], pix.samples)
+        output = io.BytesIO()
+        img.save(output, "WEBP", quality=tier.quality)
+        return output.getvalue()
+    if tier.image_format == "jpeg":
+        return pix.tobytes("jpeg", jpg_quality=tier.quality)
+    return pix.tobytes("png")
+
+
+def render_pixmap(page, tier, rotation=0):
+    """Rasterize a fitz page for a tier, without alpha"""
+    colorspace = fitz.csGRAY if tier.grayscale else fitz.csRGB
+    return page.get_pixmap(matrix=fitted_matrix(page, tier.width, rotation), colorspace=colorspace, alpha=False)
+
+
+def render_page(pdf_bytes, page_num, tier="thumbnail", rotation=0, key=None):
+    """Render a 0-indexed page to encoded image bytes, reusing a cached render if any"""
+    tier = get_tier(tier)
+    key = key or doc_hash(pdf_bytes)
+    image_bytes = thumbnail_cache.get((key, page_num, tier, rotation))
+    if image_bytes is None:
+        image_bytes = _render_missing(pdf_bytes, page_num, tier, rotation, key)
+    return image_bytes
+
+
+def _render_missing(pdf_bytes, page_num, tier, rotation, key):
+    """Render a page thumbnail_cache was just found not to have, and cache it"""
+    with measure("render", "render_page"):
+        with document_cache.fitz_document(pdf_bytes, key) as pdf_document:
+            pix = render_pixmap(pdf_document[page_num], tier, rotation)
+        image_bytes = encode_pixmap(pix, tier)
+        count_pages(1)
+    thumbnail_cache.put((key, page_num, tier, rotation), image_bytes, len(image_bytes))
+    return image_bytes
+
+
+def get_render_pool(workers):
+    """Shared process pool for rendering, created on first use"""
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            # spawn, not fork: the apps run Streamlit's threads and fitz
+            # state that must not be duplicated into children
+            pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+            _pools[workers] = pool
+        return pool
+
+
+@contextmanager
+def _pdf_path(pdf_bytes, key, path=None):
+    """A file holding pdf_bytes for the duration of a parallel render"""
+    if path is not None:
+        yield path
+        return
+    with _spooled_lock:
+        entry = _spooled.get(key)
+        if entry is not None:
+            entry[1] += 1
+            _spooled.move_to_end(key)
+    if entry is None:
+        handle, spool_path = tempfile.mkstemp(suffix=".pdf")
+        with os.fdopen(handle, "wb") as pdf_file:
+            pdf_file.write(pdf_bytes)
+        with _spooled_lock:
+            entry = _spooled.get(key)
+            if entry is None:
+                entry = _spooled[key] = [spool_path, 1]
+            else:
+                # Another render spooled it meanwhile
+                entry[1] += 1
+                _remove(spool_path)
+    try:
+        yield entry[0]
+    finally:
+        with _spooled_lock:
+            entry[1] -= 1
+            # Drop the least recently used copies no render is reading
+            for old_key in [old_key for old_key, (_, users) in _spooled.items() if not users]:
+                if len(_spooled) <= SPOOLED_DOCUMENTS:
+                    break
+                _remove(_spooled.pop(old_key)[0])
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+@atexit.register
+def _remove_spooled():
+    with _spooled_lock:
+        for spool_path, _ in _spooled.values():
+            _remove(spool_path)
+        _spooled.clear()
+
+
+def _render_chunk(pdf_path, jobs, tier):
+    """Worker entry point: render (page, rotation) jobs from a private document"""
+    pdf_document = fitz.open(pdf_path)
+    try:
+        return [encode_pixmap(render_pixmap(pdf_document[page_num], tier, rotation), tier)
+                for page_num, rotation in jobs]
+    finally:
+        pdf_document.close()
+
+
+def _split(jobs, parts):
+    """Split jobs into at most `parts` contiguous, nearly equal runs"""
+    size, extra = divmod(len(jobs), parts)
+    chunks, start = [], 0
+    for i in range(parts):
+        end = start + size + (1 if i < extra else 0)
+        if end > start:
+            chunks.append(jobs[start:end])
+        start = end
+    return chunks
+
+
+def parallel_workers(page_count, pdf_size, workers):
+    """How many of workers to render page_count pages of a pdf_size-byte PDF with; 1 means on this thread"""
+    pages_per_worker = PARALLEL_PAGES_PER_WORKER + pdf_size // PARALLEL_BYTES_PER_PAGE
+    return max(1, min(workers, page_count // pages_per_worker))
+
+
+def render_pages(pdf_bytes, page_numbers, tier="thumbnail", rotations=None, workers=None, key=None, path=None):
+    """
+    Render 0-indexed pages to encoded image bytes, returned in page_numbers order.
+
+    Cached pages are reused. When enough pages are missing (see
+    parallel_workers()) they are split into contiguous runs, one per worker
+    process; each worker opens its own fitz document, since documents
+    cannot be shared between processes. They open path, a file holding
+    exactly pdf_bytes such as a store spool file, if given, or else a
+    temporary copy kept per document for later renders. rotations maps
+    page number to degrees.
+    """
+    tier = get_tier(tier)
+    key = key or doc_hash(pdf_bytes)
+    rotations = rotations or {}
+    workers = workers or DEFAULT_RENDER_WORKERS
+
+    results = {}
+    missing = []
+    for page_num in page_numbers:
+        rotation = rotations.get(page_num, 0)
+        image_bytes = thumbnail_cache.get((key, page_num, tier, rotation))
+        if image_bytes is None:
+            missing.append((page_num, rotation))
+        else:
+            results[page_num] = image_bytes
+
+    used = parallel_workers(len(missing), len(pdf_bytes), workers)
+    if used > 1:
+        chunks = _split(missing, used)
+        # The workers' CPU time and memory are their own, so only wall time tells here
+        with measure("render", "render_pages_parallel"), _pdf_path(pdf_bytes, key, path) as pdf_path:
+            count_pages(len(missing))
+            pool = get_render_pool(workers)
+            futures = [pool.submit(_render_chunk, pdf_path, chunk, tier) for chunk in chunks]
+            for chunk, future in zip(chunks, futures):
+                for (page_num, rotation), image_bytes in zip(chunk, future.result()):
+                    thumbnail_cache.put((key, page_num, tier, rotation), image_bytes, len(image_bytes))
+                    results[page_num] = image_bytes
+    else:
+        for page_num, rotation in missing:
+            results[page_num] = _render_missing(pdf_bytes, page_num, tier, rotation, key)
+
+    return [results[page_num] for page_num in page_numbers]
+
+
+def page_fingerprint(page):
+    """Digest of what a fitz page looks like: contents, resources, annotations, geometry"""
+    pdf_document = page.parent
+    digest = hashlib.sha256()
+    digest.update(f"{tuple(page.rect)} {page.rotation}".encode())
+    digest.update(pdf_document.xref_object(page.xref, compressed=True).encode())
+    digest.update(page.read_contents())
+    kind, value = pdf_document.xref_get_key(page.xref, "Resources")
+    if kind == "xref":
+        digest.update(pdf_document.xref_object(int(value.split()[0]), compressed=True).encode())
+    for annot_xref, _, _ in page.annot_xrefs():
+        digest.update(pdf_document.xref_object(annot_xref, compressed=True).encode())
+    return digest.hexdigest()
+
+
+def render_preview_pages(pdf_bytes, page_numbers, lineage=None, tier="preview", key=None):
+    """
+    Render pages for the live preview, keyed by page content.
+
+    An edit produces a new document hash, but most of its pages are
+    unchanged; keying renders by (lineage, page fingerprint) lets those
+    pages reuse the previous version's image so only edited pages are
+    rasterized again. lineage is the hash of the document the versions
+    derive from, so unrelated uploads never share renders.
+    """
+    tier = get_tier(tier)
+    key = key or doc_hash(pdf_bytes)
+    lineage = lineage or key
+    images = []
+    with document_cache.fitz_document(pdf_bytes, key) as pdf_document:
+        for page_num in page_numbers:
+            page = pdf_document[page_num]
+            cache_key = ("preview", lineage, page_fingerprint(page), tier)
+            image_bytes = thumbnail_cache.get(cache_key)
+            if image_bytes is None:
+                with measure("render", "render_preview_page"):
+                    image_bytes = encode_pixmap(render_pixmap(page, tier), tier)
+                    count_pages(1)
+                thumbnail_cache.put(cache_key, image_bytes, len(image_bytes))
+            images.append(image_bytes)
+    return images
+
+
+class PageImages:
+    """
+    Sequence of page images that renders each page on first access.
+
+    Drop-in for the list the apps used to build up front: len() is the page
+    count and indexing renders (or fetches from cache) just that page.
+    """
+
+    def __init__(self, pdf_bytes, tier="thumbnail", key=None):
+        self.pdf_bytes = pdf_bytes
+        self.tier = get_tier(tier)
+        self.key = key or doc_hash(pdf_bytes)
+        self.page_count = document_cache.page_count(pdf_bytes, self.key)
+
+    def __len__(self):
+        return self.page_count
+
+    def __getitem__(self, page_num):
+        if not 0 <= page_num < self.page_count:
+            raise IndexError(page_num)
+        return self.render(page_num)
+
+    def render(self, page_num, rotation=0):
+        return render_page(self.pdf_bytes, page_num, self.tier, rotation, self.key)
+
+    def prefetch(self, page_numbers, rotations=None):
+        """Render the pages about to be displayed in parallel"""
+        render_pages(self.pdf_bytes, list(page_numbers), self.tier, rotations, key=self.key)
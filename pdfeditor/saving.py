@@ -0,0 +1,84 @@
+"""
+Save profiles: how much work writing a PDF spends on making it small.
+
+    fast      write as-is; objects orphaned by page removal and
+              uncompressed streams stay in the file
+    balanced  drop unreferenced objects and deflate uncompressed streams,
+              fonts and images
+    smallest  also merge duplicate objects and pack objects into
+              compressed object streams indexed by a cross-reference
+              stream, at the highest compression effort
+
+Every operation that produces a PDF takes profile=None, meaning
+DEFAULT_SAVE_PROFILE (PDFEDITOR_SAVE_PROFILE, "balanced" unless set).
+Incremental saves append to the file as it is and ignore the profile.
+"""
+import os
+import time
+
+import fitz  # PyMuPDF
+
+from pdfeditor.metrics import count_pages, instrumented
+
+# Document.write()/save() options per profile, fastest first
+SAVE_PROFILES = {
+    "fast": {},
+    "balanced": {"garbage": 1, "deflate": True, "deflate_images": True, "deflate_fonts": True},
+    "smallest": {"garbage": 4, "deflate": True, "deflate_images": True, "deflate_fonts": True,
+                 "use_objstms": 1, "compression_effort": 100},
+}
+
+DEFAULT_SAVE_PROFILE = os.environ.get("PDFEDITOR_SAVE_PROFILE", "balanced")
+
+
+def save_options(profile=None):
+    """Write options for a profile name; raises ValueError for an unknown one"""
+    profile = profile or DEFAULT_SAVE_PROFILE
+    if profile not in SAVE_PROFILES:
+        raise ValueError(f"Unknown save profile: {profile} (choose from {', '.join(SAVE_PROFILES)})")
+    return dict(SAVE_PROFILES[profile])
+
+
+@instrumented("save")
+def write_document(pdf_document, profile=None):
+    """Bytes of an open fitz document written with a profile"""
+    count_pages(pdf_document.page_count)
+    return pdf_document.write(**save_options(profile))
+
+
+@instrumented("save")
+def optimize_pdf(pdf_bytes, profile=None):
+    """
+    Rewrite PDF bytes produced elsewhere (e.g. by PyPDF2) with a profile.
+
+    The fast profile returns them untouched.
+    """
+    options = save_options(profile)
+    if not options:
+        return pdf_bytes
+    with fitz.open("pdf", pdf_bytes) as pdf_document:
+        count_pages(pdf_document.page_count)
+        return pdf_document.write(**options)
+
+
+@instrumented("save")
+def optimize_pdf_file(path, profile=None):
+    """Rewrite a PDF on disk in place with a profile"""
+    options = save_options(profile)
+    if not options:
+        return
+    with fitz.open(path) as pdf_document:
+        count_pages(pdf_document.page_count)
+        pdf_document.save(path + ".optimize", **options)
+    os.replace(path + ".optimize", path)
+
+
+def compare_profiles(pdf_bytes):
+    """[{"profile", "bytes", "seconds"}] for writing a PDF with each profile"""
+    results = []
+    for profile, options in SAVE_PROFILES.items():
+        start = time.perf_counter()
+        with fitz.open("pdf", pdf_bytes) as pdf_document:
+            size = len(pdf_document.write(**options))
+        results.append({"profile": profile, "bytes": size, "seconds": round(time.perf_counter() - start, 4)})
+    return results
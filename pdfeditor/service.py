@@ -0,0 +1,539 @@
+"""
+HTTP job service for the core operations.
+
+    python -m pdfeditor.service --port 8080 --workers 4
+
+    POST   /jobs/<op>?param=value   submit a job; body is the PDF, or a
+                                    multipart form with one file per input
+                                    (merge takes several)
+    GET    /jobs/<id>               status: queued, running, done or error
+    GET    /jobs/<id>/result        download the result once done
+    DELETE /jobs/<id>               cancel or forget a job
+    GET    /health                  pool size and queue occupancy
+    GET    /metrics                 operation metrics of finished jobs in
+                                    the Prometheus text format
+
+Uploads are spooled to disk and run by a process pool, so a request
+thread only copies bytes. At most --max-jobs jobs are queued or running
+at once; past that, submissions are refused with 429 and a Retry-After
+header before anything is spooled or queued, so clients back off instead
+of piling up work. Finished jobs are kept for --job-ttl seconds. If a
+worker process dies, its jobs fail, the pool is replaced and a submission
+that hit the broken pool gets 503.
+
+Every operation also takes profile=fast|balanced|smallest, the save
+profile for its output (saving.py).
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from email.parser import BytesParser
+from email.policy import HTTP
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from pdfeditor.jobs import OUTPUT_TYPES, process_file
+from pdfeditor.metrics import operation_metrics
+from pdfeditor.saving import save_options
+
+DEFAULT_MAX_UPLOAD_BYTES = int(os.environ.get("PDFEDITOR_MAX_UPLOAD_MB", "200")) * 1024 * 1024
+
+CHUNK_SIZE = 64 * 1024
+
+# Longest header block of one multipart part
+MAX_PART_HEADER_BYTES = 16 * 1024
+
+REQUIRED = object()
+
+
+def _int_list(value):
+    return [int(part) for part in value.split(",") if part.strip()]
+
+
+def _float_list(count):
+    def parse(value):
+        parts = [float(part) for part in value.split(",")]
+        if len(parts) != count:
+            raise ValueError(f"expected {count} comma-separated numbers")
+        return parts
+    return parse
+
+
+def _color(value):
+    parts = _float_list(3)(value)
+    if not all(0 <= part <= 1 for part in parts):
+        raise ValueError("color parts must be from 0 to 1")
+    return parts
+
+
+def _angle(value):
+    if int(value) not in (90, 180, 270):
+        raise ValueError("angle must be 90, 180 or 270")
+    return int(value)
+
+
+def _flag(value):
+    return value.lower() in ("1", "true", "yes", "on")
+
+
+def _profile(value):
+    save_options(value)
+    return value
+
+
+# Query parameters per operation: name -> (parser, default)
+PARAMETERS = {
+    "merge": {"dedupe": (_flag, False)},
+    "split": {"points": (_int_list, REQUIRED)},
+    "extract": {"pages": (str, REQUIRED)},
+    "rotate": {"angle": (_angle, REQUIRED), "pages": (str, "all")},
+    "watermark": {"text": (str, REQUIRED)},
+    "highlight": {"text": (str, REQUIRED), "color": (_color, [1, 1, 0]), "pages": (str, "all")},
+    "replace": {"old": (str, REQUIRED), "new": (str, REQUIRED), "pages": (str, "all"),
+                "case_sensitive": (_flag, False), "redact": (_flag, False)},
+    "redact": {"page": (int, REQUIRED), "rect": (_float_list(4), REQUIRED)},
+    "compact": {},
+}
+
+# Query parameters every operation takes; a None profile means the default
+COMMON_PARAMETERS = {"profile": (_profile, None)}
+
+
+def parse_job(op, query):
+    """Job dict for an operation from its query parameters; raises ValueError"""
+    job = {"op": op}
+    for name, (parse, default) in {**PARAMETERS[op], **COMMON_PARAMETERS}.items():
+        if name in query:
+            try:
+                job[name] = parse(query[name][-1])
+            except ValueError as e:
+                raise ValueError(f"Invalid {name}: {e}")
+        elif default is REQUIRED:
+            raise ValueError(f"Missing parameter: {name}")
+        else:
+            job[name] = default
+    return job
+
+
+class Job:
+    """One submitted job and where its files live"""
+
+    def __init__(self, job, job_dir):
+        self.id = uuid.uuid4().hex
+        self.job = job
+        self.dir = job_dir
+        self.created = time.time()
+        self.finished = None
+        self.future = None
+        self.entry = None
+        media_type, extension = OUTPUT_TYPES.get(job["op"], ("application/pdf", ".pdf"))
+        self.media_type = media_type
+        self.output_path = os.path.join(job_dir, "result" + extension)
+
+    @property
+    def status(self):
+        if self.entry is not None:
+            return "done" if self.entry["status"] == "ok" else "error"
+        if self.future is not None and self.future.running():
+            return "running"
+        return "queued"
+
+    def describe(self):
+        info = {"id": self.id, "op": self.job["op"], "status": self.status,
+                "created": self.created, "finished": self.finished}
+        if self.entry is not None:
+            for key in ("detail", "error", "seconds", "bytes_in", "bytes_out", "inputs", "dedupe"):
+                if key in self.entry:
+                    info[key] = self.entry[key]
+        return info
+
+
+class JobService:
+    """Bounded job queue in front of a process pool"""
+
+    def __init__(self, workers=None, max_jobs=None, spool_dir=None, job_ttl=3600):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_jobs = max_jobs or self.workers * 4
+        self._own_spool = spool_dir is None
+        self.spool_dir = spool_dir or tempfile.mkdtemp(prefix="pdfeditor-jobs-")
+        self.job_ttl = job_ttl
+        self.pool = self._new_pool()
+        self.jobs = {}
+        self._slots = threading.BoundedSemaphore(self.max_jobs)
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Claim a queue slot without waiting; False when the queue is full"""
+        return self._slots.acquire(blocking=False)
+
+    def release(self):
+        self._slots.release()
+
+    def _new_pool(self):
+        return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def _replace_pool(self, broken):
+        """Swap in a new pool once a worker died; broken is the pool that failed"""
+        with self._lock:
+            if self.pool is not broken:
+                return
+            self.pool = self._new_pool()
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def spool_path(self):
+        """Fresh directory for one job's files"""
+        return tempfile.mkdtemp(dir=self.spool_dir)
+
+    def submit(self, job, job_dir, input_paths):
+        """
+        Queue a job on a reserved slot; its inputs are already spooled in job_dir.
+
+        Raises BrokenProcessPool if a worker died since the last job; the
+        pool is replaced then, and the caller keeps the slot and job_dir.
+        """
+        record = Job(job, job_dir)
+        pool = self.pool
+        try:
+            record.future = pool.submit(process_file, job, input_paths, record.output_path)
+        except BrokenProcessPool:
+            self._replace_pool(pool)
+            raise
+        with self._lock:
+            self.jobs[record.id] = record
+        record.future.add_done_callback(lambda future: self._finished(record, future, input_paths, pool))
+        self._expire()
+        return record
+
+    def _finished(self, record, future, input_paths, pool):
+        if future.cancelled():
+            record.entry = {"status": "error", "error": "cancelled"}
+        elif isinstance(future.exception(), BrokenProcessPool):
+            # A worker died, failing every job the pool had
+            record.entry = {"status": "error", "error": "worker process died"}
+            self._replace_pool(pool)
+        elif future.exception() is not None:
+            # The worker process died (process_file itself never raises)
+            record.entry = {"status": "error", "error": f"{type(future.exception()).__name__}: {future.exception()}"}
+        else:
+            record.entry = future.result()
+            operation_metrics.merge(record.entry.pop("metrics", []))
+        record.finished = time.time()
+        for input_path in input_paths:
+            _remove(input_path)
+        self.release()
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def delete(self, job_id):
+        """Cancel a queued job and forget it; a running one is dropped once it finishes"""
+        with self._lock:
+            record = self.jobs.pop(job_id, None)
+        if record is None:
+            return False
+        if record.future.cancel() or record.future.done():
+            shutil.rmtree(record.dir, ignore_errors=True)
+        else:
+            record.future.add_done_callback(lambda _: shutil.rmtree(record.dir, ignore_errors=True))
+        return True
+
+    def active(self):
+        with self._lock:
+            return sum(1 for record in self.jobs.values() if record.entry is None)
+
+    def _expire(self):
+        """Forget finished jobs older than the TTL, with their results"""
+        cutoff = time.time() - self.job_ttl
+        with self._lock:
+            expired = [job_id for job_id, record in self.jobs.items()
+                       if record.finished is not None and record.finished < cutoff]
+        for job_id in expired:
+            self.delete(job_id)
+
+    def shutdown(self):
+        self.pool.shutdown(cancel_futures=True)
+        if self._own_spool:
+            shutil.rmtree(self.spool_dir, ignore_errors=True)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class _MultipartReader:
+    """Reads a multipart body from a file in chunks, one part at a time"""
+
+    def __init__(self, body_file, boundary):
+        self.body_file = body_file
+        self.delimiter = b"\r\n--" + boundary
+        # The first delimiter usually opens the body, with no line break before it
+        self.buffer = b"\r\n"
+
+    def _fill(self):
+        chunk = self.body_file.read(CHUNK_SIZE)
+        self.buffer += chunk
+        return bool(chunk)
+
+    def copy_part(self, output=None):
+        """Copy the body up to the next delimiter to output (or drop it), then skip it; False if there is none"""
+        keep = len(self.delimiter) - 1
+        while True:
+            end = self.buffer.find(self.delimiter)
+            if end >= 0:
+                if output is not None:
+                    output.write(self.buffer[:end])
+                self.buffer = self.buffer[end + len(self.delimiter):]
+                return True
+            # Hold back what could be the start of a delimiter split across chunks
+            if len(self.buffer) > keep:
+                if output is not None:
+                    output.write(self.buffer[:-keep])
+                self.buffer = self.buffer[-keep:]
+            if not self._fill():
+                return False
+
+    def read_headers(self):
+        """Headers of the part after the delimiter just skipped, or None after the closing one"""
+        while True:
+            if self.buffer.startswith(b"--"):
+                return None
+            # The delimiter line ends first (after optional padding), then the headers
+            line_end = self.buffer.find(b"\r\n")
+            headers_end = self.buffer.find(b"\r\n\r\n", line_end) if line_end >= 0 else -1
+            if headers_end >= 0:
+                break
+            if len(self.buffer) > MAX_PART_HEADER_BYTES:
+                raise ValueError("Multipart part headers too long")
+            if not self._fill():
+                raise ValueError("Multipart body ended early")
+        headers = self.buffer[line_end + 2:headers_end + 2]
+        self.buffer = self.buffer[headers_end + 4:]
+        return BytesParser(policy=HTTP).parsebytes(headers + b"\r\n", headersonly=True)
+
+
+def _multipart_files(body_path, content_type, job_dir):
+    """Write each file of a multipart/form-data body to job_dir, in form order; returns their paths"""
+    header = f"Content-Type: {content_type}\r\n\r\n".encode()
+    boundary = BytesParser(policy=HTTP).parsebytes(header, headersonly=True).get_boundary()
+    if not boundary:
+        raise ValueError("Multipart body without a boundary")
+    input_paths = []
+    with open(body_path, "rb") as body_file:
+        reader = _MultipartReader(body_file, boundary.encode("latin-1"))
+        if not reader.copy_part():
+            raise ValueError("No parts in the multipart body")
+        while True:
+            headers = reader.read_headers()
+            if headers is None:
+                break
+            if headers.get("Content-Transfer-Encoding", "binary").lower() not in ("binary", "8bit", "7bit"):
+                raise ValueError(f"Unsupported Content-Transfer-Encoding: {headers['Content-Transfer-Encoding']}")
+            if headers.get_filename() is None:
+                found = reader.copy_part()
+            else:
+                input_path = os.path.join(job_dir, f"input_{len(input_paths)}.pdf")
+                with open(input_path, "wb") as input_file:
+                    found = reader.copy_part(input_file)
+                input_paths.append(input_path)
+            if not found:
+                raise ValueError("Multipart body ended early")
+    return input_paths
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """Routes requests to the server's JobService"""
+
+    server_version = "pdfeditor"
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == "/health":
+            self._send_json(HTTPStatus.OK, {"workers": self.service.workers, "active": self.service.active(),
+                                            "max_jobs": self.service.max_jobs})
+            return
+        if path == "/metrics":
+            body = operation_metrics.prometheus_text().encode()
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        match = re.fullmatch(r"/jobs/([0-9a-f]+)(/result)?", path)
+        record = self.service.get(match.group(1)) if match else None
+        if record is None:
+            self._send_error(HTTPStatus.NOT_FOUND, "No such job")
+        elif not match.group(2):
+            self._send_json(HTTPStatus.OK, record.describe())
+        elif record.status != "done":
+            self._send_json(HTTPStatus.CONFLICT, record.describe())
+        else:
+            self._send_file(record.output_path, record.media_type, f"{record.job['op']}_{record.id[:8]}")
+
+    def do_DELETE(self):
+        match = re.fullmatch(r"/jobs/([0-9a-f]+)", urlsplit(self.path).path)
+        if match and self.service.delete(match.group(1)):
+            self._send_json(HTTPStatus.OK, {"id": match.group(1), "deleted": True})
+        else:
+            self._send_error(HTTPStatus.NOT_FOUND, "No such job")
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        match = re.fullmatch(r"/jobs/(\w+)", url.path)
+        if not match or match.group(1) not in PARAMETERS:
+            self._send_error(HTTPStatus.NOT_FOUND, f"Unknown operation, expected one of: {', '.join(PARAMETERS)}")
+            return
+        try:
+            job = parse_job(match.group(1), parse_qs(url.query))
+        except ValueError as e:
+            self._send_error(HTTPStatus.BAD_REQUEST, str(e))
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            self._send_error(HTTPStatus.LENGTH_REQUIRED, "Send the PDF as the request body")
+            return
+        if length > self.server.max_upload_bytes:
+            self._send_error(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Upload too large")
+            return
+        if not self.service.reserve():
+            self._discard_body(length)
+            self._send_error(HTTPStatus.TOO_MANY_REQUESTS, "Job queue is full, retry later", {"Retry-After": "1"})
+            return
+
+        job_dir = self.service.spool_path()
+        try:
+            input_paths = self._spool_body(length, job_dir)
+            if len(input_paths) != 1 and job["op"] != "merge":
+                raise ValueError(f"{job['op']} takes one PDF, got {len(input_paths)}")
+            if not input_paths:
+                raise ValueError("No PDF in the request")
+        except (ValueError, OSError) as e:
+            self.service.release()
+            shutil.rmtree(job_dir, ignore_errors=True)
+            self._send_error(HTTPStatus.BAD_REQUEST, str(e))
+            return
+        try:
+            record = self.service.submit(job, job_dir, input_paths)
+        except BrokenProcessPool:
+            self.service.release()
+            shutil.rmtree(job_dir, ignore_errors=True)
+            self._send_error(HTTPStatus.SERVICE_UNAVAILABLE, "Worker pool restarted, retry", {"Retry-After": "1"})
+            return
+        self._send_json(HTTPStatus.ACCEPTED, dict(record.describe(), status_url=f"/jobs/{record.id}",
+                                                  result_url=f"/jobs/{record.id}/result"),
+                        {"Location": f"/jobs/{record.id}"})
+
+    def _discard_body(self, length):
+        while length:
+            chunk = self.rfile.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+
+    def _spool_body(self, length, job_dir):
+        """Copy the request body into job_dir; returns the input file paths"""
+        body_path = os.path.join(job_dir, "upload")
+        with open(body_path, "wb") as body_file:
+            remaining = length
+            while remaining:
+                chunk = self.rfile.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise ValueError("Request body ended early")
+                body_file.write(chunk)
+                remaining -= len(chunk)
+
+        content_type = self.headers.get("Content-Type", "")
+        if not content_type.startswith("multipart/form-data"):
+            return [body_path]
+
+        # One input per uploaded file, split out of the spooled body
+        # without loading it
+        input_paths = _multipart_files(body_path, content_type, job_dir)
+        _remove(body_path)
+        return input_paths
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message, headers=None):
+        self._send_json(status, {"error": message}, headers)
+
+    def _send_file(self, path, media_type, name):
+        """Stream a result in chunks rather than loading it whole"""
+        extension = os.path.splitext(path)[1]
+        with open(path, "rb") as result_file:
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", media_type)
+            self.send_header("Content-Length", str(os.fstat(result_file.fileno()).st_size))
+            self.send_header("Content-Disposition", f'attachment; filename="{name}{extension}"')
+            self.end_headers()
+            shutil.copyfileobj(result_file, self.wfile, CHUNK_SIZE)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def make_server(host="127.0.0.1", port=8080, service=None, max_upload_bytes=DEFAULT_MAX_UPLOAD_BYTES, verbose=True):
+    """HTTP server bound to host:port, serving a JobService"""
+    server = ThreadingHTTPServer((host, port), JobRequestHandler)
+    server.daemon_threads = True
+    server.service = service or JobService()
+    server.max_upload_bytes = max_upload_bytes
+    server.verbose = verbose
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--max-jobs", type=int, help="jobs queued or running before submissions get 429 "
+                                                     "(default 4 per worker)")
+    parser.add_argument("--spool", help="directory for uploads and results (default a new temporary one)")
+    parser.add_argument("--job-ttl", type=int, default=3600, help="seconds finished jobs are kept")
+    args = parser.parse_args(argv)
+
+    if args.spool:
+        os.makedirs(args.spool, exist_ok=True)
+    service = JobService(args.workers, args.max_jobs, args.spool, args.job_ttl)
+    server = make_server(args.host, args.port, service)
+    print(f"Serving on http://{args.host}:{server.server_port} with {service.workers} workers, "
+          f"up to {service.max_jobs} jobs")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+if __name__ == "__main__":
+    main()
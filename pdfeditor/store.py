@@ -0,0 +1,307 @@
+"""
+Per-session document storage with a memory budget, shared by content.
+
+The apps used to keep every upload and working copy as bytes in session
+state, so memory grew with users times document size. Here each session's
+documents are StoredPDF handles: their .data is the bytes while they fit
+the budgets, or a read-only memory map of a spool file once spilled, which
+fitz and PyPDF2 read without loading it and the OS can page out.
+
+Storage is content-addressed: handles whose documents have the same
+SHA-256 share one stored copy, so fifty sessions on the same standard form
+hold it once. Since parsed documents, text indexes and renders are cached
+process-wide under the same hash (cache.py, textindex.py, render.py),
+those are shared too. A copy lives as long as some handle refers to it;
+when the last one is dropped (a new version, a trimmed undo step, a
+session ending) its memory is freed and its spool file removed. A
+document that is the start of another stored one (the version before an
+incremental save) can be stored as a view of it, taking no space.
+
+- documents of at least spill_bytes go straight to disk
+- a session holding more than session_bytes in memory spills its least
+  recently used documents
+- past max_bytes of distinct documents in memory, the least recently
+  used spill first
+- documents used only by sessions idle for idle_seconds are spilled
+"""
+import atexit
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import time
+import weakref
+
+from pdfeditor.cache import doc_hash
+
+DEFAULT_STORE_BYTES = int(os.environ.get("PDFEDITOR_STORE_MB", "1024")) * 1024 * 1024
+DEFAULT_SESSION_BYTES = int(os.environ.get("PDFEDITOR_SESSION_MB", "256")) * 1024 * 1024
+DEFAULT_SPILL_BYTES = int(os.environ.get("PDFEDITOR_SPILL_MB", "32")) * 1024 * 1024
+DEFAULT_IDLE_SECONDS = int(os.environ.get("PDFEDITOR_SESSION_IDLE_S", "600"))
+
+
+class _Blob:
+    """The one stored copy of a distinct document"""
+
+    def __init__(self, key, data):
+        self.key = key
+        self.size = len(data)
+        self.data = data
+        self.path = None
+        self.last_used = time.monotonic()
+
+    @property
+    def owner(self):
+        """The blob holding the memory or spool file"""
+        return self
+
+    def map(self, path):
+        with open(path, "rb") as spool_file:
+            self.data = memoryview(mmap.mmap(spool_file.fileno(), 0, access=mmap.ACCESS_READ))
+        self.path = path
+        # The mapping itself goes with the last view of it
+        weakref.finalize(self, _remove, path)
+
+
+class _Prefix(_Blob):
+    """
+    A document that is the start of another stored one, e.g. a version
+    before an incremental save. It reads the parent's memory or spool
+    file, so it takes no space of its own and goes wherever the parent
+    is spilled to.
+    """
+
+    def __init__(self, key, parent, size):
+        self.key = key
+        self.size = size
+        self.parent = parent
+
+    @property
+    def data(self):
+        return memoryview(self.parent.data)[:self.size]
+
+    @property
+    def path(self):
+        return self.parent.path
+
+    @property
+    def last_used(self):
+        return self.parent.last_used
+
+    @last_used.setter
+    def last_used(self, value):
+        self.parent.last_used = value
+
+    @property
+    def owner(self):
+        return self.parent
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        # Still mapped elsewhere on Windows; the spool directory goes at exit
+        pass
+
+
+class StoredPDF:
+    """
+    A session's reference to a stored document.
+
+    .data is bytes or a read-only memoryview of a spool file; .key is its
+    doc_hash(), so callers never need to hash it again.
+    """
+
+    def __init__(self, store, session_id, blob):
+        self.store = store
+        self.session_id = session_id
+        self._blob = blob
+
+    @property
+    def data(self):
+        self._blob.last_used = time.monotonic()
+        return self._blob.data
+
+    @property
+    def key(self):
+        return self._blob.key
+
+    @property
+    def size(self):
+        return self._blob.size
+
+    @property
+    def spilled(self):
+        return self._blob.path is not None
+
+    @property
+    def path(self):
+        """Spool file holding exactly .data, or None (in memory, or the start of a longer file)"""
+        if self._blob.owner is self._blob:
+            return self._blob.path
+        return None
+
+    def derive(self, data, key=None):
+        """Store another version of this document in the same session"""
+        return self.store.put(self.session_id, data, key)
+
+    def prefix(self, size, key):
+        """The first size bytes of this document, whose doc_hash() is key, as another version sharing its storage"""
+        return self.store.prefix(self, size, key)
+
+    def __len__(self):
+        return self._blob.size
+
+
+class _Session:
+    def __init__(self):
+        self.last_used = time.monotonic()
+        self.documents = weakref.WeakSet()
+
+    def blobs(self):
+        return {document._blob.owner for document in self.documents}
+
+
+class DocumentStore:
+    """Documents of all sessions served by this process, see the module docstring"""
+
+    def __init__(self, max_bytes=DEFAULT_STORE_BYTES, session_bytes=DEFAULT_SESSION_BYTES,
+                 spill_bytes=DEFAULT_SPILL_BYTES, idle_seconds=DEFAULT_IDLE_SECONDS, spool_dir=None):
+        self.max_bytes = max_bytes
+        self.session_bytes = session_bytes
+        self.spill_bytes = spill_bytes
+        self.idle_seconds = idle_seconds
+        self._spool_dir = spool_dir
+        self._sessions = {}
+        # Handles hold their blob, so a blob leaves this mapping when
+        # the last handle referring to it is dropped
+        self._blobs = weakref.WeakValueDictionary()
+        self._lock = threading.RLock()
+
+    @property
+    def spool_dir(self):
+        if self._spool_dir is None:
+            self._spool_dir = tempfile.mkdtemp(prefix="pdfeditor-store-")
+            atexit.register(shutil.rmtree, self._spool_dir, ignore_errors=True)
+        return self._spool_dir
+
+    def put(self, session_id, data, key=None):
+        """
+        Store PDF data for a session and return its StoredPDF.
+
+        data can be any bytes-like object, e.g. an upload's getbuffer(). A
+        document already in the store is shared rather than stored again,
+        and one that goes straight to disk is written from data without an
+        in-memory copy. key is data's doc_hash() where the caller already
+        knows it.
+        """
+        if key is None:
+            key = doc_hash(data)
+        with self._lock:
+            blob = self._blobs.get(key)
+            if blob is None:
+                blob = _Blob(key, data)
+                if blob.size and blob.size >= self.spill_bytes:
+                    self._spill(blob)
+                elif not isinstance(data, bytes):
+                    blob.data = bytes(data)
+                self._blobs[key] = blob
+            return self._add(session_id, blob)
+
+    def get(self, session_id, key):
+        """A StoredPDF for the document with doc_hash() key if the store still holds it, else None"""
+        with self._lock:
+            blob = self._blobs.get(key)
+            return None if blob is None else self._add(session_id, blob)
+
+    def prefix(self, document, size, key):
+        """
+        StoredPDF of the first size bytes of document, whose doc_hash() is
+        key, in the same session. Neither copied nor hashed: it shares the
+        document's memory or spool file.
+        """
+        with self._lock:
+            blob = self._blobs.get(key)
+            if blob is None:
+                blob = _Prefix(key, document._blob.owner, size)
+                self._blobs[key] = blob
+            return self._add(document.session_id, blob)
+
+    def _add(self, session_id, blob):
+        blob.last_used = time.monotonic()
+        document = StoredPDF(self, session_id, blob)
+        session = self._sessions.setdefault(session_id, _Session())
+        session.documents.add(document)
+        session.last_used = time.monotonic()
+        self._enforce(session_id)
+        return document
+
+    def touch(self, session_id):
+        """Mark a session active (call once per app run); spills documents of sessions gone idle"""
+        with self._lock:
+            session = self._sessions.setdefault(session_id, _Session())
+            session.last_used = time.monotonic()
+            self._enforce(session_id)
+
+    def stats(self):
+        """
+        {"sessions", "documents", "unique", "memory_bytes", "disk_bytes",
+        "shared_bytes"} across the store; shared_bytes is what storing
+        each session's documents separately would have added.
+        """
+        with self._lock:
+            documents = [document for session in self._sessions.values() for document in session.documents]
+            blobs = list(self._blobs.values())
+        owners = {blob.owner for blob in blobs}
+        return {
+            "sessions": len(self._sessions),
+            "documents": len(documents),
+            "unique": len(blobs),
+            "memory_bytes": sum(blob.size for blob in owners if blob.path is None),
+            "disk_bytes": sum(blob.size for blob in owners if blob.path is not None),
+            "shared_bytes": sum(document.size for document in documents) - sum(blob.size for blob in owners),
+        }
+
+    def _spill(self, blob):
+        handle, path = tempfile.mkstemp(suffix=".pdf", dir=self.spool_dir)
+        with os.fdopen(handle, "wb") as spool_file:
+            spool_file.write(blob.data)
+        blob.map(path)
+
+    def _enforce(self, session_id):
+        """Spill documents until every budget holds, then forget sessions with none left"""
+        now = time.monotonic()
+        active = set()
+        idle = set()
+        for other_id, session in list(self._sessions.items()):
+            if not session.documents and other_id != session_id:
+                del self._sessions[other_id]
+            elif other_id == session_id or now - session.last_used <= self.idle_seconds:
+                active |= session.blobs()
+            else:
+                idle |= session.blobs()
+        for blob in idle - active:
+            if blob.path is None:
+                self._spill(blob)
+
+        in_memory = sorted((blob for blob in self._sessions[session_id].blobs() if blob.path is None and blob.size),
+                           key=lambda blob: blob.last_used)
+        total = sum(blob.size for blob in in_memory)
+        while total > self.session_bytes:
+            blob = in_memory.pop(0)
+            self._spill(blob)
+            total -= blob.size
+
+        owners = {blob.owner for blob in self._blobs.values()}
+        in_memory = sorted((blob for blob in owners if blob.path is None and blob.size),
+                           key=lambda blob: blob.last_used)
+        total = sum(blob.size for blob in in_memory)
+        while total > self.max_bytes:
+            blob = in_memory.pop(0)
+            self._spill(blob)
+            total -= blob.size
+
+
+document_store = DocumentStore()
@@ -0,0 +1,225 @@
+"""
+Multi-term text matching.
+
+A list of search terms is compiled once into an Aho-Corasick automaton
+(plus a regular expression per regex term), which finds every term in a
+single pass over a page's text instead of one search_for() call per term.
+Page text is the extracted words (or characters) with whitespace runs
+collapsed to single spaces, so terms match across line breaks as typed.
+"""
+import re
+from bisect import bisect_right
+from collections import defaultdict, deque, namedtuple
+from functools import lru_cache
+
+import fitz  # PyMuPDF
+
+from pdfeditor.metrics import count_pages, instrumented
+
+
+# rects: one per line the match spans; font_size and origin (baseline
+# start point) are those of the match's first character
+Match = namedtuple("Match", "index rects font_size origin")
+
+
+def term(text, color=None, case_sensitive=False, whole_word=False, regex=False):
+    """One search term; color is an RGB tuple used when highlighting"""
+    return {"text": text, "color": tuple(color) if color else None,
+            "case_sensitive": case_sensitive, "whole_word": whole_word, "regex": regex}
+
+
+def fold_case(text):
+    """Lowercase text without changing its length, so match offsets still line up"""
+    folded = text.lower()
+    if len(folded) == len(text):
+        return folded
+    return "".join(char.lower() if len(char.lower()) == 1 else char for char in text)
+
+
+class AhoCorasick:
+    """Finds every occurrence of a set of strings in one pass over a text"""
+
+    def __init__(self, patterns):
+        self.lengths = [len(pattern) for pattern in patterns]
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+        for index, pattern in enumerate(patterns):
+            if not pattern:
+                continue
+            node = 0
+            for char in pattern:
+                child = self.goto[node].get(char)
+                if child is None:
+                    child = len(self.goto)
+                    self.goto[node][char] = child
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                node = child
+            self.out[node].append(index)
+
+        # Breadth-first, so a node's failure link is set before its children's
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fail = self.fail[node]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[child] = self.goto[fail].get(char, 0)
+                self.out[child] = self.out[child] + self.out[self.fail[child]]
+
+    def finditer(self, text):
+        """Yield (pattern index, start, end) for every occurrence, overlaps included"""
+        goto, fail, out, lengths = self.goto, self.fail, self.out, self.lengths
+        node = 0
+        for pos, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for index in out[node]:
+                yield index, pos + 1 - lengths[index], pos + 1
+
+
+class TermMatcher:
+    """All matches of a term list in a text: one automaton per case mode, plus regexes"""
+
+    def __init__(self, terms):
+        self.terms = terms
+        # (automaton, term indexes, whether it matches case-folded text)
+        self._automata = []
+        for fold in (True, False):
+            indexes = [i for i, t in enumerate(terms) if not t["regex"] and t["case_sensitive"] != fold]
+            patterns = [" ".join(terms[i]["text"].split()) for i in indexes]
+            if indexes:
+                self._automata.append((AhoCorasick([fold_case(p) for p in patterns] if fold else patterns), indexes, fold))
+        # Raises re.error for an invalid pattern
+        self._regexes = [(i, re.compile(t["text"], 0 if t["case_sensitive"] else re.IGNORECASE))
+                         for i, t in enumerate(terms) if t["regex"]]
+
+    def finditer(self, text):
+        """Yield (term index, start, end) for every match in text"""
+        for automaton, indexes, fold in self._automata:
+            for k, start, end in automaton.finditer(fold_case(text) if fold else text):
+                if self._accept(indexes[k], text, start, end):
+                    yield indexes[k], start, end
+        for index, pattern in self._regexes:
+            for match in pattern.finditer(text):
+                start, end = match.span()
+                if start < end and self._accept(index, text, start, end):
+                    yield index, start, end
+
+    def search(self, text):
+        """Whether any term occurs in text"""
+        return next(self.finditer(text), None) is not None
+
+    def _accept(self, index, text, start, end):
+        if not self.terms[index]["whole_word"]:
+            return True
+        return ((start == 0 or not text[start - 1].isalnum())
+                and (end == len(text) or not text[end].isalnum()))
+
+
+@lru_cache(maxsize=32)
+def _cached_matcher(terms_key):
+    return TermMatcher([dict(zip(("text", "case_sensitive", "whole_word", "regex"), t)) for t in terms_key])
+
+
+def get_matcher(terms):
+    """Compiled TermMatcher for a term list, reused while the same list is searched"""
+    return _cached_matcher(tuple((t["text"], t["case_sensitive"], t["whole_word"], t["regex"]) for t in terms))
+
+
+@instrumented("search")
+def page_chars(page):
+    """
+    Text of a fitz page with (box, line, font size, origin) for every character.
+
+    Whitespace runs, including line breaks, become a single space with no
+    details, matching the word text the text index keeps.
+    """
+    count_pages(1)
+    chars, details = [], []
+    line_num = 0
+    for block in page.get_text("rawdict", flags=fitz.TEXTFLAGS_WORDS)["blocks"]:
+        for line in block.get("lines", ()):
+            for span in line["spans"]:
+                for char in span["chars"]:
+                    if not char["c"].isspace():
+                        chars.append(char["c"])
+                        details.append((char["bbox"], line_num, span["size"], char["origin"]))
+                    elif chars and chars[-1] != " ":
+                        chars.append(" ")
+                        details.append(None)
+            if chars and chars[-1] != " ":
+                chars.append(" ")
+                details.append(None)
+            line_num += 1
+    return "".join(chars), details
+
+
+def longest_matches(matches):
+    """Leftmost-longest (term index, start, end) matches that do not overlap"""
+    kept = []
+    end_of_last = 0
+    for index, start, end in sorted(matches, key=lambda match: (match[1], -match[2])):
+        if start >= end_of_last:
+            kept.append((index, start, end))
+            end_of_last = end
+    return kept
+
+
+def page_matches(page, matcher, overlapping=True):
+    """
+    Yield a Match per match on a fitz page, with exact character boxes.
+
+    With overlapping=False only leftmost-longest matches are kept, so text
+    is claimed by at most one term.
+    """
+    text, details = page_chars(page)
+    matches = matcher.finditer(text)
+    if not overlapping:
+        matches = longest_matches(matches)
+    for index, start, end in matches:
+        chars = [detail for detail in details[start:end] if detail is not None]
+        if not chars:
+            continue
+        line_rects = defaultdict(fitz.Rect)
+        for bbox, line_num, _, _ in chars:
+            line_rects[line_num] |= bbox
+        yield Match(index, [line_rects[line] for line in sorted(line_rects)], chars[0][2], chars[0][3])
+
+
+def word_matches(words, matcher):
+    """
+    Yield (term index, rects) per match in a page's (x0, y0, x1, y1, word) boxes.
+
+    Matching runs over the words joined by single spaces. A match covering
+    part of a word gets that share of the word's width, which is close
+    enough to highlight with; page_matches() has exact character boxes.
+    """
+    starts = []
+    pos = 0
+    for word in words:
+        starts.append(pos)
+        pos += len(word[4]) + 1
+    text = " ".join(word[4] for word in words)
+    for index, start, end in matcher.finditer(text):
+        rects = []
+        i = bisect_right(starts, start) - 1
+        while i < len(words) and starts[i] < end:
+            x0, y0, x1, y1, word = words[i]
+            first, last = max(start - starts[i], 0), min(end - starts[i], len(word))
+            if first < last:
+                char_width = (x1 - x0) / len(word)
+                rect = fitz.Rect(x0 + first * char_width, y0, x0 + last * char_width, y1)
+                # Words on the same line share one rect
+                if rects and abs(rects[-1].y0 - y0) < 1 and abs(rects[-1].y1 - y1) < 1:
+                    rects[-1] |= rect
+                else:
+                    rects.append(rect)
+            i += 1
+        if rects:
+            yield index, rects
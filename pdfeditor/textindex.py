@@ -0,0 +1,212 @@
+"""
+Per-document text index for searches.
+
+page.search_for() lays out a page's text every time it is called, so
+searching every page for every new term costs a text extraction of the
+whole document. The index extracts each page's words (with bounding
+boxes) once and keeps an inverted token -> pages map, so a search only
+runs search_for() on the pages that can contain the term.
+
+Indexes are cached per document version and cover the pages searched so
+far: edits limited to a few pages only extract those. Word lists are
+cached per page text fingerprint, so after an edit only the pages whose
+text changed are extracted again.
+"""
+import hashlib
+import os
+import re
+from collections import defaultdict
+
+from pdfeditor.cache import LRUCache, doc_hash, document_cache
+from pdfeditor.metrics import count_pages, measure
+
+DEFAULT_TEXT_INDEX_CACHE_BYTES = int(os.environ.get("PDFEDITOR_TEXT_INDEX_CACHE_MB", "128")) * 1024 * 1024
+
+# Rough per-word overhead of a (x0, y0, x1, y1, word) tuple
+WORD_BYTES = 100
+
+text_index_cache = LRUCache(DEFAULT_TEXT_INDEX_CACHE_BYTES)
+
+REFERENCE = re.compile(r"\b(\d+) 0 R\b")
+
+
+class TextIndex:
+    """
+    Words of some pages of one document version, with a token -> pages map.
+
+    page_words maps 0-indexed pages to their words; pages left out are not
+    indexed and always count as candidates. Indexes are never changed once
+    built, as other threads may be searching them.
+    """
+
+    def __init__(self, page_count, page_words):
+        self.page_count = page_count
+        self.page_words = page_words
+        self.page_tokens = {page_num: [word[4].lower() for word in words] for page_num, words in page_words.items()}
+        self.joined_tokens = {page_num: _dehyphenate(tokens) for page_num, tokens in self.page_tokens.items()}
+        self.postings = defaultdict(set)
+        for page_num in page_words:
+            for token in set(self.page_tokens[page_num]) | set(self.joined_tokens[page_num]):
+                self.postings[token].add(page_num)
+        self.size = sum(2 * len(word[4]) + WORD_BYTES for words in page_words.values() for word in words)
+        self._lookups = {}
+        self._page_texts = {}
+
+    def __len__(self):
+        return len(self.page_words)
+
+    def __contains__(self, page_num):
+        return page_num in self.page_words
+
+    def words(self, page_num):
+        """(x0, y0, x1, y1, word) tuples of a 0-indexed page, in reading order"""
+        return self.page_words[page_num]
+
+    def page_text(self, page_num):
+        """Words of a 0-indexed page joined by single spaces"""
+        text = self._page_texts.get(page_num)
+        if text is None:
+            text = self._page_texts[page_num] = " ".join(word[4] for word in self.page_words[page_num])
+        return text
+
+    def pages_with_token(self, token):
+        """0-indexed pages with a word containing token (lowercase)"""
+        pages = self._lookups.get(token)
+        if pages is None:
+            # search_for() matches inside words too, so "ohn" must find "John,"
+            pages = set()
+            for word, word_pages in self.postings.items():
+                if token in word:
+                    pages |= word_pages
+            self._lookups[token] = pages
+        return pages
+
+    def candidate_pages(self, text, pages=None):
+        """
+        Sorted 0-indexed pages that may contain text.
+
+        Pages are looked up in the token map, then a phrase is checked
+        against the page's consecutive words: the first part must end a
+        word, middle parts must be whole words and the last part must start
+        a word. Matching ignores case, and search_for() joins a word ending
+        in a hyphen at a line end with the next one, so the words are also
+        tried joined that way. The result is a superset of the pages
+        search_for() finds text on; pages not indexed are always included.
+        pages limits the result (default: every page).
+        """
+        if pages is None:
+            pages = range(self.page_count)
+        tokens = text.lower().split()
+        if not tokens:
+            return []
+        found = set.intersection(*(self.pages_with_token(token) for token in tokens)) & set(pages)
+        if len(tokens) > 1:
+            found = {page_num for page_num in found if self._has_phrase(page_num, tokens)}
+        found |= {page_num for page_num in pages if page_num not in self.page_words}
+        return sorted(found)
+
+    def _has_phrase(self, page_num, tokens):
+        words, joined = self.page_tokens[page_num], self.joined_tokens[page_num]
+        return _has_phrase(words, tokens) or (joined is not words and _has_phrase(joined, tokens))
+
+
+def _has_phrase(words, tokens):
+    first, middle, last = tokens[0], tokens[1:-1], tokens[-1]
+    for start in range(len(words) - len(tokens) + 1):
+        end = start + len(tokens) - 1
+        if (words[start].endswith(first) and words[end].startswith(last)
+                and words[start + 1:end] == middle):
+            return True
+    return False
+
+
+def _dehyphenate(tokens):
+    """tokens with each one ending in a hyphen joined to the next; tokens itself if there are none"""
+    if not any(token.endswith("-") for token in tokens):
+        return tokens
+    joined = []
+    for token in tokens:
+        if joined and joined[-1].endswith("-"):
+            joined[-1] = joined[-1][:-1] + token
+        else:
+            joined.append(token)
+    return joined
+
+
+def text_fingerprint(page, digests=None):
+    """
+    Digest of what determines a fitz page's text: its geometry, contents and
+    everything its resources reach (form XObjects and their resources,
+    fonts with their files and ToUnicode maps).
+
+    Word lists are shared process-wide under it, so identical-looking
+    resources of two documents must not collide. Objects are digested by
+    content rather than number, so a page keeps its fingerprint in later
+    versions. digests memoizes object digests across pages of a document
+    that is not changed in between.
+    """
+    pdf_document = page.parent
+    digests = {} if digests is None else digests
+    digest = hashlib.sha256()
+    digest.update(f"{tuple(page.rect)} {page.rotation}".encode())
+    digest.update(page.read_contents())
+    kind, value = pdf_document.xref_get_key(page.xref, "Resources")
+    digest.update(_resolve(pdf_document, value, digests).encode())
+    return digest.hexdigest()
+
+
+def _resolve(pdf_document, source, digests):
+    """PDF object source with each reference replaced by its object's digest"""
+    return REFERENCE.sub(lambda match: _object_digest(pdf_document, int(match.group(1)), digests), source)
+
+
+def _object_digest(pdf_document, xref, digests):
+    digest = digests.get(xref)
+    if digest is None:
+        # A reference back to an object being digested stays a number
+        digests[xref] = f"{xref} 0 R"
+        hasher = hashlib.sha256(_resolve(pdf_document, pdf_document.xref_object(xref, compressed=True), digests).encode())
+        if pdf_document.xref_is_stream(xref):
+            hasher.update(pdf_document.xref_stream_raw(xref))
+        digest = digests[xref] = hasher.hexdigest()
+    return digest
+
+
+def page_words(page, digests=None):
+    """Word boxes of a fitz page, reusing an earlier extraction of the same text, see text_fingerprint()"""
+    cache_key = ("words", text_fingerprint(page, digests))
+    words = text_index_cache.get(cache_key)
+    if words is None:
+        with measure("search", "page_words"):
+            words = [tuple(word[:5]) for word in page.get_text("words")]
+            count_pages(1)
+        text_index_cache.put(cache_key, words, sum(len(word[4]) + WORD_BYTES for word in words))
+    return words
+
+
+def get_text_index(pdf_bytes, key=None, pages=None):
+    """
+    Text index of a document covering at least the given 0-indexed pages
+    (default: all), extending the cached one when it lacks some.
+    """
+    key = key or doc_hash(pdf_bytes)
+    index = text_index_cache.get(("index", key))
+    if index is not None and not _unindexed(index, index.page_count, pages):
+        return index
+    with measure("search", "text_index"), document_cache.fitz_document(pdf_bytes, key) as pdf_document:
+        page_count = pdf_document.page_count
+        missing = _unindexed(index, page_count, pages)
+        indexed = dict(index.page_words) if index is not None else {}
+        digests = {}
+        for page_num in missing:
+            indexed[page_num] = page_words(pdf_document[page_num], digests)
+        count_pages(len(missing))
+        index = TextIndex(page_count, indexed)
+    text_index_cache.put(("index", key), index, index.size)
+    return index
+
+
+def _unindexed(index, page_count, pages):
+    """Pages of a page_count-page document among pages (default: all) that index, if any, lacks"""
+    wanted = range(page_count) if pages is None else sorted(set(pages))
+    return [page_num for page_num in wanted if 0 <= page_num < page_count and (index is None or page_num not in index)]
@@ -0,0 +1,74 @@
+import threading
+
+import fitz  # PyMuPDF
+
+from pdfeditor import cache
+from pdfeditor.cache import DocumentCache, doc_hash
+
+
+def _pdf(text):
+    pdf_document = fitz.open()
+    pdf_document.new_page().insert_text((72, 72), text)
+    return pdf_document.tobytes()
+
+
+def _slow_opener(started, release, opened):
+    def opener(pdf_bytes):
+        opened.append(pdf_bytes)
+        started.set()
+        assert release.wait(10)
+        return fitz.open("pdf", pdf_bytes)
+    return opener
+
+
+def test_parse_does_not_hold_up_other_documents():
+    document_cache = DocumentCache()
+    first, second = _pdf("first"), _pdf("second")
+    document_cache.page_count(second)
+    started, release = threading.Event(), threading.Event()
+    parsing = threading.Thread(target=document_cache._handle,
+                               args=("fitz", first, _slow_opener(started, release, []), None))
+    parsing.start()
+    assert started.wait(10)
+
+    lookup = threading.Thread(target=document_cache.page_count, args=(second,))
+    lookup.start()
+    lookup.join(5)
+    finished = not lookup.is_alive()
+    release.set()
+    parsing.join()
+    assert finished
+
+
+def test_document_is_parsed_once_for_concurrent_callers():
+    document_cache = DocumentCache()
+    pdf_bytes = _pdf("shared")
+    started, release, opened = threading.Event(), threading.Event(), []
+    opener = _slow_opener(started, release, opened)
+    handles = []
+    threads = [threading.Thread(target=lambda: handles.append(document_cache._handle("fitz", pdf_bytes, opener, None)))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    assert started.wait(10)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(opened) == 1
+    assert len(handles) == 4 and all(handle is handles[0] for handle in handles)
+
+
+def test_checkout_takes_a_known_key(monkeypatch):
+    document_cache = DocumentCache()
+    pdf_bytes = _pdf("known")
+    key = doc_hash(pdf_bytes)
+    with document_cache.fitz_document(pdf_bytes, key) as cached:
+        pass
+    monkeypatch.setattr(cache, "doc_hash", _no_hash)
+
+    assert document_cache.checkout(pdf_bytes, key) is cached
+
+
+def _no_hash(pdf_bytes):
+    raise AssertionError("hashed a document whose key was given")
@@ -0,0 +1,43 @@
+import io
+import json
+import os
+
+import fitz  # PyMuPDF
+import pytest
+
+from pdfeditor.cli import run_batch
+
+
+def _write_pdf(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pdf_document = fitz.open()
+    pdf_document.new_page().insert_text((72, 72), "Hello")
+    pdf_document.save(path)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_colliding_inputs_write_nothing(tmp_path, workers):
+    for name in ("a.pdf", "b.pdf", "c.pdf"):
+        _write_pdf(str(tmp_path / "first" / name))
+    _write_pdf(str(tmp_path / "second" / "c.pdf"))
+    output_dir, manifest_path = tmp_path / "out", tmp_path / "manifest.jsonl"
+    job = {"op": "rotate", "angle": 90, "pages": "all"}
+
+    with pytest.raises(ValueError, match="would both be written"):
+        run_batch(job, [str(tmp_path / "first"), str(tmp_path / "second")], str(output_dir), workers,
+                  str(manifest_path), io.StringIO())
+    assert not output_dir.exists() or not os.listdir(output_dir)
+    assert not manifest_path.exists() or not manifest_path.read_text()
+
+
+def test_batch_records_every_file(tmp_path):
+    for name in ("a.pdf", "b.pdf", "c.pdf"):
+        _write_pdf(str(tmp_path / "in" / name))
+    manifest_path = tmp_path / "manifest.jsonl"
+    job = {"op": "rotate", "angle": 90, "pages": "all"}
+
+    totals = run_batch(job, [str(tmp_path / "in")], str(tmp_path / "out"), 2, str(manifest_path), io.StringIO())
+
+    assert totals["ok"] == 3
+    entries = [json.loads(line) for line in manifest_path.read_text().splitlines()]
+    assert sorted(os.path.basename(entry["input"]) for entry in entries) == ["a.pdf", "b.pdf", "c.pdf"]
@@ -0,0 +1,45 @@
+import fitz  # PyMuPDF
+
+from pdfeditor.ops import merge_pdf_files
+
+
+def _image_pdf(path, color):
+    """One page with an image whose soft mask is the same in every file, and some text"""
+    width = height = 120
+    pixmap = fitz.Pixmap(fitz.csRGB, width, height, bytes(color) * (width * height), 0)
+    pixmap = fitz.Pixmap(pixmap, 1)
+    pixmap.set_alpha(bytes((x * 2) & 0xFF for x in range(width * height)))
+    pdf_document = fitz.open()
+    page = pdf_document.new_page()
+    page.insert_image(fitz.Rect(50, 50, 250, 250), pixmap=pixmap)
+    page.insert_text((50, 300), f"color {color}")
+    pdf_document.save(path)
+    pdf_document.close()
+    return str(path)
+
+
+def _renders(path):
+    with fitz.open(path) as pdf_document:
+        return [page.get_pixmap(dpi=50).samples for page in pdf_document]
+
+
+def test_dedupe_keeps_pages_intact(tmp_path):
+    inputs = [_image_pdf(tmp_path / "red.pdf", (255, 0, 0)), _image_pdf(tmp_path / "blue.pdf", (0, 0, 255)),
+              _image_pdf(tmp_path / "red2.pdf", (255, 0, 0))]
+    plain, shared = str(tmp_path / "plain.pdf"), str(tmp_path / "shared.pdf")
+    merge_pdf_files(inputs, plain, workers=1)
+    result = merge_pdf_files(inputs, shared, workers=1, dedupe=True)
+
+    assert result["dedupe"]["objects"] > 0
+    assert _renders(shared) == _renders(plain)
+
+
+def test_dedupe_report_compares_with_plain_rewrite(tmp_path):
+    inputs = [_image_pdf(tmp_path / "red.pdf", (255, 0, 0)), _image_pdf(tmp_path / "red2.pdf", (255, 0, 0))]
+    plain, shared = str(tmp_path / "plain.pdf"), str(tmp_path / "shared.pdf")
+    merge_pdf_files(inputs, plain, workers=1, profile="balanced")
+    report = merge_pdf_files(inputs, shared, workers=1, dedupe=True, profile="balanced")["dedupe"]
+
+    assert report["bytes_before"] == (tmp_path / "plain.pdf").stat().st_size
+    assert report["bytes_after"] == (tmp_path / "shared.pdf").stat().st_size
+    assert report["bytes_saved"] == report["bytes_before"] - report["bytes_after"] > 0
@@ -0,0 +1,42 @@
+import fitz  # PyMuPDF
+
+from pdfeditor.edits import add_text_edit, apply_edits, highlight_edit, highlight_terms_edit
+from pdfeditor.terms import term
+
+
+def _wrapped_pdf(text):
+    """A page that only shows another page as a form XObject, so its own contents are the same for any text"""
+    source = fitz.open()
+    source.new_page().insert_text((72, 72), text)
+    pdf_document = fitz.open()
+    pdf_document.new_page().show_pdf_page(fitz.Rect(0, 0, 595, 842), source, 0)
+    return pdf_document.tobytes()
+
+
+def _highlights(pdf_bytes):
+    with fitz.open("pdf", pdf_bytes) as pdf_document:
+        return [annot.rect for page in pdf_document for annot in page.annots()]
+
+
+def test_highlight_terms_uses_words_of_its_own_document():
+    first, second = _wrapped_pdf("alpha contract"), _wrapped_pdf("beta invoice")
+    contract, invoice = highlight_terms_edit([term("contract", (1, 1, 0))]), highlight_terms_edit([term("invoice", (0, 1, 1))])
+    assert apply_edits(first, [contract])[1][0]["count"] == 1
+
+    assert apply_edits(second, [contract])[1][0]["count"] == 0
+    pdf_bytes, reports = apply_edits(second, [invoice])
+    assert reports[0]["count"] == 1
+    rect, = _highlights(pdf_bytes)
+    assert rect.contains(fitz.open("pdf", second)[0].search_for("invoice")[0])
+
+
+def test_incremental_edits_append_to_the_input():
+    versions = [_wrapped_pdf("alpha contract")]
+    for edit in (highlight_edit("contract", (1, 1, 0)), add_text_edit(1, "Approved", 72, 200, 12, (0, 0, 0))):
+        versions.append(apply_edits(versions[-1], [edit], incremental=True)[0])
+
+    assert all(new.startswith(old) for old, new in zip(versions, versions[1:]))
+    with fitz.open("pdf", versions[-1]) as pdf_document:
+        assert not pdf_document.is_repaired
+        assert len(list(pdf_document[0].annots())) == 1
+        assert "Approved" in pdf_document[0].get_text()
@@ -0,0 +1,42 @@
+import fitz  # PyMuPDF
+
+from pdfeditor import render
+from pdfeditor.render import parallel_workers, render_pages, thumbnail_cache
+
+
+def _pdf(page_count):
+    pdf_document = fitz.open()
+    for page_num in range(page_count):
+        pdf_document.new_page().insert_text((72, 72), f"Page {page_num + 1}")
+    return pdf_document.tobytes()
+
+
+def test_parallel_workers_scale_with_pages_and_size():
+    assert parallel_workers(3, 10_000, 8) == 1
+    assert parallel_workers(16, 10_000, 8) == 4
+    assert parallel_workers(1000, 10_000, 8) == 8
+    assert parallel_workers(16, 50 * 1024 * 1024, 8) == 1
+    assert parallel_workers(1000, 10_000, 1) == 1
+
+
+def test_parallel_renders_reuse_one_copy_of_the_document(monkeypatch):
+    pdf_bytes = _pdf(12)
+    written = []
+    mkstemp = render.tempfile.mkstemp
+    monkeypatch.setattr(render.tempfile, "mkstemp", lambda **kwargs: written.append(1) or mkstemp(**kwargs))
+    serial = render_pages(pdf_bytes, range(12), workers=1)
+
+    for _ in range(2):
+        thumbnail_cache.clear()
+        assert render_pages(pdf_bytes, range(12), workers=2) == serial
+    assert len(written) == 1
+
+
+def test_parallel_render_reads_a_given_file(tmp_path, monkeypatch):
+    pdf_bytes = _pdf(12)
+    path = tmp_path / "spooled.pdf"
+    path.write_bytes(pdf_bytes)
+    monkeypatch.setattr(render.tempfile, "mkstemp", None)
+    thumbnail_cache.clear()
+
+    assert len(render_pages(pdf_bytes, range(12), workers=2, path=str(path))) == 12
@@ -0,0 +1,84 @@
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import fitz  # PyMuPDF
+import pytest
+
+from pdfeditor.service import JobService, make_server
+
+
+@pytest.fixture
+def server():
+    service = JobService(workers=1, max_jobs=2)
+    server = make_server(port=0, service=service, verbose=False)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    service.shutdown()
+
+
+def _call(server, method, path, data=None):
+    request = urllib.request.Request(f"http://127.0.0.1:{server.server_port}{path}", data=data, method=method)
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def _wait(server, job):
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        status, info = _call(server, "GET", job["status_url"])
+        if info["status"] in ("done", "error"):
+            return info
+        time.sleep(0.1)
+    raise AssertionError("job did not finish")
+
+
+def _pdf():
+    pdf_document = fitz.open()
+    pdf_document.new_page().insert_text((72, 72), "Hello")
+    return pdf_document.tobytes()
+
+
+def test_dead_worker_fails_its_job_and_pool_recovers(server):
+    service = server.service
+    status, job = _call(server, "POST", "/jobs/rotate?angle=90", _pdf())
+    assert status == 202
+    assert _wait(server, job)["status"] == "done"
+
+    # A worker killed between jobs breaks the pool under the next submission
+    pool = service.pool
+    for process in list(pool._processes.values()):
+        process.kill()
+        process.join()
+    while not pool._broken:
+        time.sleep(0.05)
+    assert _call(server, "POST", "/jobs/rotate?angle=90", _pdf())[0] == 503
+    assert service.pool is not pool
+    assert _call(server, "GET", "/health")[1]["active"] == 0
+
+    # Slots of the refused submission are back, so the queue takes more than max_jobs in turn
+    for _ in range(3):
+        status, job = _call(server, "POST", "/jobs/rotate?angle=90", _pdf())
+        assert status == 202
+        assert _wait(server, job)["status"] == "done"
+
+
+def test_jobs_of_a_dying_worker_fail(server):
+    service = server.service
+    status, job = _call(server, "POST", "/jobs/rotate?angle=90", _pdf())
+    assert status == 202
+    # Kill the worker while it starts up or runs the job
+    while not service.pool._processes:
+        time.sleep(0.01)
+    for process in list(service.pool._processes.values()):
+        os.kill(process.pid, 9)
+
+    assert _wait(server, job)["status"] == "error"
+    assert _call(server, "GET", "/health")[1]["active"] == 0
@@ -0,0 +1,28 @@
+import fitz  # PyMuPDF
+
+from pdfeditor.edits import apply_edits, highlight_edit
+from pdfeditor.textindex import get_text_index, text_fingerprint
+
+
+def _wrapped_pdf(text):
+    """A page that only shows another page as a form XObject, so its own contents are the same for any text"""
+    source = fitz.open()
+    source.new_page().insert_text((72, 72), text)
+    pdf_document = fitz.open()
+    pdf_document.new_page().show_pdf_page(fitz.Rect(0, 0, 595, 842), source, 0)
+    return pdf_document.tobytes()
+
+
+def test_fingerprint_covers_form_xobjects():
+    first, second = _wrapped_pdf("alpha contract"), _wrapped_pdf("beta invoice")
+
+    assert text_fingerprint(fitz.open("pdf", first)[0]) != text_fingerprint(fitz.open("pdf", second)[0])
+    assert text_fingerprint(fitz.open("pdf", first)[0]) == text_fingerprint(fitz.open("pdf", _wrapped_pdf("alpha contract"))[0])
+
+
+def test_index_of_one_document_is_not_reused_for_another():
+    first, second = _wrapped_pdf("alpha contract"), _wrapped_pdf("beta invoice")
+    apply_edits(first, [highlight_edit("contract", (1, 1, 0))])
+
+    assert get_text_index(second).candidate_pages("invoice") == [0]
+    assert apply_edits(second, [highlight_edit("invoice", (1, 1, 0))])[1][0]["count"] == 1